@@ -0,0 +1,286 @@
+import math
+
+import numpy
+
+from .errors import SourceDataError
+from .tiles import WORLD_SIZE, lonlat_to_world, world_to_lonlat
+from .utils import rgb_tuple_from_str
+
+
+SHAPES = ('hex', 'grid', 'quadkey')
+
+
+def _hex_bins(x, y, radius):
+    """Axial coordinates of pointy-top hexagons with circumradius <radius> containing x, y"""
+    q = (numpy.sqrt(3) / 3.0 * x - y / 3.0) / radius
+    r = (2.0 / 3.0 * y) / radius
+
+    # round cube coordinates, fixing the component with the largest rounding error
+    s = -q - r
+    rq, rr, rs = numpy.round(q), numpy.round(r), numpy.round(s)
+    dq, dr, ds = numpy.abs(rq - q), numpy.abs(rr - r), numpy.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = numpy.where(fix_q, -rr - rs, rq)
+    rr = numpy.where(fix_r, -rq - rs, rr)
+    return rq.astype(numpy.int64), rr.astype(numpy.int64)
+
+
+def _hex_ring(q, r, radius):
+    cx = radius * numpy.sqrt(3) * (q + r / 2.0)
+    cy = radius * 1.5 * r
+    angles = numpy.radians(30 + 60 * numpy.arange(7))
+    return cx + radius * numpy.cos(angles), cy + radius * numpy.sin(angles)
+
+
+def _quadkey(x, y, zoom):
+    digits = []
+    for z in range(zoom, 0, -1):
+        mask = 1 << (z - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return ''.join(digits)
+
+
+def bin_points(df, zoom, shape='hex', cell_size=16, lat='lat', lon='lon', properties=None,
+               geometry='polygon', precision=6):
+    """Aggregate points into hexagon, square grid or quadkey bins and return a
+    GeoJSON FeatureCollection with one feature per non-empty bin.
+
+    Every bin carries a `count` property, plus `<property>_sum` and
+    `<property>_mean` for each of <properties>. Polygon bins render with
+    ChoroplethViz; point bins (at the bin center) with HeatmapViz or CircleViz
+    weighted by `count`.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame with lat / lon columns
+    zoom: zoom level the bins are sized for, or a list of zoom levels
+    shape: 'hex', 'grid' or 'quadkey'; quadkey bins are the map tiles at <zoom>
+    cell_size: hexagon width or grid cell side in pixels at <zoom>
+    lat, lon: names of the latitude and longitude columns
+    properties: list of numeric columns to sum and average per bin
+    geometry: 'polygon' for bin outlines or 'point' for bin centers
+    precision: number of decimal places in output coordinates
+
+    Returns
+    -------
+    A FeatureCollection, or a dict of zoom level to FeatureCollection when a
+    list of zoom levels is given
+    """
+    if isinstance(zoom, (list, tuple)):
+        return dict((z, bin_points(df, z, shape=shape, cell_size=cell_size, lat=lat, lon=lon,
+                                   properties=properties, geometry=geometry, precision=precision))
+                    for z in zoom)
+
+    if shape not in SHAPES:
+        raise SourceDataError('bin shape must be one of {}'.format(', '.join(SHAPES)))
+    if geometry not in ('polygon', 'point'):
+        raise SourceDataError('bin geometry must be polygon or point')
+
+    properties = properties or []
+    if not len(df):
+        return {'type': 'FeatureCollection', 'features': []}
+    x, y = lonlat_to_world(numpy.asarray(df[lon], dtype=float), numpy.asarray(df[lat], dtype=float))
+
+    if shape == 'quadkey':
+        size = 1.0 / 2 ** zoom
+    else:
+        size = cell_size / float(WORLD_SIZE * 2 ** zoom)
+
+    if shape == 'hex':
+        # width of a pointy-top hexagon is sqrt(3) times its circumradius
+        radius = size / numpy.sqrt(3)
+        i, j = _hex_bins(x, y, radius)
+    else:
+        i = numpy.floor(x / size).astype(numpy.int64)
+        j = numpy.floor(y / size).astype(numpy.int64)
+
+    # unique bins and the bin of every point
+    i0, j0 = i.min(), j.min()
+    span = j.max() - j0 + 1
+    keys, inverse = numpy.unique((i - i0) * span + (j - j0), return_inverse=True)
+    bins = numpy.stack([keys // span + i0, keys % span + j0], axis=1)
+    counts = numpy.bincount(inverse, minlength=len(bins))
+    stats = {}
+    for prop in properties:
+        values = numpy.asarray(df[prop], dtype=float)
+        valid = ~numpy.isnan(values)
+        sums = numpy.bincount(inverse[valid], weights=values[valid], minlength=len(bins))
+        valid_counts = numpy.bincount(inverse[valid], minlength=len(bins))
+        stats[prop + '_sum'] = sums
+        stats[prop + '_mean'] = numpy.where(valid_counts > 0, sums / numpy.maximum(valid_counts, 1), numpy.nan)
+
+    features = []
+    for k, (bi, bj) in enumerate(bins):
+        if shape == 'hex':
+            ring_x, ring_y = _hex_ring(bi, bj, radius)
+        else:
+            ring_x = numpy.array([bi, bi + 1, bi + 1, bi, bi]) * size
+            ring_y = numpy.array([bj, bj, bj + 1, bj + 1, bj]) * size
+
+        ring_lon, ring_lat = world_to_lonlat(ring_x, ring_y)
+        if geometry == 'polygon':
+            # world y points south, so reverse to wind the exterior ring counterclockwise
+            coordinates = [[[round(float(a), precision), round(float(b), precision)]
+                            for a, b in zip(ring_lon[::-1], ring_lat[::-1])]]
+            geom = {'type': 'Polygon', 'coordinates': coordinates}
+        else:
+            center_lon, center_lat = world_to_lonlat(ring_x[:-1].mean(), ring_y[:-1].mean())
+            geom = {'type': 'Point', 'coordinates': [round(float(center_lon), precision),
+                                                     round(float(center_lat), precision)]}
+
+        props = {'count': int(counts[k])}
+        if shape == 'quadkey':
+            props['quadkey'] = _quadkey(int(bi), int(bj), zoom)
+        for name, values in stats.items():
+            props[name] = None if numpy.isnan(values[k]) else float(values[k])
+
+        features.append({'type': 'Feature', 'geometry': geom, 'properties': props})
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def bin_breaks(data, property, num_breaks=5, method='quantile'):
+    """Compute breaks of a numeric property over the features of an aggregated
+    FeatureCollection, for use with create_color_stops or create_radius_stops
+
+    Parameters
+    ----------
+    data: GeoJSON FeatureCollection, e.g. the output of bin_points
+    property: name of the feature property, e.g. 'count'
+    num_breaks: number of breaks
+    method: 'quantile' for breaks at equal shares of bins, 'linear' for evenly spaced breaks
+    """
+    values = numpy.array([f['properties'].get(property) for f in data['features']], dtype=float)
+    values = values[~numpy.isnan(values)]
+    if not len(values):
+        raise SourceDataError('no numeric values of {} to compute breaks from'.format(property))
+
+    if method == 'quantile':
+        breaks = numpy.percentile(values, numpy.linspace(0, 100, num_breaks))
+    elif method == 'linear':
+        breaks = numpy.linspace(values.min(), values.max(), num_breaks)
+    else:
+        raise ValueError('method must be quantile or linear')
+
+    # interpolate expressions need strictly ascending stops
+    breaks = numpy.unique(breaks)
+    return [float(b) for b in breaks]
+
+
+def kernel_density(df, bounds=None, zoom=None, bandwidth=15, lat='lat', lon='lon', weight=None, max_size=2048):
+    """Estimate a Gaussian kernel density surface of points on a Web Mercator
+    pixel grid, by binning points and smoothing the bins with an FFT convolution.
+
+    Returns (density, bounds): a float array with rows ordered north to south,
+    scaled to 0-1 like the heatmap-density of HeatmapViz, and its
+    (west, south, east, north) bounds.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame with lat / lon columns
+    bounds: (west, south, east, north) of the surface; defaults to the extent of the points
+    zoom: zoom level whose pixels the grid matches; defaults to the largest that fits in max_size
+    bandwidth: standard deviation of the kernel in pixels
+    lat, lon: names of the latitude and longitude columns
+    weight: optional numeric column weighting each point; points with a missing weight are dropped
+    max_size: maximum width or height of the grid in pixels
+
+    Without points the density is zero everywhere, so it needs bounds.
+    """
+    x, y = lonlat_to_world(numpy.asarray(df[lon], dtype=float), numpy.asarray(df[lat], dtype=float))
+    weights = None if weight is None else numpy.asarray(df[weight], dtype=float)
+
+    # points without coordinates or weight would spread NaN over the whole surface
+    valid = numpy.isfinite(x) & numpy.isfinite(y)
+    if weights is not None:
+        valid &= numpy.isfinite(weights)
+        weights = weights[valid]
+    x, y = x[valid], y[valid]
+
+    if bounds is None:
+        if not len(x):
+            raise SourceDataError('kernel density needs points or bounds')
+        x0, x1, y0, y1 = x.min(), x.max(), y.min(), y.max()
+    else:
+        (x0, x1), (y1, y0) = lonlat_to_world(numpy.array([bounds[0], bounds[2]], dtype=float),
+                                             numpy.array([bounds[1], bounds[3]], dtype=float))
+    extent = max(x1 - x0, y1 - y0, 1e-12)
+
+    if zoom is None:
+        # largest zoom whose pixel grid over the padded extent fits in max_size
+        zoom = math.floor(math.log(max(max_size - 6 * bandwidth, 1) / (extent * WORLD_SIZE), 2))
+    pixel = 1.0 / (WORLD_SIZE * 2 ** zoom)
+
+    # pad data-derived bounds so kernels at the edge are not clipped
+    if bounds is None:
+        pad = 3 * bandwidth * pixel
+        x0, x1, y0, y1 = x0 - pad, x1 + pad, y0 - pad, y1 + pad
+
+    width = int(min(max_size, max(1, math.ceil((x1 - x0) / pixel))))
+    height = int(min(max_size, max(1, math.ceil((y1 - y0) / pixel))))
+    x1, y1 = x0 + width * pixel, y0 + height * pixel
+
+    col = numpy.floor((x - x0) / pixel).astype(numpy.int64)
+    row = numpy.floor((y - y0) / pixel).astype(numpy.int64)
+    inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+
+    # pad the grid by the kernel reach so the circular convolution does not wrap around
+    reach = int(math.ceil(3 * bandwidth))
+    shape = (height + 2 * reach, width + 2 * reach)
+    grid = numpy.bincount((row[inside] + reach) * shape[1] + col[inside] + reach,
+                          weights=None if weights is None else weights[inside],
+                          minlength=shape[0] * shape[1]).reshape(shape)
+
+    # Gaussian transfer function applied in the frequency domain
+    fy = numpy.fft.fftfreq(shape[0])[:, None]
+    fx = numpy.fft.rfftfreq(shape[1])[None, :]
+    kernel = numpy.exp(-2 * numpy.pi ** 2 * bandwidth ** 2 * (fx ** 2 + fy ** 2))
+    density = numpy.fft.irfft2(numpy.fft.rfft2(grid) * kernel, s=shape)[reach:reach + height, reach:reach + width]
+
+    density = numpy.clip(density, 0, None)
+    if density.max() > 0:
+        density /= density.max()
+
+    (west, east), (north, south) = world_to_lonlat(numpy.array([x0, x1]), numpy.array([y0, y1]))
+    return density, (float(west), float(south), float(east), float(north))
+
+
+def color_density(density, color_stops):
+    """Color a 0-1 density array through heatmap color stops to a uint8 RGBA
+    image; density below the first stop is transparent, as in HeatmapViz
+
+    Parameters
+    ----------
+    density: float array of values between 0 and 1
+    color_stops: list of [density, color] stops, e.g. [[0.1, 'rgb(...)'], [1, 'rgb(...)']]
+    """
+    stops = sorted(color_stops)
+    values = [float(s) for s, _ in stops]
+    colors = []
+    for _, color in stops:
+        rgba = list(rgb_tuple_from_str(color))
+        colors.append(rgba[:3] + [rgba[3] * 255 if len(rgba) > 3 else 255])
+    colors = numpy.array(colors, dtype=float)
+
+    image = numpy.zeros(density.shape + (4,), dtype=numpy.uint8)
+    for band in range(4):
+        image[..., band] = numpy.round(numpy.interp(density, values, colors[:, band]))
+    image[density < values[0]] = 0
+    return image
+
+
+def kernel_density_image(df, color_stops, **kwargs):
+    """Compute a kernel density surface of points and color it for ImageViz.
+
+    Returns (image, coordinates): a uint8 RGBA array and its corner coordinates
+    (UL, UR, LR, LL). Accepts the keyword arguments of kernel_density.
+
+    Parameters
+    ----------
+    df: Pandas DataFrame with lat / lon columns
+    color_stops: list of [density, color] stops as for HeatmapViz
+    """
+    density, (west, south, east, north) = kernel_density(df, **kwargs)
+    coordinates = [[west, north], [east, north], [east, south], [west, south]]
+    return color_density(density, color_stops), coordinates
@@ -0,0 +1,67 @@
+import asyncio
+import codecs
+import functools
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from mapboxgl import templates
+
+
+def _write(filename, html):
+    with codecs.open(filename, "w", "utf-8-sig") as f:
+        f.write(html)
+
+
+def _create_html(viz, filename):
+    return viz.create_html(filename)
+
+
+class AsyncRenderer(object):
+    """Render vizzes from asyncio code without blocking the event loop.
+
+    Data serialization, stop generation and template rendering run in an
+    executor, at most <max_concurrent> maps at a time. Cancelling a render
+    takes effect between stages: a stage already running in a thread
+    finishes in the background, its result is discarded and no file is
+    written.
+    """
+
+    def __init__(self, executor=None, max_concurrent=None):
+        """Construct an AsyncRenderer
+
+        :param executor: concurrent.futures executor running the render stages; defaults to the event
+                         loop's thread pool. A ProcessPoolExecutor renders each map in one call in a worker
+                         process; the viz is pickled to it, so it pays off when data is a file path
+        :param max_concurrent: maximum number of maps rendered at once; defaults to the number of CPUs
+        """
+        self.executor = executor
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        # asyncio primitives belong to one event loop
+        self.semaphores = weakref.WeakKeyDictionary()
+
+    def semaphore(self, loop):
+        if loop not in self.semaphores:
+            self.semaphores[loop] = asyncio.Semaphore(self.max_concurrent)
+        return self.semaphores[loop]
+
+    async def render(self, viz, filename=None):
+        """Return the html of viz like viz.create_html, or write it to filename and return None"""
+        loop = asyncio.get_running_loop()
+
+        def run(function, *args, **kwargs):
+            return loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+        async with self.semaphore(loop):
+            if isinstance(self.executor, ProcessPoolExecutor) or getattr(viz, 'render_cache', None) is not None:
+                return await run(_create_html, viz, filename)
+
+            options = await run(viz.template_options)
+            html = await run(templates.format, viz.template, **options)
+            if filename:
+                await run(_write, filename, html)
+                return None
+            return html
+
+
+renderer = AsyncRenderer()
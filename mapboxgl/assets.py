@@ -0,0 +1,128 @@
+import os
+import threading
+
+import requests
+
+from .diskcache import write_atomic
+
+
+HTML2CANVAS_VERSION = 'v1.0.0-alpha.12'
+
+ASSETS = {
+    'mapbox-gl.js': 'https://api.tiles.mapbox.com/mapbox-gl-js/{version}/mapbox-gl.js',
+    'mapbox-gl.css': 'https://api.tiles.mapbox.com/mapbox-gl-js/{version}/mapbox-gl.css',
+    'html2canvas.min.js': 'https://github.com/niklasvh/html2canvas/releases/download/{version}/html2canvas.min.js'
+}
+
+CONTENT_TYPES = {
+    '.js': 'application/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8'
+}
+
+
+class AssetCache(object):
+    """Versioned on-disk copies of the GL JS and html2canvas files maps load
+    from CDNs. Files are downloaded on first use and read from disk afterwards,
+    so maps render without network access once the cache is populated.
+    """
+
+    def __init__(self, cache_dir=None, timeout=30):
+        """Construct an AssetCache
+
+        :param cache_dir: directory for cached files; defaults to ~/.cache/mapboxgl-jupyter/assets
+        :param timeout: download timeout in seconds
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'mapboxgl-jupyter', 'assets')
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def path(self, name, version):
+        """Cache path of an asset version"""
+        if name not in ASSETS:
+            raise ValueError('unknown asset {}, expected one of {}'.format(name, sorted(ASSETS)))
+        return os.path.join(self.cache_dir, version, name)
+
+    def get(self, name, version):
+        """Return the bytes of an asset version, downloading it if not cached"""
+        path = self.path(name, version)
+        with self.lock:
+            if not os.path.exists(path):
+                response = requests.get(ASSETS[name].format(version=version), timeout=self.timeout)
+                response.raise_for_status()
+                write_atomic(path, response.content)
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def text(self, name, version):
+        return self.get(name, version).decode('utf-8')
+
+    def download(self, gl_js_version):
+        """Populate the cache with every asset, e.g. before working offline"""
+        for name in ASSETS:
+            self.get(name, HTML2CANVAS_VERSION if name.startswith('html2canvas') else gl_js_version)
+
+
+cache = AssetCache()
+
+
+class AssetDirectory(object):
+    """Copy cached assets next to generated html files so that many maps
+    share one copy, loaded by relative url. Pass it as a viz assets option.
+    """
+
+    def __init__(self, directory, url='assets', asset_cache=None):
+        """Construct an AssetDirectory
+
+        :param directory: directory the files are copied to
+        :param url: url of directory relative to the html files
+        :param asset_cache: AssetCache the files are read from; the shared cache by default
+        """
+        self.directory = directory
+        self.url = url
+        self.asset_cache = asset_cache or cache
+
+    def asset_url(self, name, version):
+        """Copy an asset version to the directory if needed and return its url"""
+        path = os.path.join(self.directory, version, name)
+        if not os.path.exists(path):
+            write_atomic(path, self.asset_cache.get(name, version))
+        return '{}/{}/{}'.format(self.url, version, name)
+
+
+def asset_options(assets, gl_js_version, include_html2canvas=False):
+    """Template variables locating the GL JS and html2canvas files of a map
+
+    Parameters
+    ----------
+    assets: 'cdn' to load files from their CDNs, 'inline' to embed them from the
+            local cache, or an object with an asset_url(name, version) method such as
+            mapboxgl.server.TileServer or AssetDirectory
+    gl_js_version: GL JS version, e.g. 'v1.5.0'
+    include_html2canvas: whether html2canvas is needed by the map
+    """
+    versions = {'mapbox-gl.js': gl_js_version, 'mapbox-gl.css': gl_js_version,
+                'html2canvas.min.js': HTML2CANVAS_VERSION}
+
+    def locate(name):
+        if assets == 'cdn':
+            return {'url': ASSETS[name].format(version=versions[name]), 'text': None, 'reference': None}
+        elif assets == 'inline':
+            text = cache.text(name, versions[name])
+            if name.endswith('.js'):
+                # keep the embedded source from closing its script element
+                text = text.replace('</script', '<\\/script')
+            return {'url': None, 'text': text, 'reference': None}
+        else:
+            return {'url': assets.asset_url(name, versions[name]), 'text': None, 'reference': None}
+
+    if assets != 'cdn' and assets != 'inline' and not hasattr(assets, 'asset_url'):
+        raise ValueError("assets must be 'cdn', 'inline', a TileServer or an AssetDirectory, not {!r}".format(assets))
+
+    return dict(
+        glJs=locate('mapbox-gl.js'),
+        glCss=locate('mapbox-gl.css'),
+        html2canvasJs=locate('html2canvas.min.js') if include_html2canvas else None
+    )
@@ -0,0 +1,171 @@
+import collections
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .utils import df_to_geojson
+
+
+RenderResult = collections.namedtuple('RenderResult', ['filename', 'seconds', 'size', 'error'])
+
+
+class BatchReport(object):
+    """Outcome of a batch render: one RenderResult per item, in completion order"""
+
+    def __init__(self):
+        self.results = []
+        self.seconds = 0.0
+
+    @property
+    def rendered(self):
+        return [r for r in self.results if r.error is None]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if r.error is not None]
+
+    @property
+    def bytes_written(self):
+        return sum(r.size for r in self.rendered)
+
+    @property
+    def maps_per_second(self):
+        return len(self.rendered) / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return '<BatchReport {} rendered, {} failed, {:.1f} maps/s>'.format(
+            len(self.rendered), len(self.failed), self.maps_per_second)
+
+
+class GroupViz(object):
+    """Deferred viz of one dataframe group, converted to GeoJSON in the worker
+    that renders it rather than in the submitting process"""
+
+    def __init__(self, viz_class, df, viz_options=None, lat='lat', lon='lon', properties=None):
+        self.viz_class = viz_class
+        self.df = df
+        self.viz_options = viz_options or {}
+        self.lat = lat
+        self.lon = lon
+        self.properties = properties
+
+    def build(self):
+        data = df_to_geojson(self.df, lat=self.lat, lon=self.lon, properties=self.properties)
+        return self.viz_class(data, **self.viz_options)
+
+
+def _render(filename, viz, assets):
+    """Write one map, returning its RenderResult; errors are reported, not raised"""
+    start = time.time()
+    try:
+        if hasattr(viz, 'build'):
+            viz = viz.build()
+        if assets is not None:
+            viz.assets = assets
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another worker in the meantime
+                pass
+        viz.create_html(filename)
+        return RenderResult(filename, time.time() - start, os.path.getsize(filename), None)
+    except Exception as error:
+        return RenderResult(filename, time.time() - start, 0, '{}: {}'.format(type(error).__name__, error))
+
+
+def render_batch(items, processes=None, max_pending=None, assets=None, progress=None):
+    """Write many maps to html files in a process pool
+
+    Items are consumed lazily and at most <max_pending> are queued at a time,
+    so a generator of vizzes renders in bounded memory. Each worker process
+    compiles the templates once and reuses them for all its maps.
+
+    Parameters
+    ----------
+    items: iterable of (filename, viz) pairs; viz may be a GroupViz
+    processes: number of worker processes; defaults to the number of CPUs, 0 renders in this process
+    max_pending: maximum number of items submitted and not yet written; defaults to 4 per process
+    assets: optional viz assets option applied to every map, e.g. a mapboxgl.assets.AssetDirectory so
+            all files share one copy of GL JS
+    progress: optional callable receiving each RenderResult as it completes
+
+    Returns
+    -------
+    BatchReport
+    """
+    report = BatchReport()
+    start = time.time()
+
+    def done(result):
+        report.results.append(result)
+        if progress is not None:
+            progress(result)
+
+    if processes == 0:
+        for filename, viz in items:
+            done(_render(filename, viz, assets))
+        report.seconds = time.time() - start
+        return report
+
+    processes = processes or os.cpu_count() or 1
+    max_pending = max_pending or 4 * processes
+    items = iter(items)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    filename, viz = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                try:
+                    pending[executor.submit(_render, filename, viz, assets)] = (filename, time.time())
+                except Exception as error:
+                    # e.g. a broken pool
+                    done(RenderResult(filename, 0.0, 0, '{}: {}'.format(type(error).__name__, error)))
+
+            if pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    filename, submitted = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        # raised outside _render, e.g. the item could not be pickled or a worker died
+                        result = RenderResult(filename, time.time() - submitted, 0,
+                                              '{}: {}'.format(type(error).__name__, error))
+                    done(result)
+
+    report.seconds = time.time() - start
+    return report
+
+
+def render_groups(df, by, viz_class, filename='{}.html', directory='.', viz_options=None, lat='lat', lon='lon',
+                  properties=None, **kwargs):
+    """Write one map per group of a dataframe, e.g. one per region and day
+
+    Parameters
+    ----------
+    df: Pandas dataframe with lat / lon columns
+    by: column name or list of column names to group by
+    viz_class: viz class drawing each group, e.g. CircleViz
+    filename: file name pattern formatted with the group key, e.g. '{}-{}.html' for two columns
+    directory: directory the files are written to
+    viz_options: keyword arguments passed to every viz_class
+    lat, lon: names of the latitude and longitude columns
+    properties: list of columns to include as feature properties
+
+    Remaining keyword arguments are passed to render_batch.
+    """
+    def items():
+        for key, group in df.groupby(by, sort=False):
+            key = key if isinstance(key, tuple) else (key,)
+            yield (os.path.join(directory, filename.format(*key)),
+                   GroupViz(viz_class, group, viz_options, lat=lat, lon=lon, properties=properties))
+
+    return render_batch(items(), **kwargs)
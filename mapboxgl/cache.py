@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from .diskcache import DiskLRU
+from .viz import GL_JS_VERSION
+
+
+_template_version = None
+
+
+def template_version():
+    """Hash of the package version and the sources of all map templates"""
+    global _template_version
+    if _template_version is None:
+        from mapboxgl import __version__
+        digest = hashlib.sha1(__version__.encode('utf-8'))
+        directory = os.path.join(os.path.dirname(__file__), 'templates')
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as f:
+                digest.update(name.encode('utf-8'))
+                digest.update(f.read())
+        _template_version = digest.hexdigest()
+    return _template_version
+
+
+def data_hash(data):
+    """Content hash of viz data; files are identified by path, size and
+    modification time rather than read"""
+    digest = hashlib.sha1()
+    if isinstance(data, str) and os.path.isfile(data):
+        stat = os.stat(data)
+        digest.update('{}:{}:{}'.format(os.path.abspath(data), stat.st_size, stat.st_mtime).encode('utf-8'))
+    else:
+        digest.update(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RenderCache(object):
+    """Size-bounded on-disk cache of rendered map html, keyed by a hash of the
+    viz spec, the template version and the data content. A hit skips the
+    viz's data processing and template rendering.
+    """
+
+    def __init__(self, cache_dir=None, max_size=256 * 1024 * 1024):
+        """Construct a RenderCache
+
+        :param cache_dir: directory for cached html; defaults to mapboxgl-render-cache in the system temp dir
+        :param max_size: maximum total size of cached html in bytes; least recently used entries are evicted
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(tempfile.gettempdir(), 'mapboxgl-render-cache')
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.files = DiskLRU(cache_dir, max_size, suffix='.html')
+
+    def key(self, viz):
+        """Cache key of a viz, or None if its spec is not serializable (e.g.
+        it is fed by a ViewportSource or loads assets from a TileServer)"""
+        if getattr(viz, 'viewport_source', None) is not None:
+            return None
+
+        spec = viz.to_dict()
+        data = spec['attributes'].pop('data', None)
+        try:
+            spec = json.dumps(spec, sort_keys=True)
+            data = data_hash(data)
+        except TypeError:
+            return None
+        return hashlib.sha1('{}:{}:{}:{}'.format(template_version(), GL_JS_VERSION, spec, data).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], '{}.html'.format(key))
+
+    def get(self, key):
+        """Return cached html or None"""
+        html = self.files.read(self.path(key))
+        return html.decode('utf-8') if html is not None else None
+
+    def put(self, key, html):
+        """Store html and evict least recently used entries"""
+        self.files.write(self.path(key), html.encode('utf-8'))
+
+    def render(self, viz, render):
+        """Return the html of viz from the cache, or call render() and cache its result"""
+        key = self.key(viz)
+        if key is None:
+            return render()
+
+        html = self.get(key)
+        if html is not None:
+            self.hits += 1
+            return html
+
+        self.misses += 1
+        html = render()
+        self.put(key, html)
+        return html
@@ -0,0 +1,224 @@
+import numpy
+
+from .tiles import WORLD_SIZE, lonlat_to_world, world_to_lonlat
+
+
+# zoom past which unclustered points stay visible
+MAX_VISIBLE_ZOOM = 24
+
+
+class GridIndex(object):
+    """Static uniform-grid index over points in world coordinates for fixed
+    radius neighbor queries; the cell size equals the query radius, so a
+    radius query only visits the 3 x 3 cells around a point.
+    """
+
+    def __init__(self, x, y, cell_size):
+        self.x = x
+        self.y = y
+        self.cell_size = cell_size
+
+        cx = numpy.floor(x / cell_size).astype(numpy.int64)
+        cy = numpy.floor(y / cell_size).astype(numpy.int64)
+        self.width = int(cx.max()) + 3 if len(cx) else 1
+        keys = cx * self.width + cy
+
+        self.order = numpy.argsort(keys, kind='stable')
+        self.keys, cell_starts, cell_counts = numpy.unique(keys[self.order], return_index=True, return_counts=True)
+
+
+        # start and stop offsets into self.order of the 3 x 3 cells around every point
+        self.starts = numpy.zeros((len(x), 9), dtype=numpy.int64)
+        self.stops = numpy.zeros((len(x), 9), dtype=numpy.int64)
+        for k, (dx, dy) in enumerate((dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+            neighbor_keys = (cx + dx) * self.width + (cy + dy)
+            i = numpy.clip(numpy.searchsorted(self.keys, neighbor_keys), 0, len(self.keys) - 1)
+            found = self.keys[i] == neighbor_keys
+            self.starts[:, k] = numpy.where(found, cell_starts[i], 0)
+            self.stops[:, k] = numpy.where(found, cell_starts[i] + cell_counts[i], 0)
+
+    def neighbor_counts(self):
+        """Number of points in the 3 x 3 cells around every point"""
+        return (self.stops - self.starts).sum(axis=1)
+
+    def within(self, i, radius):
+        """Indices of points within radius of point i"""
+        candidates = numpy.concatenate([self.order[start:stop] for start, stop in zip(self.starts[i], self.stops[i])
+                                        if stop > start])
+        d2 = (self.x[candidates] - self.x[i]) ** 2 + (self.y[candidates] - self.y[i]) ** 2
+        return candidates[d2 <= radius ** 2]
+
+
+def _abbreviate(count):
+    if count >= 10000:
+        return '{}k'.format(int(round(count / 1000.0)))
+    if count >= 1000:
+        return '{:.1f}k'.format(count / 1000.0)
+    return str(count)
+
+
+def supercluster(data, min_zoom=0, max_zoom=14, radius=30, extent=512, ancestor_zoom=None):
+    """Precompute hierarchical point clusters for every zoom from min_zoom to
+    max_zoom, following the greedy algorithm of GL JS (supercluster).
+
+    Returns a GeoJSON FeatureCollection holding each cluster and point once,
+    with `_minzoom` and `_maxzoom` properties giving the zoom range in which it
+    is displayed. Clusters have `cluster`, `cluster_id`, `point_count` and
+    `point_count_abbreviated` properties. With <ancestor_zoom>, points first
+    shown deeper than that zoom get an `_ancestor` property holding the
+    cluster_id of the cluster containing them at ancestor_zoom.
+
+    Parameters
+    ----------
+    data: GeoJSON FeatureCollection of Point features
+    min_zoom, max_zoom: zoom range for clustering; points are unclustered above max_zoom
+    radius: cluster radius in pixels
+    extent: tile extent in pixels the radius is relative to
+    ancestor_zoom: optional zoom of the clusters referenced by `_ancestor`
+    """
+    points = [f for f in data['features'] if f.get('geometry') and f['geometry']['type'] == 'Point']
+    coordinates = numpy.array([f['geometry']['coordinates'][:2] for f in points], dtype=float).reshape(-1, 2)
+    px, py = lonlat_to_world(coordinates[:, 0], coordinates[:, 1])
+
+    # node table; points first, clusters appended as they form
+    node_x = list(px)
+    node_y = list(py)
+    node_count = [1] * len(points)
+    node_zoom = [max_zoom + 1] * len(points)
+    node_parent_zoom = [None] * len(points)
+    node_parent = [-1] * len(points)
+
+    # nodes at the current level
+    level = numpy.arange(len(points))
+
+    for z in range(max_zoom, min_zoom - 1, -1):
+        if len(level) < 2:
+            continue
+        r = radius / float(extent * 2 ** z)
+        x = numpy.array([node_x[i] for i in level])
+        y = numpy.array([node_y[i] for i in level])
+        count = numpy.array([node_count[i] for i in level])
+        index = GridIndex(x, y, r)
+
+        # nodes alone in their neighborhood carry over without a query
+        crowded = numpy.flatnonzero(index.neighbor_counts() > 1)
+        processed = numpy.zeros(len(level), dtype=bool)
+        merged = numpy.zeros(len(level), dtype=bool)
+        next_level = []
+
+        for i in crowded:
+            if processed[i]:
+                continue
+            neighbors = index.within(i, r)
+            neighbors = neighbors[~processed[neighbors]]
+            processed[neighbors] = True
+            if len(neighbors) < 2:
+                continue
+            merged[neighbors] = True
+
+            weight = count[neighbors]
+            total = weight.sum()
+            node_x.append(float((x[neighbors] * weight).sum() / total))
+            node_y.append(float((y[neighbors] * weight).sum() / total))
+            node_count.append(int(total))
+            node_zoom.append(z)
+            node_parent_zoom.append(None)
+            node_parent.append(-1)
+            for j in level[neighbors]:
+                node_parent_zoom[j] = z
+                node_parent[j] = len(node_x) - 1
+            next_level.append(len(node_x) - 1)
+
+        level = numpy.concatenate([level[~merged], numpy.array(next_level, dtype=int)])
+
+    if ancestor_zoom is not None:
+        # climb from each point while its parent is merged at or above ancestor_zoom
+        parent = numpy.array(node_parent, dtype=numpy.int64)
+        parent_zoom = numpy.array([-1 if zoom is None else zoom for zoom in node_parent_zoom])
+        ancestor = numpy.arange(len(points))
+        climbing = parent_zoom[ancestor] >= ancestor_zoom
+        while climbing.any():
+            ancestor[climbing] = parent[ancestor[climbing]]
+            climbing = parent_zoom[ancestor] >= ancestor_zoom
+
+    lon, lat = world_to_lonlat(numpy.array(node_x), numpy.array(node_y))
+    features = []
+    for i in range(len(node_x)):
+        if i < len(points):
+            properties = dict(points[i].get('properties') or {})
+            coordinates = points[i]['geometry']['coordinates']
+        else:
+            properties = {
+                'cluster': True,
+                'cluster_id': i,
+                'point_count': node_count[i],
+                'point_count_abbreviated': _abbreviate(node_count[i])
+            }
+            coordinates = [float(lon[i]), float(lat[i])]
+
+        if ancestor_zoom is not None and i < len(points) and ancestor[i] != i:
+            properties['_ancestor'] = int(ancestor[i])
+
+        parent_zoom = node_parent_zoom[i]
+        properties['_minzoom'] = 0 if parent_zoom is None else parent_zoom + 1
+        properties['_maxzoom'] = MAX_VISIBLE_ZOOM + 1 if i < len(points) else node_zoom[i] + 1
+
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': coordinates},
+            'properties': properties
+        })
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def zoom_levels(data, min_zoom=0, max_zoom=16, cell_size=8, seed=0):
+    """Assign points to zoom tiers by spatially stratified sampling, for
+    level-of-detail display of dense point layers.
+
+    At each zoom from min_zoom, every grid cell of <cell_size> pixels that has
+    no point from a lower tier gets one randomly sampled point. Returns a copy
+    of the FeatureCollection with a `_minzoom` property on each point giving
+    the first zoom at which it is displayed; points never sampled get max_zoom.
+
+    Parameters
+    ----------
+    data: GeoJSON FeatureCollection of Point features
+    min_zoom, max_zoom: zoom range of the tiers
+    cell_size: grid cell side in pixels; at most one point per cell is added per tier
+    seed: random seed of the sampling order
+    """
+    features = data['features']
+    coordinates = numpy.array([f['geometry']['coordinates'][:2] for f in features], dtype=float).reshape(-1, 2)
+    x, y = lonlat_to_world(coordinates[:, 0], coordinates[:, 1])
+
+    # sample in random order so the representative of a cell is a random point
+    order = numpy.random.RandomState(seed).permutation(len(features))
+    x, y = x[order], y[order]
+    minzoom = numpy.full(len(features), max_zoom, dtype=numpy.int64)
+    assigned = numpy.zeros(len(features), dtype=bool)
+
+    for z in range(min_zoom, max_zoom):
+        size = cell_size / float(WORLD_SIZE * 2 ** z)
+        keys = numpy.floor(x / size).astype(numpy.int64) * (2 ** 31) + numpy.floor(y / size).astype(numpy.int64)
+
+        # first unassigned point of each cell not yet holding an assigned point
+        occupied = numpy.unique(keys[assigned])
+        candidates = numpy.flatnonzero(~assigned & ~numpy.isin(keys, occupied))
+        _, first = numpy.unique(keys[candidates], return_index=True)
+        chosen = candidates[first]
+
+        minzoom[chosen] = z
+        assigned[chosen] = True
+        if assigned.all():
+            break
+
+    levels = numpy.empty(len(features), dtype=numpy.int64)
+    levels[order] = minzoom
+
+    leveled = []
+    for feature, level in zip(features, levels):
+        feature = dict(feature)
+        feature['properties'] = dict(feature.get('properties') or {}, _minzoom=int(level))
+        leveled.append(feature)
+    return {'type': 'FeatureCollection', 'features': leveled}
@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def write_atomic(path, data):
+    """Write bytes to path through a temporary file renamed over it, so
+    concurrent readers never see a partial file"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class DiskLRU(object):
+    """Least recently used order and total size of the files in a cache
+    directory. Files are written atomically, and the least recently used
+    ones are removed once the total size exceeds max_size. The order of
+    files cached by an earlier process is rebuilt from modification times,
+    which reads update.
+    """
+
+    def __init__(self, directory, max_size, suffix=''):
+        """Construct a DiskLRU
+
+        :param directory: cache directory, scanned for files cached earlier
+        :param max_size: maximum total size of the cached files in bytes
+        :param suffix: file name suffix of cached files; other files in directory are ignored
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.suffix = suffix
+        self.lock = threading.Lock()
+
+        self.lru = OrderedDict()
+        self.size = 0
+        cached = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(suffix) and not name.endswith('.tmp'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    cached.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(cached):
+            self.lru[path] = size
+            self.size += size
+        self.evict()
+
+    def __getstate__(self):
+        # locks cannot be pickled; a copy sent to a worker process gets its own
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __contains__(self, path):
+        return path in self.lru
+
+    def read(self, path):
+        """Return the bytes of a cached file and mark it used, or None if it is not cached"""
+        with self.lock:
+            if path not in self.lru:
+                return None
+            self.lru.move_to_end(path)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            with self.lock:
+                self.forget(path)
+            return None
+        os.utime(path, None)
+        return data
+
+    def write(self, path, data):
+        """Cache the bytes of a file and evict least recently used files"""
+        write_atomic(path, data)
+        with self.lock:
+            self.forget(path)
+            self.lru[path] = len(data)
+            self.size += len(data)
+            self.evict()
+
+    def forget(self, path):
+        self.size -= self.lru.pop(path, 0)
+
+    def evict(self):
+        while self.size > self.max_size and self.lru:
+            path, size = self.lru.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,61 @@
+import hashlib
+import json
+
+from IPython.core.display import Javascript, display
+
+
+# copy the top-level object so maps that append to their data do not change it for other maps
+REFERENCE = ('(function(d) {{ return Array.isArray(d) ? d.slice() : Object.assign({{}}, d); }})'
+             '(window.parent.mapboxglData["{key}"])')
+
+
+class DataRegistry(object):
+    """Inject each distinct data payload into the notebook page once and let
+    map iframes refer to it by content hash, so the notebook and the browser
+    hold one copy of a dataset however many maps display it.
+
+    The payload is kept in the output of the first map that used it; maps
+    displayed later read it from the page and break if that output is cleared.
+    """
+
+    def __init__(self):
+        self.keys = set()
+
+    @staticmethod
+    def key(payload):
+        """Content hash of a serialized payload"""
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def register(self, payload, copy=True):
+        """Inject a JSON value into the page unless it is already there, and
+        return a JavaScript expression that reads it from a map iframe; objects
+        and arrays are copied unless copy is False
+        """
+        key = self.key(payload)
+        if key not in self.keys:
+            display(Javascript('window.mapboxglData = window.mapboxglData || {{}};'
+                               'window.mapboxglData["{key}"] = {payload};'.format(key=key, payload=payload)))
+            self.keys.add(key)
+        return (REFERENCE if copy else 'window.parent.mapboxglData["{key}"]').format(key=key)
+
+    def share(self, options, names=('geojson_data', 'joinData', 'deferredLeaves', 'progressiveChunks')):
+        """Replace the inline JSON of template options with registry references"""
+        def shareable(value):
+            return hasattr(value, 'lstrip') and value.lstrip()[:1] in ('{', '[')
+
+        for name in names:
+            value = options.get(name)
+            if shareable(value):
+                options[name] = self.register(value)
+            elif isinstance(value, list):
+                options[name] = [self.register(v) if shareable(v) else v for v in value]
+
+    def share_assets(self, options, names=('glJs', 'glCss', 'html2canvasJs')):
+        """Replace inline GL JS and html2canvas sources with registry references"""
+        for name in names:
+            asset = options.get(name)
+            if asset and asset['text'] is not None:
+                options[name] = dict(asset, text=None, reference=self.register(json.dumps(asset['text']), copy=False))
+
+
+registry = DataRegistry()
@@ -0,0 +1,463 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from queue import Queue
+from socketserver import ThreadingMixIn
+from urllib.request import pathname2url
+
+from matplotlib import colormaps
+import numpy
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import assets
+from .diskcache import DiskLRU
+from .tiles import array_tile, native_zoom
+from .utils import img_bytes
+
+
+CONTENT_TYPES = {
+    'pbf': 'application/x-protobuf',
+    'mvt': 'application/vnd.mapbox-vector-tile',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'json': 'application/json'
+}
+
+
+class DirectoryTileSource(object):
+    """Serve tiles stored on disk in a <directory>/z/x/y.<format> layout, such
+    as the output of mapboxgl.tiles.generate_vector_tiles
+    """
+
+    def __init__(self, directory, tile_format=None):
+        """Construct a DirectoryTileSource
+
+        :param directory: root of the z/x/y tile tree
+        :param tile_format: tile file extension; read from metadata.json in directory if omitted
+        """
+        self.directory = directory
+        self.metadata = {}
+
+        metadata_path = os.path.join(directory, 'metadata.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                self.metadata = json.load(f)
+
+        self.format = tile_format or self.metadata.get('format', 'pbf')
+
+    def get_tile(self, z, x, y):
+        """Return (tile bytes, headers) or None if the tile does not exist"""
+        path = os.path.join(self.directory, str(z), str(x), '{}.{}'.format(y, self.format))
+        try:
+            with open(path, 'rb') as f:
+                return f.read(), {'Content-Type': CONTENT_TYPES.get(self.format, 'application/octet-stream')}
+        except IOError:
+            return None
+
+    def tilejson(self):
+        """TileJSON properties of the source, without the tiles url"""
+        keys = ['minzoom', 'maxzoom', 'bounds', 'vector_layers']
+        return {key: self.metadata[key] for key in keys if key in self.metadata}
+
+
+class MBTilesSource(object):
+    """Serve vector or raster tiles from a local SQLite MBTiles archive"""
+
+    def __init__(self, path, pool_size=4):
+        """Construct an MBTilesSource
+
+        :param path: path to the .mbtiles file
+        :param pool_size: number of read-only SQLite connections shared by request threads
+        """
+        if not os.path.exists(path):
+            raise IOError('MBTiles file {} does not exist'.format(path))
+
+        self.path = path
+        self.pool = Queue()
+        # characters such as ?, # and % in the path are escaped in the read-only URI
+        uri = 'file:{}?mode=ro'.format(pathname2url(os.path.abspath(path)))
+        for _ in range(pool_size):
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self.pool.put(connection)
+
+        self.metadata = dict(self.query('SELECT name, value FROM metadata'))
+        self.format = self.metadata.get('format', 'pbf')
+
+    def query(self, sql, parameters=()):
+        """Run a query on a pooled connection, blocking until one is free"""
+        connection = self.pool.get()
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            self.pool.put(connection)
+
+    def get_tile(self, z, x, y):
+        """Return (tile bytes, headers) or None if the tile does not exist"""
+        # MBTiles rows follow the TMS scheme, counting from the south
+        rows = self.query('SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?',
+                          (z, x, 2 ** z - 1 - y))
+        if not rows:
+            return None
+
+        data = bytes(rows[0][0])
+        headers = {
+            'Content-Type': CONTENT_TYPES.get(self.format, 'application/octet-stream'),
+            'ETag': '"{}"'.format(hashlib.md5(data).hexdigest()),
+            'Cache-Control': 'max-age=3600'
+        }
+        # vector tiles are usually stored gzipped; pass them through as-is
+        if data[:2] == b'\x1f\x8b':
+            headers['Content-Encoding'] = 'gzip'
+        return data, headers
+
+    def tilejson(self):
+        """TileJSON properties of the source, without the tiles url"""
+        tilejson = {}
+        for key in ['name', 'description', 'attribution']:
+            if key in self.metadata:
+                tilejson[key] = self.metadata[key]
+        for key in ['minzoom', 'maxzoom']:
+            if key in self.metadata:
+                tilejson[key] = int(self.metadata[key])
+        if 'bounds' in self.metadata:
+            tilejson['bounds'] = [float(v) for v in self.metadata['bounds'].split(',')]
+        if 'json' in self.metadata:
+            tilejson['vector_layers'] = json.loads(self.metadata['json']).get('vector_layers', [])
+        return tilejson
+
+    def close(self):
+        """Close all pooled connections"""
+        while not self.pool.empty():
+            self.pool.get().close()
+
+
+class CachingProxySource(object):
+    """Proxy an upstream XYZ tile endpoint through a size-bounded on-disk LRU
+    cache. Concurrent requests for the same uncached tile share one upstream
+    fetch, and upstream connections are pooled.
+    """
+
+    def __init__(self, tiles_url, cache_dir=None, max_cache_size=512 * 1024 * 1024, pool_size=16, timeout=30):
+        """Construct a CachingProxySource
+
+        :param tiles_url: upstream tile url template with {z}, {x} and {y} placeholders
+        :param cache_dir: directory for cached tiles; defaults to a per-url directory in the system temp dir
+        :param max_cache_size: maximum total size of cached tiles in bytes
+        :param pool_size: maximum number of pooled connections to the upstream host
+        :param timeout: upstream request timeout in seconds
+        """
+        self.tiles_url = tiles_url
+        self.format = os.path.splitext(tiles_url.split('?')[0])[1].lstrip('.') or 'png'
+        if cache_dir is None:
+            cache_dir = os.path.join(tempfile.gettempdir(), 'mapboxgl-tile-cache',
+                                     hashlib.md5(tiles_url.encode('utf-8')).hexdigest())
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.upstream_requests = 0
+
+        self.files = DiskLRU(cache_dir, max_cache_size)
+
+    def tile_path(self, z, x, y):
+        return os.path.join(self.cache_dir, str(z), str(x), '{}.tile'.format(y))
+
+    def get_tile(self, z, x, y):
+        """Return (tile bytes, headers) or None if upstream has no tile"""
+        path = self.tile_path(z, x, y)
+
+        # cached tiles start with a line holding the upstream Content-Type
+        cached = self.files.read(path)
+        if cached is not None:
+            content_type, _, data = cached.partition(b'\n')
+            return data, {'Content-Type': content_type.decode('ascii')}
+
+        with self.lock:
+            # a tile stored since the read above is not fetched again
+            stored = path in self.files
+            if not stored:
+                # the first request for a tile fetches it; later ones wait for its result
+                pending = self.in_flight.get(path)
+                leader = pending is None
+                if leader:
+                    pending = self.in_flight[path] = {'done': threading.Event()}
+
+        if stored:
+            return self.get_tile(z, x, y)
+
+        if not leader:
+            pending['done'].wait()
+            if 'error' in pending:
+                raise pending['error']
+            return pending['tile']
+
+        try:
+            tile = self.fetch(z, x, y)
+            if tile is not None:
+                data, headers = tile
+                self.files.write(path, headers['Content-Type'].encode('ascii') + b'\n' + data)
+            pending['tile'] = tile
+        except Exception as error:
+            pending['error'] = error
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[path]
+            pending['done'].set()
+
+        return tile
+
+    def fetch(self, z, x, y):
+        """Request a tile from upstream; (tile bytes, headers) or None for missing or empty tiles"""
+        url = self.tiles_url.replace('{z}', str(z)).replace('{x}', str(x)).replace('{y}', str(y))
+        response = self.session.get(url, timeout=self.timeout)
+        with self.lock:
+            self.upstream_requests += 1
+        if response.status_code in (204, 404):
+            return None
+        response.raise_for_status()
+        # the url extension is only a fallback, templated urls often have none
+        content_type = response.headers.get('Content-Type') or CONTENT_TYPES.get(self.format, 'application/octet-stream')
+        return response.content, {'Content-Type': content_type}
+
+    def tilejson(self):
+        return {}
+
+
+class ArrayTileSource(object):
+    """Serve an XYZ tile pyramid cut from a lon/lat-gridded ndarray, which may
+    be memory-mapped. Tiles are resampled and encoded when first requested and
+    kept in an in-memory LRU cache.
+    """
+
+    def __init__(self, array, bounds, tile_size=256, max_zoom=None, vmin=None, vmax=None, cmap='viridis',
+                 cache_size=1024):
+        """Construct an ArrayTileSource
+
+        :param array: ndarray (rows, cols) or (rows, cols, 3 or 4 bands) with rows ordered north to south
+        :param bounds: (west, south, east, north) of the array in degrees
+        :param tile_size: tile width and height in pixels
+        :param max_zoom: maximum zoom of the pyramid; defaults to the array's native resolution
+        :param vmin: value mapped to the bottom of the color range for non-uint8 arrays
+        :param vmax: value mapped to the top of the color range for non-uint8 arrays
+        :param cmap: matplotlib colormap name for single-band arrays
+        :param cache_size: maximum number of encoded tiles kept in memory
+        """
+        self.array = array
+        self.bounds = list(bounds)
+        self.tile_size = tile_size
+        self.max_zoom = native_zoom(array, bounds, tile_size) if max_zoom is None else max_zoom
+        self.cmap = cmap
+        self.format = 'png'
+
+        if array.dtype != numpy.uint8 and (vmin is None or vmax is None):
+            # estimate the value range from a decimated sample of the array
+            step = max(1, max(array.shape[:2]) // 1024)
+            sample = numpy.asarray(array[::step, ::step], dtype=float)
+            vmin = numpy.nanmin(sample) if vmin is None else vmin
+            vmax = numpy.nanmax(sample) if vmax is None else vmax
+        self.vmin = vmin
+        self.vmax = vmax
+
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+
+    def to_rgba(self, tile, mask):
+        """Convert a resampled tile to uint8 RGBA, transparent outside the array"""
+        if tile.dtype != numpy.uint8:
+            scaled = (tile.astype(float) - self.vmin) / ((self.vmax - self.vmin) or 1)
+            mask = mask & ~numpy.isnan(scaled if scaled.ndim == 2 else scaled[..., 0])
+            scaled = numpy.clip(numpy.nan_to_num(scaled), 0, 1)
+            if tile.ndim == 2:
+                return (colormaps[self.cmap](scaled, bytes=True) * mask[..., None]).astype(numpy.uint8)
+            tile = (scaled * 255).astype(numpy.uint8)
+
+        if tile.ndim == 2:
+            tile = numpy.stack([tile] * 3, axis=-1)
+        rgba = numpy.zeros(tile.shape[:2] + (4,), dtype=numpy.uint8)
+        rgba[..., :3] = tile[..., :3]
+        rgba[..., 3] = tile[..., 3] if tile.shape[2] == 4 else 255
+        rgba[..., 3] *= mask
+        return rgba
+
+    def get_tile(self, z, x, y):
+        """Return (tile bytes, headers) or None if the tile is outside the array"""
+        if z > self.max_zoom:
+            return None
+
+        key = (z, x, y)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key], {'Content-Type': 'image/png'}
+
+        resampled = array_tile(self.array, self.bounds, z, x, y, self.tile_size)
+        if resampled is None:
+            return None
+        data = img_bytes(self.to_rgba(*resampled), format='png')
+
+        with self.lock:
+            self.cache[key] = data
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return data, {'Content-Type': 'image/png'}
+
+    def tilejson(self):
+        return {'bounds': self.bounds, 'minzoom': 0, 'maxzoom': self.max_zoom}
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _TileRequestHandler(BaseHTTPRequestHandler):
+
+    tile_path = re.compile(r'^/(?P<name>[^/]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.(?P<ext>\w+)$')
+    tilejson_path = re.compile(r'^/(?P<name>[^/]+)\.json$')
+    asset_path = re.compile(r'^/assets/(?P<version>[^/]+)/(?P<name>[^/]+)$')
+
+    def do_GET(self):
+        tile_server = self.server.tile_server
+        path = self.path.split('?')[0]
+
+        match = self.tile_path.match(path)
+        if match:
+            source = tile_server.sources.get(match.group('name'))
+            if source is None:
+                return self.send_error(404)
+            try:
+                tile = source.get_tile(int(match.group('z')), int(match.group('x')), int(match.group('y')))
+            except Exception:
+                return self.send_error(502)
+            if tile is None:
+                # an empty response renders as a blank tile
+                return self.respond(204, b'', {})
+            data, headers = tile
+            if 'ETag' in headers and self.headers.get('If-None-Match') == headers['ETag']:
+                return self.respond(304, b'', {'ETag': headers['ETag']})
+            return self.respond(200, data, headers)
+
+        match = self.asset_path.match(path)
+        if match and match.group('name') in assets.ASSETS:
+            try:
+                data = tile_server.asset_cache.get(match.group('name'), match.group('version'))
+            except Exception:
+                return self.send_error(502)
+            content_type = assets.CONTENT_TYPES[os.path.splitext(match.group('name'))[1]]
+            # asset urls are versioned, so browsers may keep them indefinitely
+            return self.respond(200, data, {'Content-Type': content_type, 'Cache-Control': 'max-age=31536000'})
+
+        match = self.tilejson_path.match(path)
+        if match and match.group('name') in tile_server.sources:
+            name = match.group('name')
+            tilejson = dict(tilejson='2.2.0', scheme='xyz', name=name)
+            tilejson.update(tile_server.sources[name].tilejson())
+            tilejson['tiles'] = [tile_server.tiles_url(name)]
+            return self.respond(200, json.dumps(tilejson).encode('utf-8'), {'Content-Type': 'application/json'})
+
+        self.send_error(404)
+
+    def respond(self, status, body, headers):
+        self.send_response(status)
+        # notebook pages are served from a different origin than the tile server
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer(object):
+    """Local HTTP server for tile sources, running in a background thread"""
+
+    def __init__(self, host='127.0.0.1', port=0, asset_cache=None):
+        """Construct a TileServer
+
+        :param host: interface to listen on
+        :param port: port to listen on; 0 picks a free port
+        :param asset_cache: mapboxgl.assets.AssetCache serving GL JS files under /assets; the shared cache by default
+        """
+        self.host = host
+        self.port = port
+        self.asset_cache = asset_cache or assets.cache
+        self.sources = {}
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def start(self):
+        """Start serving in a daemon thread; returns the server for chaining"""
+        if self.httpd is None:
+            self.httpd = _ThreadingHTTPServer((self.host, self.port), _TileRequestHandler)
+            self.httpd.tile_server = self
+            self.port = self.httpd.server_address[1]
+            self.thread = threading.Thread(target=self.httpd.serve_forever)
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the port"""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+            self.thread = None
+
+    def add_source(self, name, source):
+        """Register a tile source under name, starting the server if needed.
+        Returns the TileJSON url of the source, for use as a MapViz vector_url.
+        """
+        self.sources[name] = source
+        self.start()
+        return self.tilejson_url(name)
+
+    def tiles_url(self, name):
+        """XYZ tile url template of a source, e.g. for RasterTilesViz tiles_url"""
+        ext = getattr(self.sources[name], 'format', 'pbf')
+        return '{}/{}/{{z}}/{{x}}/{{y}}.{}'.format(self.url, name, ext)
+
+    def tilejson_url(self, name):
+        """TileJSON url of a source"""
+        return '{}/{}.json'.format(self.url, name)
+
+    def add_proxy(self, tiles_url, **kwargs):
+        """Proxy an upstream tile url template through a CachingProxySource.
+        Returns the local tile url template; keyword arguments are passed to
+        CachingProxySource.
+        """
+        name = 'proxy-{}'.format(hashlib.md5(tiles_url.encode('utf-8')).hexdigest()[:12])
+        if name not in self.sources:
+            self.add_source(name, CachingProxySource(tiles_url, **kwargs))
+        return self.tiles_url(name)
+
+    def asset_url(self, name, version):
+        """Url of a GL JS or html2canvas file served from the asset cache,
+        starting the server if needed"""
+        self.start()
+        return '{}/assets/{}/{}'.format(self.url, version, name)
@@ -0,0 +1,166 @@
+import math
+
+import numpy
+
+from .errors import SourceDataError
+from .tiles import lonlat_to_world, world_to_lonlat
+
+
+EARTH_RADIUS = 6371008.8
+
+
+def _coordinates(geometry):
+    """Flatten the positions of any GeoJSON geometry"""
+    if geometry['type'] == 'GeometryCollection':
+        return [c for g in geometry['geometries'] for c in _coordinates(g)]
+
+    coordinates = geometry['coordinates']
+    depth = {'Point': 0, 'MultiPoint': 1, 'LineString': 1, 'MultiLineString': 2,
+             'Polygon': 2, 'MultiPolygon': 3}[geometry['type']]
+    positions = [coordinates]
+    for _ in range(depth):
+        positions = [c for part in positions for c in part]
+    return positions
+
+
+def feature_bounds(features):
+    """Return (west, south, east, north) arrays with the bounding box of each
+    GeoJSON feature; points take a vectorized path.
+
+    Parameters
+    ----------
+    features: list of GeoJSON features
+    """
+    try:
+        coordinates = numpy.array([f['geometry']['coordinates'][:2] for f in features], dtype=float)
+        points = coordinates.ndim == 2 and all(f['geometry']['type'] == 'Point' for f in features)
+    except (ValueError, TypeError, KeyError):
+        points = False
+
+    if points:
+        return coordinates[:, 0], coordinates[:, 1], coordinates[:, 0], coordinates[:, 1]
+
+    bounds = numpy.empty((len(features), 4))
+    for i, feature in enumerate(features):
+        if not feature.get('geometry'):
+            raise SourceDataError('features must have a geometry to be indexed')
+        positions = numpy.array([p[:2] for p in _coordinates(feature['geometry'])], dtype=float)
+        bounds[i] = positions.min(axis=0).tolist() + positions.max(axis=0).tolist()
+    return bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3]
+
+
+class SpatialIndex(object):
+    """Static R-tree over the bounding boxes of GeoJSON features, packed with
+    the Sort-Tile-Recursive algorithm. Build and queries are vectorized with
+    NumPy, one tree level at a time.
+    """
+
+    def __init__(self, features, node_size=16, bounds=None):
+        """Construct a SpatialIndex
+
+        :param features: list of GeoJSON features
+        :param node_size: maximum number of children of a tree node
+        :param bounds: optional (west, south, east, north) arrays of the feature boxes; computed from features if None
+        """
+        self.features = features
+        self.node_size = node_size
+        west, south, east, north = feature_bounds(features) if bounds is None else bounds
+        n = len(west)
+
+        if n:
+            self.bounds = (float(west.min()), float(south.min()), float(east.max()), float(north.max()))
+        else:
+            self.bounds = None
+
+        # STR: sort by x into vertical slices, then by y within each slice
+        leaf_count = int(math.ceil(n / float(node_size)))
+        slice_size = node_size * max(1, int(math.ceil(math.sqrt(leaf_count))))
+        by_x = numpy.argsort(west + east, kind='stable')
+        slice_id = numpy.empty(n, dtype=numpy.int64)
+        slice_id[by_x] = numpy.arange(n) // slice_size
+        self.order = numpy.lexsort((south + north, slice_id))
+        self.rank = numpy.empty(n, dtype=numpy.int64)
+        self.rank[self.order] = numpy.arange(n)
+
+        # level 0 holds the feature boxes; each level above groups node_size consecutive nodes
+        self.levels = [numpy.stack([west, south, east, north], axis=1)[self.order]]
+        while len(self.levels[-1]) > 1:
+            boxes = self.levels[-1]
+            starts = numpy.arange(0, len(boxes), node_size)
+            self.levels.append(numpy.stack([numpy.minimum.reduceat(boxes[:, 0], starts),
+                                            numpy.minimum.reduceat(boxes[:, 1], starts),
+                                            numpy.maximum.reduceat(boxes[:, 2], starts),
+                                            numpy.maximum.reduceat(boxes[:, 3], starts)], axis=1))
+
+    @classmethod
+    def from_geojson(cls, data, node_size=16):
+        """Build an index over a GeoJSON FeatureCollection"""
+        if not isinstance(data, dict) or 'features' not in data:
+            raise SourceDataError('a spatial index requires a GeoJSON FeatureCollection')
+        return cls(data['features'], node_size=node_size)
+
+    @classmethod
+    def from_points(cls, lon, lat, node_size=16):
+        """Build an index over arrays of point coordinates, e.g. dataframe
+        columns, without creating GeoJSON features; queries return row positions
+        """
+        lon = numpy.asarray(lon, dtype=float)
+        lat = numpy.asarray(lat, dtype=float)
+        return cls(None, node_size=node_size, bounds=(lon, lat, lon, lat))
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def query_bbox(self, west, south, east, north):
+        """Return indices of features whose bounding box intersects the given bbox, in input order"""
+        if not len(self):
+            return numpy.array([], dtype=numpy.int64)
+
+        nodes = numpy.arange(len(self.levels[-1]))
+        for level in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[level][nodes]
+            hit = (boxes[:, 0] <= east) & (boxes[:, 2] >= west) & (boxes[:, 1] <= north) & (boxes[:, 3] >= south)
+            nodes = nodes[hit]
+            if level:
+                children = (nodes[:, None] * self.node_size + numpy.arange(self.node_size)).ravel()
+                nodes = children[children < len(self.levels[level - 1])]
+
+        return numpy.sort(self.order[nodes])
+
+    def query_radius(self, lon, lat, radius):
+        """Return indices of features whose bounding box center lies within
+        <radius> meters of lon, lat, in input order
+        """
+        # bbox around the circle, then exact great-circle distances
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 89.999999))), 1e-12)
+        candidates = self.query_bbox(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+
+        boxes = self.levels[0][self.rank[candidates]]
+        clon = numpy.radians((boxes[:, 0] + boxes[:, 2]) / 2.0)
+        clat = numpy.radians((boxes[:, 1] + boxes[:, 3]) / 2.0)
+        a = (numpy.sin((clat - math.radians(lat)) / 2) ** 2 +
+             numpy.cos(clat) * math.cos(math.radians(lat)) * numpy.sin((clon - math.radians(lon)) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))
+        return candidates[distance <= radius]
+
+
+def fit_bounds(bounds, width=800, height=500, padding=20, tile_size=512):
+    """Return (center, zoom) that fit <bounds> in a map of the given pixel size
+
+    Parameters
+    ----------
+    bounds: (west, south, east, north) in degrees
+    width, height: map size in pixels
+    padding: margin in pixels kept around the bounds
+    tile_size: pixel size of a zoom 0 world
+    """
+    west, south, east, north = bounds
+    (x0, x1), (y1, y0) = lonlat_to_world(numpy.array([west, east], dtype=float),
+                                         numpy.array([south, north], dtype=float))
+    center = world_to_lonlat((x0 + x1) / 2.0, (y0 + y1) / 2.0)
+
+    dx, dy = max(x1 - x0, 1e-12), max(y1 - y0, 1e-12)
+    scale = min((width - 2 * padding) / (dx * tile_size), (height - 2 * padding) / (dy * tile_size))
+    zoom = min(max(math.log(max(scale, 1e-12), 2), 0), 22)
+    return (float(center[0]), float(center[1])), float(zoom)
@@ -0,0 +1,89 @@
+import asyncio
+import collections
+
+from .utils import df_to_geojson
+
+
+class PointStream(object):
+    """Append point batches to a displayed viz, coalescing updates to at most
+    <max_fps> pushes per second and keeping only the <max_features> most recent
+    points, both in the pending batch and on the map.
+    """
+
+    def __init__(self, viz, max_fps=4, max_features=10000, lat='lat', lon='lon'):
+        """Construct a PointStream
+
+        :param viz: a displayed viz with a GeoJSON source, e.g. CircleViz or HeatmapViz
+        :param max_fps: maximum number of updates sent to the map per second
+        :param max_features: number of most recent points kept on the map
+        :param lat: name of the latitude column of dataframe batches
+        :param lon: name of the longitude column of dataframe batches
+        """
+        self.viz = viz
+        self.interval = 1.0 / max_fps
+        self.max_features = max_features
+        self.lat = lat
+        self.lon = lon
+
+        # ring buffer of points received since the last update
+        self.pending = collections.deque(maxlen=max_features)
+        self.last_flush = None
+        self.timer = None
+        self.received = 0
+        self.frames = 0
+
+    def add(self, batch):
+        """Queue a batch (FeatureCollection, list of features or dataframe) and
+        send it now, or at the next frame if an update was sent recently; call
+        from a coroutine or callback running on the event loop"""
+        if isinstance(batch, dict):
+            features = batch['features']
+        elif isinstance(batch, list):
+            features = batch
+        else:
+            features = df_to_geojson(batch, lat=self.lat, lon=self.lon)['features']
+
+        self.pending.extend(features)
+        self.received += len(features)
+
+        if self.timer is None:
+            loop = asyncio.get_running_loop()
+            delay = 0 if self.last_flush is None else self.last_flush + self.interval - loop.time()
+            if delay <= 0:
+                self.flush()
+            else:
+                self.timer = loop.call_later(delay, self.flush)
+
+    def flush(self):
+        """Send the queued points to the map"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+
+        features = list(self.pending)
+        self.pending.clear()
+        self.viz.append(features, max_features=self.max_features)
+        self.last_flush = asyncio.get_running_loop().time()
+        self.frames += 1
+
+    async def consume(self, batches):
+        """Add every batch of an async iterator, sending the remaining points when it ends"""
+        try:
+            async for batch in batches:
+                self.add(batch)
+        finally:
+            self.flush()
+
+
+async def stream(viz, batches, **kwargs):
+    """Consume an async iterator of point batches, e.g. messages from an
+    asyncio.Queue, appending them to a displayed viz. Keyword arguments are
+    passed to PointStream. Returns the PointStream once the iterator ends.
+
+    In a notebook, run it in the background with asyncio.ensure_future(stream(viz, batches)).
+    """
+    point_stream = PointStream(viz, **kwargs)
+    await point_stream.consume(batches)
+    return point_stream
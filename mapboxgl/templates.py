@@ -1,12 +1,32 @@
-from jinja2 import Environment, PackageLoader, StrictUndefined
+from jinja2 import Environment, PackageLoader, StrictUndefined, nodes
 
 env = Environment(
     loader=PackageLoader('mapboxgl', 'templates'),
     autoescape=False,
-    undefined=StrictUndefined
+    undefined=StrictUndefined,
+    # packaged templates do not change at runtime; skip the modification check on every render
+    auto_reload=False
 )
 
 
 def format(viz, **kwargs):
     template = env.get_template('{}.html'.format(viz))
     return template.render(viz=viz, **kwargs)
+
+
+
+def format_block(viz, block, **kwargs):
+    """Render a single block of a viz template, e.g. only its map layers"""
+    template = env.get_template('{}.html'.format(viz))
+    context = template.new_context(dict(viz=viz, **kwargs))
+
+    # blocks the template inherits are only linked at render time; follow the extends chain
+    name = template.name
+    while name:
+        extends = env.parse(env.loader.get_source(env, name)[0]).find(nodes.Extends)
+        name = extends.template.value if extends else None
+        if name:
+            for key, render in env.get_template(name).blocks.items():
+                context.blocks.setdefault(key, []).append(render)
+
+    return u''.join(context.blocks[block][0](context))
@@ -0,0 +1,658 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import struct
+
+import numpy
+
+from .errors import SourceDataError
+
+
+# Web Mercator latitude limit
+MAX_LATITUDE = 85.0511287798
+
+# Pixels spanned by the world at zoom 0 in GL JS, which uses 512 pixel tiles
+WORLD_SIZE = 512
+
+# Geometry types and commands from the Mapbox Vector Tile specification
+POINT, LINESTRING, POLYGON = 1, 2, 3
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+
+
+def lonlat_to_world(lon, lat):
+    """Project longitude / latitude (scalars or ndarrays) to Web Mercator
+    world coordinates in the unit square, with y increasing southward
+    """
+    lon = numpy.asarray(lon, dtype=float)
+    lat = numpy.clip(numpy.asarray(lat, dtype=float), -MAX_LATITUDE, MAX_LATITUDE)
+    x = (lon + 180.0) / 360.0
+    sin = numpy.sin(numpy.radians(lat))
+    y = 0.5 - numpy.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return x, y
+
+
+def world_to_lonlat(x, y):
+    """Inverse of lonlat_to_world"""
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    lon = x * 360.0 - 180.0
+    lat = numpy.degrees(numpy.arctan(numpy.sinh(math.pi * (1 - 2 * y))))
+    return lon, lat
+
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Return the (x, y) index of the XYZ tile containing a point at zoom"""
+    x, y = lonlat_to_world(lon, lat)
+    n = 2 ** zoom
+    return (min(int(x * n), n - 1), min(int(y * n), n - 1))
+
+
+def tile_bounds(z, x, y):
+    """Return the (west, south, east, north) bounds of an XYZ tile"""
+    n = float(2 ** z)
+    west, north = world_to_lonlat(x / n, y / n)
+    east, south = world_to_lonlat((x + 1) / n, (y + 1) / n)
+    return (float(west), float(south), float(east), float(north))
+
+
+# single-byte varints, the common case for tags, lengths and point deltas
+_SMALL_VARINTS = [bytes((value,)) for value in range(128)]
+
+
+def _varint(value):
+    """Encode a non-negative integer as a protobuf varint"""
+    if value < 128:
+        return _SMALL_VARINTS[value]
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _length_delimited(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field, values):
+    return _length_delimited(field, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    """Encode a feature property value as a vector tile Value message"""
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, (int, numpy.integer)) and -2 ** 63 <= value < 2 ** 63:
+        return _key(6, 0) + _varint(_zigzag(int(value)))
+    if isinstance(value, (float, numpy.floating)):
+        return _key(3, 1) + struct.pack('<d', float(value))
+    if not isinstance(value, str):
+        value = json.dumps(value)
+    return _length_delimited(1, value.encode('utf-8'))
+
+
+def _encode_geometry(geom_type, parts):
+    """Encode tile-space integer geometry parts to a vector tile command stream"""
+    commands = []
+    cx = cy = 0
+
+    if geom_type == POINT:
+        commands.append(MOVE_TO | (len(parts) << 3))
+        for x, y in parts:
+            commands.extend([_zigzag(x - cx), _zigzag(y - cy)])
+            cx, cy = x, y
+        return commands
+
+    for part in parts:
+        commands.append(MOVE_TO | (1 << 3))
+        x, y = part[0]
+        commands.extend([_zigzag(x - cx), _zigzag(y - cy)])
+        cx, cy = x, y
+
+        # polygon rings are closed by ClosePath rather than a repeated vertex
+        vertices = part[1:-1] if geom_type == POLYGON else part[1:]
+        commands.append(LINE_TO | (len(vertices) << 3))
+        for x, y in vertices:
+            commands.extend([_zigzag(x - cx), _zigzag(y - cy)])
+            cx, cy = x, y
+
+        if geom_type == POLYGON:
+            commands.append(CLOSE_PATH | (1 << 3))
+
+    return commands
+
+
+def encode_vector_tile(layers, extent=4096):
+    """Encode a vector tile from a mapping of layer name to features, each a
+    tuple of (geometry type, tile-space geometry parts, properties, id)
+    """
+    tile = b''
+
+    for name, features in layers.items():
+        keys, values = {}, {}
+        encoded_features = []
+
+        for geom_type, parts, properties, feature_id in features:
+            tags = []
+            for key, value in properties.items():
+                if value is None:
+                    continue
+                tags.append(keys.setdefault(key, len(keys)))
+                if isinstance(value, (str, int, float)) and value == value:
+                    value_key = (type(value).__name__, value)
+                else:
+                    value_key = (type(value).__name__, json.dumps(value, sort_keys=True, default=str))
+                if value_key not in values:
+                    values[value_key] = (len(values), value)
+                tags.append(values[value_key][0])
+
+            feature = b''
+            if feature_id is not None:
+                feature += _key(1, 0) + _varint(feature_id)
+            if tags:
+                feature += _packed(2, tags)
+            feature += _key(3, 0) + _varint(geom_type)
+            feature += _packed(4, _encode_geometry(geom_type, parts))
+            encoded_features.append(_length_delimited(2, feature))
+
+        layer = _key(15, 0) + _varint(2)
+        layer += _length_delimited(1, name.encode('utf-8'))
+        layer += b''.join(encoded_features)
+        layer += b''.join(_length_delimited(3, key.encode('utf-8'))
+                          for key, _ in sorted(keys.items(), key=lambda item: item[1]))
+        layer += b''.join(_length_delimited(4, _encode_value(value))
+                          for _, value in sorted(values.values(), key=lambda item: item[0]))
+        layer += _key(5, 0) + _varint(extent)
+
+        tile += _length_delimited(3, layer)
+
+    return tile
+
+
+def _clip_line(line, minv, maxv):
+    """Clip a polyline to a square box, returning the pieces inside it"""
+    pieces = []
+    current = []
+
+    for (x0, y0), (x1, y1) in zip(line, line[1:]):
+        # Liang-Barsky segment clipping
+        t0, t1 = 0.0, 1.0
+        dx, dy = x1 - x0, y1 - y0
+        visible = True
+        for p, q in ((-dx, x0 - minv), (dx, maxv - x0), (-dy, y0 - minv), (dy, maxv - y0)):
+            if p == 0:
+                if q < 0:
+                    visible = False
+                    break
+            else:
+                t = q / p
+                if p < 0:
+                    t0 = max(t0, t)
+                else:
+                    t1 = min(t1, t)
+        if not visible or t0 > t1:
+            if current:
+                pieces.append(current)
+                current = []
+            continue
+
+        start = (x0 + t0 * dx, y0 + t0 * dy)
+        end = (x0 + t1 * dx, y0 + t1 * dy)
+        if not current:
+            current = [start]
+        current.append(end)
+        if t1 < 1.0:
+            pieces.append(current)
+            current = []
+
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _clip_ring(ring, minv, maxv):
+    """Clip a closed ring to a square box (Sutherland-Hodgman)"""
+    edges = (
+        (lambda p: p[0] >= minv, lambda a, b: _intersect_x(a, b, minv)),
+        (lambda p: p[0] <= maxv, lambda a, b: _intersect_x(a, b, maxv)),
+        (lambda p: p[1] >= minv, lambda a, b: _intersect_y(a, b, minv)),
+        (lambda p: p[1] <= maxv, lambda a, b: _intersect_y(a, b, maxv)))
+
+    output = ring[:-1] if ring and ring[0] == ring[-1] else list(ring)
+    for inside, intersect in edges:
+        points, output = output, []
+        for i, current in enumerate(points):
+            previous = points[i - 1]
+            if inside(current):
+                if not inside(previous):
+                    output.append(intersect(previous, current))
+                output.append(current)
+            elif inside(previous):
+                output.append(intersect(previous, current))
+        if not output:
+            return []
+
+    return output + output[:1]
+
+
+def _intersect_x(a, b, x):
+    t = (x - a[0]) / (b[0] - a[0])
+    return (x, a[1] + t * (b[1] - a[1]))
+
+
+def _intersect_y(a, b, y):
+    t = (y - a[1]) / (b[1] - a[1])
+    return (a[0] + t * (b[0] - a[0]), y)
+
+
+def _ring_area(ring):
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:])) / 2.0
+
+
+def _to_tile_space(parts, z, x, y, extent):
+    """Scale unit-square world coordinates into the integer space of tile z/x/y"""
+    n = 2 ** z
+    return [[(int(round((px * n - x) * extent)), int(round((py * n - y) * extent))) for px, py in part]
+            for part in parts]
+
+
+def _dedupe(part):
+    out = []
+    for point in part:
+        if not out or point != out[-1]:
+            out.append(point)
+    return out
+
+
+def _clip_feature(geom_type, parts, minv, maxv):
+    """Clip tile-space geometry parts; polygons are lists of rings per polygon"""
+    if geom_type == POINT:
+        return [p for p in parts if minv <= p[0] <= maxv and minv <= p[1] <= maxv]
+
+    if geom_type == LINESTRING:
+        clipped = []
+        for line in parts:
+            clipped.extend(_clip_line(line, minv, maxv))
+        return clipped
+
+    rings = []
+    for polygon in parts:
+        for i, ring in enumerate(polygon):
+            clipped = _clip_ring(ring, minv, maxv)
+            if len(clipped) < 4:
+                if i == 0:
+                    # drop the holes of polygons whose exterior is clipped away
+                    break
+                continue
+            rings.append((i == 0, clipped))
+    return rings
+
+
+def _geojson_features(data, points=None):
+    """Yield (geometry type, world-coordinate parts, properties, id) for GeoJSON features
+
+    With a points dict of lon, lat, properties and ids lists, single Point
+    features are appended to it instead, to be tiled with NumPy.
+    """
+    for index, feature in enumerate(data['features']):
+        geometry = feature.get('geometry')
+        if geometry is None:
+            continue
+
+        geom = geometry['type']
+        coords = geometry['coordinates']
+        feature_id = feature.get('id')
+        if not isinstance(feature_id, int) or feature_id < 0:
+            feature_id = index
+
+        if geom == 'Point' and points is not None:
+            points['lon'].append(coords[0])
+            points['lat'].append(coords[1])
+            points['properties'].append(feature.get('properties') or {})
+            points['ids'].append(feature_id)
+            continue
+        elif geom == 'Point':
+            geom_type, parts = POINT, [coords]
+        elif geom == 'MultiPoint':
+            geom_type, parts = POINT, coords
+        elif geom == 'LineString':
+            geom_type, parts = LINESTRING, [coords]
+        elif geom == 'MultiLineString':
+            geom_type, parts = LINESTRING, coords
+        elif geom == 'Polygon':
+            geom_type, parts = POLYGON, [coords]
+        elif geom == 'MultiPolygon':
+            geom_type, parts = POLYGON, coords
+        else:
+            raise SourceDataError('Vector tiles do not support {} geometries'.format(geom))
+
+        def project(points):
+            x, y = lonlat_to_world([p[0] for p in points], [p[1] for p in points])
+            return list(zip(x.tolist(), y.tolist()))
+
+        if geom_type == POINT:
+            world = project(parts)
+        elif geom_type == LINESTRING:
+            world = [project(line) for line in parts]
+        else:
+            world = [[project(ring) for ring in polygon] for polygon in parts]
+
+        yield geom_type, world, feature.get('properties') or {}, feature_id
+
+
+def _feature_world_bounds(geom_type, world):
+    if geom_type == POINT:
+        points = world
+    elif geom_type == LINESTRING:
+        points = [p for line in world for p in line]
+    else:
+        points = [p for polygon in world for p in polygon[0]]
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _source_hash(data, layer_name, min_zoom, max_zoom, extent, buffer):
+    """Hash of the tiling inputs, used to reuse tiles already cached on disk"""
+    md5 = hashlib.md5(json.dumps([layer_name, min_zoom, max_zoom, extent, buffer]).encode('utf-8'))
+    try:
+        import pandas
+        if isinstance(data, pandas.DataFrame):
+            md5.update(pandas.util.hash_pandas_object(data, index=True).values.tobytes())
+            md5.update(json.dumps([str(c) for c in data.columns]).encode('utf-8'))
+            return md5.hexdigest()
+    except ImportError:
+        pass
+    md5.update(json.dumps(data, sort_keys=True, default=str).encode('utf-8'))
+    return md5.hexdigest()
+
+
+def _point_tiles(points, z, extent, buffer, cell=None):
+    """Assign single points to the tiles of zoom z with NumPy
+
+    Returns {(x, y): (indices, tile x, tile y)} with integer tile-space
+    coordinates, in feature order within each tile. With a cell size, only
+    the first point of each cell of a tile is kept.
+    """
+    if not len(points['x']):
+        return {}
+
+    n = 2 ** z
+    pad = float(buffer) / extent
+    x, y = points['x'] * n, points['y'] * n
+    x0 = numpy.clip(numpy.floor(x - pad), 0, n - 1).astype(numpy.int64)
+    y0 = numpy.clip(numpy.floor(y - pad), 0, n - 1).astype(numpy.int64)
+    x1 = numpy.clip(numpy.floor(x + pad), 0, n - 1).astype(numpy.int64)
+    y1 = numpy.clip(numpy.floor(y + pad), 0, n - 1).astype(numpy.int64)
+
+    # a point lies in the buffer of at most one neighboring tile in each direction
+    everywhere = numpy.ones(len(x), dtype=bool)
+    indices, tx, ty = [], [], []
+    for tile_x, tile_y, mask in ((x0, y0, everywhere), (x1, y0, x1 != x0), (x0, y1, y1 != y0),
+                                 ((x1, y1, (x1 != x0) & (y1 != y0)))):
+        selected = numpy.flatnonzero(mask)
+        indices.append(selected)
+        tx.append(tile_x[selected])
+        ty.append(tile_y[selected])
+    indices, tx, ty = numpy.concatenate(indices), numpy.concatenate(tx), numpy.concatenate(ty)
+
+    px = numpy.rint((x[indices] - tx) * extent).astype(numpy.int64)
+    py = numpy.rint((y[indices] - ty) * extent).astype(numpy.int64)
+    inside = (px >= -buffer) & (px <= extent + buffer) & (py >= -buffer) & (py <= extent + buffer)
+    indices, tx, ty, px, py = indices[inside], tx[inside], ty[inside], px[inside], py[inside]
+
+    # group by tile, keeping feature order within a tile
+    tile_key = tx * n + ty
+    order = numpy.lexsort((indices, tile_key))
+    indices, tx, ty, px, py, tile_key = indices[order], tx[order], ty[order], px[order], py[order], tile_key[order]
+
+    if cell:
+        # keep the first point of each cell; cells span the buffered tile
+        offset = buffer // cell + 1
+        size = (extent + 2 * buffer) // cell + 3
+        cell_key = (tile_key * size + px // cell + offset) * size + py // cell + offset
+        keep = numpy.sort(numpy.unique(cell_key, return_index=True)[1])
+        indices, tx, ty, px, py, tile_key = indices[keep], tx[keep], ty[keep], px[keep], py[keep], tile_key[keep]
+
+    starts = numpy.concatenate([[0], numpy.flatnonzero(numpy.diff(tile_key)) + 1, [len(tile_key)]])
+    return dict(((int(tx[start]), int(ty[start])), (indices[start:stop], px[start:stop], py[start:stop]))
+                for start, stop in zip(starts[:-1], starts[1:]))
+
+
+def generate_vector_tiles(data,
+                          directory,
+                          layer_name='data',
+                          min_zoom=0,
+                          max_zoom=14,
+                          lat='lat',
+                          lon='lon',
+                          properties=None,
+                          extent=4096,
+                          buffer=64,
+                          thin_points=True,
+                          overwrite=False):
+    """Cut a GeoJSON FeatureCollection or a Pandas dataframe of points into
+    Mapbox Vector Tiles written to <directory>/z/x/y.pbf
+
+    Tiles from a previous call with identical inputs are reused unless
+    overwrite is True.
+
+    Parameters
+    ----------
+    data: GeoJSON FeatureCollection or Pandas dataframe with point coordinates
+    directory: output directory for the z/x/y tile tree and metadata.json
+    layer_name: name of the vector tile layer (use as MapViz vector_layer_name)
+    min_zoom, max_zoom: zoom range of generated tiles
+    lat, lon: dataframe coordinate columns
+    properties: dataframe columns to include as feature properties
+    extent: integer extent of the tile coordinate space
+    buffer: tile-space buffer around each tile for clipping
+    thin_points: below max_zoom, keep one point per 1/256th of a tile so low zoom tiles stay small
+    overwrite: regenerate tiles even if the cached tiles match the inputs
+    """
+    source_hash = _source_hash(data, layer_name, min_zoom, max_zoom, extent, buffer)
+    metadata_path = os.path.join(directory, 'metadata.json')
+
+    if not overwrite and os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        if metadata.get('source_hash') == source_hash:
+            return metadata
+
+    # clear tiles from a previous run so no stale tiles are served
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.isdigit():
+                shutil.rmtree(os.path.join(directory, name))
+
+    if isinstance(data, dict):
+        points = dict(lon=[], lat=[], properties=[], ids=[])
+        features = list(_geojson_features(data, points))
+        points = dict(points, properties=points['properties'], ids=numpy.array(points['ids'], dtype=numpy.int64))
+        points['x'], points['y'] = lonlat_to_world(points.pop('lon'), points.pop('lat'))
+        bounds = [_feature_world_bounds(g, w) for g, w, _, _ in features]
+        if bounds:
+            minx, miny, maxx, maxy = numpy.array(bounds).T
+        else:
+            minx = miny = maxx = maxy = numpy.zeros(0)
+    else:
+        if not properties:
+            properties = [c for c in data.columns if c not in [lon, lat]]
+        wx, wy = lonlat_to_world(data[lon].values, data[lat].values)
+        records = json.loads(data[properties].to_json(orient='records', date_unit='s'))
+        points = dict(x=wx, y=wy, properties=records, ids=numpy.arange(len(wx), dtype=numpy.int64))
+        features = []
+        minx = miny = maxx = maxy = numpy.zeros(0)
+
+    world_bounds = (numpy.concatenate([minx, points['x']]), numpy.concatenate([miny, points['y']]),
+                    numpy.concatenate([maxx, points['x']]), numpy.concatenate([maxy, points['y']]))
+
+    tile_count = 0
+    pad = float(buffer) / extent
+    cell = extent // 256
+
+    for z in range(min_zoom, max_zoom + 1):
+        n = 2 ** z
+        thin = thin_points and z < max_zoom
+
+        # assign each line, polygon and multipoint to the tiles overlapping its buffered bounds
+        x0 = numpy.clip(numpy.floor(minx * n - pad), 0, n - 1).astype(int)
+        y0 = numpy.clip(numpy.floor(miny * n - pad), 0, n - 1).astype(int)
+        x1 = numpy.clip(numpy.floor(maxx * n + pad), 0, n - 1).astype(int)
+        y1 = numpy.clip(numpy.floor(maxy * n + pad), 0, n - 1).astype(int)
+
+        tiles = {}
+        for i in range(len(features)):
+            for tx in range(x0[i], x1[i] + 1):
+                for ty in range(y0[i], y1[i] + 1):
+                    tiles.setdefault((tx, ty), []).append(i)
+
+        point_tiles = _point_tiles(points, z, extent, buffer, cell if thin else None)
+
+        for tx, ty in sorted(set(tiles) | set(point_tiles)):
+            tile_features = []
+            occupied = set()
+            for i in tiles.get((tx, ty), []):
+                geom_type, world, props, feature_id = features[i]
+                if geom_type == POINT:
+                    parts = _to_tile_space([world], z, tx, ty, extent)[0]
+                    if thin:
+                        cells = set((px // cell, py // cell) for px, py in parts)
+                        if cells <= occupied:
+                            continue
+                        occupied.update(cells)
+                elif geom_type == LINESTRING:
+                    parts = _to_tile_space(world, z, tx, ty, extent)
+                else:
+                    parts = [_to_tile_space(polygon, z, tx, ty, extent) for polygon in world]
+
+                clipped = _clip_feature(geom_type, parts, -buffer, extent + buffer)
+                if geom_type == LINESTRING:
+                    clipped = [_dedupe(_to_int(line)) for line in clipped]
+                    clipped = [line for line in clipped if len(line) > 1]
+                elif geom_type == POLYGON:
+                    rings = []
+                    for exterior, ring in clipped:
+                        ring = _dedupe(_to_int(ring))
+                        if len(ring) < 4 or _ring_area(ring) == 0:
+                            continue
+                        # exterior rings wind clockwise (positive area) in tile space
+                        if (_ring_area(ring) > 0) != exterior:
+                            ring = ring[::-1]
+                        rings.append(ring)
+                    clipped = rings
+                if clipped:
+                    tile_features.append((geom_type, clipped, props, feature_id))
+
+            if (tx, ty) in point_tiles:
+                indices, px, py = point_tiles[(tx, ty)]
+                tile_features.extend((POINT, [(x, y)], points['properties'][i], feature_id)
+                                     for i, x, y, feature_id in zip(indices.tolist(), px.tolist(), py.tolist(),
+                                                                    points['ids'][indices].tolist()))
+
+            if not tile_features:
+                continue
+
+            path = os.path.join(directory, str(z), str(tx))
+            if not os.path.exists(path):
+                os.makedirs(path)
+            with open(os.path.join(path, '{}.pbf'.format(ty)), 'wb') as f:
+                f.write(encode_vector_tile({layer_name: tile_features}, extent))
+            tile_count += 1
+
+    if len(world_bounds[0]):
+        west, north = world_to_lonlat(world_bounds[0].min(), world_bounds[1].min())
+        east, south = world_to_lonlat(world_bounds[2].max(), world_bounds[3].max())
+        bounds = [float(west), float(south), float(east), float(north)]
+    else:
+        bounds = [-180, -MAX_LATITUDE, 180, MAX_LATITUDE]
+
+    metadata = {
+        'type': 'directory',
+        'directory': directory,
+        'format': 'pbf',
+        'layer_name': layer_name,
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': bounds,
+        'tile_count': tile_count,
+        'vector_layers': [{'id': layer_name, 'minzoom': min_zoom, 'maxzoom': max_zoom}],
+        'source_hash': source_hash
+    }
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f)
+
+    return metadata
+
+
+def _to_int(points):
+    return [(int(round(x)), int(round(y))) for x, y in points]
+
+
+def native_zoom(array, bounds, tile_size=256):
+    """Lowest zoom at which tile pixels are at least as fine as the pixels of
+    an array covering bounds (west, south, east, north)
+    """
+    west, south, east, north = bounds
+    x0, y0 = lonlat_to_world(west, north)
+    x1, y1 = lonlat_to_world(east, south)
+    pixel_size = min(float(x1 - x0) / array.shape[1], float(y1 - y0) / array.shape[0])
+    return max(0, int(math.ceil(math.log(1.0 / (pixel_size * tile_size), 2))))
+
+
+def array_tile(array, bounds, z, x, y, tile_size=256):
+    """Resample the part of a lon/lat-gridded array covering XYZ tile z/x/y to
+    Web Mercator by nearest neighbor, reading only the sampled pixels so that
+    memory-mapped arrays are not loaded in full.
+
+    Returns a (tile_size, tile_size, ...) array and a boolean mask of valid
+    pixels, or None if the tile does not overlap the array bounds.
+
+    Parameters
+    ----------
+    array: ndarray (rows, cols) or (rows, cols, bands), rows ordered north to south
+    bounds: (west, south, east, north) of the array in degrees
+    z, x, y: tile index
+    tile_size: tile width and height in pixels
+    """
+    west, south, east, north = bounds
+    rows, cols = array.shape[:2]
+
+    tile_west, tile_south, tile_east, tile_north = tile_bounds(z, x, y)
+    if tile_west >= east or tile_east <= west or tile_south >= north or tile_north <= south:
+        return None
+
+    # lon / lat of tile pixel centers
+    n = 2 ** z
+    offsets = (numpy.arange(tile_size) + 0.5) / tile_size
+    lon, _ = world_to_lonlat((x + offsets) / n, 0)
+    _, lat = world_to_lonlat(0, (y + offsets) / n)
+
+    col = numpy.floor((lon - west) / (east - west) * cols).astype(int)
+    row = numpy.floor((north - lat) / (north - south) * rows).astype(int)
+    col_valid = (col >= 0) & (col < cols)
+    row_valid = (row >= 0) & (row < rows)
+
+    # the projection is separable, so sample a grid of rows x cols
+    tile = numpy.zeros((tile_size, tile_size) + array.shape[2:], dtype=array.dtype)
+    tile[numpy.ix_(row_valid, col_valid)] = array[numpy.ix_(row[row_valid], col[col_valid])]
+    mask = numpy.outer(row_valid, col_valid)
+
+    return tile, mask
@@ -3,15 +3,23 @@ import codecs
 import datetime
 from io import BytesIO
 import json
+import math
 import re
 from chroma import Color, Scale
 from colour import Color as Colour
 import geojson
 from matplotlib.image import imsave
+import numpy
 import requests
 
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
 from .colors import color_ramps, common_html_colors
 from .errors import SourceDataError, DateConversionError
+from .tiles import WORLD_SIZE
 
 
 def row_to_geojson(row, lon, lat, precision, date_format='epoch'):
@@ -24,8 +32,22 @@ def row_to_geojson(row, lon, lat, precision, date_format='epoch'):
                            properties={key: row_json[key] for key in row_json.keys() if key not in [lon, lat]})
 
 
-def df_to_geojson(df, properties=None, lat='lat', lon='lon', precision=6, date_format='epoch', filename=None):
+def precision_for_zoom(max_zoom):
+    """Number of decimal places of longitude / latitude degrees that resolve
+    half a pixel at <max_zoom>, the finest detail a map shows at that zoom
+    """
+    half_pixel = 360.0 / (WORLD_SIZE * 2 ** max_zoom) / 2
+    return max(0, int(math.ceil(-math.log10(half_pixel))))
+
+
+def df_to_geojson(df, properties=None, lat='lat', lon='lon', precision=6, date_format='epoch', filename=None,
+                  max_zoom=None, collapse_duplicates=False, weight_property='weight'):
     """Serialize a Pandas dataframe to a geojson format Python dictionary / file
+
+    With precision='auto' coordinates are rounded to the decimal places that
+    resolve <max_zoom>, the max_zoom of the viz showing the data, which is
+    then required. With collapse_duplicates, rows that are identical after
+    rounding are emitted once with their count in <weight_property>.
     """
 
     if not properties:
@@ -44,6 +66,22 @@ def df_to_geojson(df, properties=None, lat='lat', lon='lon', precision=6, date_f
     # convert dates/datetimes to preferred string format if specified
     df = convert_date_columns(df, date_format)
 
+    if precision == 'auto':
+        if max_zoom is None:
+            raise ValueError("precision='auto' requires the max_zoom of the viz showing the data")
+        precision = precision_for_zoom(max_zoom)
+
+    if collapse_duplicates:
+        if weight_property in properties:
+            raise ValueError('weight_property cannot be one of the properties')
+
+        # merge rows whose rounded coordinates and properties are identical
+        df = df[[lon, lat] + properties].copy()
+        df[lon] = df[lon].round(precision)
+        df[lat] = df[lat].round(precision)
+        df = df.groupby([lon, lat] + properties, sort=False, dropna=False).size().reset_index(name=weight_property)
+        properties = properties + [weight_property]
+
     if filename:
         with open(filename, 'w') as f:
             # Overwrite file if it already exists
@@ -95,6 +133,19 @@ def geojson_to_dict_list(data):
     return [feature['properties'] for feature in features]
 
 
+def load_geojson(data):
+    """Return GeoJSON given as a Python dict, local file address or URL as a Python dict"""
+    if isinstance(data, dict):
+        return data
+
+    try:
+        with open(data, 'r') as f:
+            return json.load(f)
+
+    except IOError:
+        return requests.get(data).json()
+
+
 def gdf_to_geojson(gdf, date_format='epoch', properties=None, filename=None):
     """Serialize a GeoPandas dataframe to a geojson format Python dictionary / file
     """
@@ -380,21 +431,79 @@ def numeric_map(lookup, numeric_stops, default=0.0):
     return default
 
 
+def _pixel_stride(rows, cols, max_pixels=None):
+    """Return the stride that downscales a rows x cols image to at most max_pixels pixels"""
+    if not max_pixels or rows * cols <= max_pixels:
+        return 1
+    return int(math.ceil(math.sqrt(float(rows * cols) / max_pixels)))
+
+
+def read_window(arr, window=None, max_pixels=None):
+    """Read a window of an array, decimated by the same striding as img_bytes
+    so that the output has at most max_pixels pixels. Only the sampled rows and
+    columns are read, so memory-mapped arrays are never loaded in full.
+
+    Parameters
+    ----------
+    arr: ndarray or numpy.memmap (rows, cols, depth)
+    window: (row_start, row_stop, col_start, col_stop); the whole array by default
+    max_pixels: maximum number of output pixels (rows * cols)
+    """
+    row_start, row_stop, col_start, col_stop = window or (0, arr.shape[0], 0, arr.shape[1])
+    step = _pixel_stride(row_stop - row_start, col_stop - col_start, max_pixels)
+
+    return numpy.array(arr[row_start:row_stop:step, col_start:col_stop:step])
+
+
+def img_bytes(arr, format='png', compress_level=6, quality=85, max_pixels=None, **kwargs):
+    """Encode ndarray to image file bytes
+
+    uint8 RGB / RGBA arrays are written directly with Pillow; other arrays, or
+    calls with matplotlib options such as cmap, vmin or vmax, are normalized
+    and colormapped by matplotlib.image.imsave.
+
+    Parameters
+    ----------
+    arr: ndarray (rows, cols, depth)
+    format: image format; one of 'png', 'jpeg' or 'webp'
+    compress_level: zlib compression level for PNG output (0-9, lower is faster)
+    quality: quality of lossy JPEG / WebP output (1-100)
+    max_pixels: if set, downscale arr by striding until rows * cols is within this budget
+    kwargs: passed directly to matplotlib.image.imsave
+    """
+    step = _pixel_stride(arr.shape[0], arr.shape[1], max_pixels)
+    if step > 1:
+        arr = arr[::step, ::step]
+
+    sio = BytesIO()
+
+    if Image is not None and not kwargs and arr.dtype == numpy.uint8 and arr.ndim == 3 and arr.shape[2] in (3, 4):
+        image = Image.fromarray(numpy.ascontiguousarray(arr))
+        if format in ('jpg', 'jpeg'):
+            # JPEG has no alpha channel
+            image.convert('RGB').save(sio, format='jpeg', quality=quality)
+        elif format == 'webp':
+            image.save(sio, format='webp', quality=quality)
+        else:
+            image.save(sio, format=format, compress_level=compress_level)
+    else:
+        imsave(sio, arr, format=format, **kwargs)
+
+    return sio.getvalue()
+
+
 def img_encode(arr, **kwargs):
     """Encode ndarray to base64 string image data
     
     Parameters
     ----------
     arr: ndarray (rows, cols, depth)
-    kwargs: passed directly to matplotlib.image.imsave
+    kwargs: passed to img_bytes (format, compress_level, quality, max_pixels) and matplotlib.image.imsave
     """
-    sio = BytesIO()
-    imsave(sio, arr, **kwargs)
-    sio.seek(0)
     img_format = kwargs['format'] if kwargs.get('format') else 'png'
-    img_str = base64.b64encode(sio.getvalue()).decode()
+    img_str = base64.b64encode(img_bytes(arr, **kwargs)).decode()
 
-    return 'data:image/{};base64,{}'.format(img_format, img_str)
+    return 'data:image/{};base64,{}'.format('jpeg' if img_format == 'jpg' else img_format, img_str)
 
 
 def height_map(lookup, height_stops, default_height=0.0):
@@ -458,3 +567,154 @@ def height_map(lookup, height_stops, default_height=0.0):
 
     # default height value catch-all
     return default_height
+
+
+def geojson_to_topojson(data, quantization=1e5, object_name='data'):
+    """Encode a GeoJSON FeatureCollection of polygons as a TopoJSON topology.
+    Borders shared by adjacent polygons are stored once as arcs, and arcs are
+    quantized to an integer grid and delta-encoded.
+
+    Parameters
+    ----------
+    data: GeoJSON FeatureCollection (object, local file or URL) containing Polygon or MultiPolygon features
+    quantization: number of distinct values along each axis of the integer grid
+    object_name: key of the GeometryCollection in the topology's objects
+    """
+    # read from data defined as local file address or URL
+    if not isinstance(data, dict):
+        try:
+            with open(data, 'r') as f:
+                data = json.load(f)
+        except IOError:
+            data = requests.get(data).json()
+
+    features = data['features']
+
+    # bounding box of all polygon vertices for the quantization transform
+    xs, ys = [], []
+    for feature in features:
+        for polygon in _polygon_rings(feature.get('geometry')):
+            for ring in polygon:
+                for point in ring:
+                    xs.append(point[0])
+                    ys.append(point[1])
+
+    x0, y0 = (min(xs), min(ys)) if xs else (0, 0)
+    x1, y1 = (max(xs), max(ys)) if xs else (0, 0)
+    n = int(quantization)
+    kx = (x1 - x0) / (n - 1) if x1 > x0 else 1
+    ky = (y1 - y0) / (n - 1) if y1 > y0 else 1
+
+    def quantize_ring(ring):
+        points = []
+        for point in ring:
+            q = (int(round((point[0] - x0) / kx)), int(round((point[1] - y0) / ky)))
+            if not points or q != points[-1]:
+                points.append(q)
+        # store rings open, without the closing vertex
+        if len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+        return points
+
+    # quantize each ring of each feature, keeping the geometry nesting
+    geometries = []
+    for feature in features:
+        geometry = feature.get('geometry')
+        geometries.append([[quantize_ring(ring) for ring in polygon]
+                           for polygon in _polygon_rings(geometry)])
+
+    # a vertex is a junction if it is visited with different neighbors
+    neighbors = {}
+    junctions = set()
+    for polygons in geometries:
+        for polygon in polygons:
+            for ring in polygon:
+                for i, point in enumerate(ring):
+                    pair = tuple(sorted([ring[i - 1], ring[(i + 1) % len(ring)]]))
+                    if neighbors.setdefault(point, pair) != pair:
+                        junctions.add(point)
+
+    arcs = []
+    arc_index = {}
+
+    def index_arc(arc):
+        key = tuple(arc)
+        if key in arc_index:
+            return arc_index[key]
+        reversed_key = key[::-1]
+        if reversed_key in arc_index:
+            return ~arc_index[reversed_key]
+        arc_index[key] = len(arcs)
+        arcs.append(arc)
+        return arc_index[key]
+
+    def encode_ring(ring):
+        cuts = [i for i, point in enumerate(ring) if point in junctions]
+
+        if not cuts:
+            # rings without junctions are rotated to a canonical start vertex so
+            # that identical rings (e.g. a hole filled by an island) share an arc
+            start = ring.index(min(ring))
+            rotated = ring[start:] + ring[:start]
+            return [index_arc(rotated + rotated[:1])]
+
+        rotated = ring[cuts[0]:] + ring[:cuts[0]] + [ring[cuts[0]]]
+        indices = []
+        arc = [rotated[0]]
+        for point in rotated[1:]:
+            arc.append(point)
+            if point in junctions:
+                indices.append(index_arc(arc))
+                arc = [point]
+        return indices
+
+    topology_geometries = []
+    for feature, polygons in zip(features, geometries):
+        geometry = feature.get('geometry')
+        topology_geometry = {'properties': feature.get('properties') or {}}
+        if 'id' in feature:
+            topology_geometry['id'] = feature['id']
+
+        if geometry is None:
+            topology_geometry['type'] = None
+        elif geometry['type'] == 'Polygon':
+            topology_geometry['type'] = 'Polygon'
+            topology_geometry['arcs'] = [encode_ring(ring) for ring in polygons[0]]
+        else:
+            topology_geometry['type'] = 'MultiPolygon'
+            topology_geometry['arcs'] = [[encode_ring(ring) for ring in polygon]
+                                         for polygon in polygons]
+
+        topology_geometries.append(topology_geometry)
+
+    # delta-encode quantized arc positions
+    delta_arcs = []
+    for arc in arcs:
+        delta = [list(arc[0])]
+        for (px, py), (x, y) in zip(arc, arc[1:]):
+            delta.append([x - px, y - py])
+        delta_arcs.append(delta)
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [kx, ky], 'translate': [x0, y0]},
+        'objects': {
+            object_name: {
+                'type': 'GeometryCollection',
+                'geometries': topology_geometries
+            }
+        },
+        'arcs': delta_arcs
+    }
+
+
+def _polygon_rings(geometry):
+    """Return the rings of a Polygon or MultiPolygon geometry as a list of polygons"""
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise SourceDataError('TopoJSON encoding supports Polygon and MultiPolygon features only, '
+                          'not {}'.format(geometry['type']))
@@ -0,0 +1,96 @@
+import json
+import uuid
+
+import numpy
+
+from .spatial import SpatialIndex
+from .tiles import WORLD_SIZE, lonlat_to_world
+
+
+class ViewportSource(object):
+    """Serve the points of a Pandas dataframe to a displayed map one viewport
+    at a time. Pass it as the data of a viz; after every move the map sends its
+    bounds and zoom to the kernel over a Jupyter comm and is answered with the
+    points in view, thinned to at most one per <cell_size> pixels and at most
+    <max_features> points.
+
+    Requires the classic Jupyter Notebook, which exposes the kernel to the
+    map's iframe.
+    """
+
+    def __init__(self, df, lat='lat', lon='lon', properties=None, max_features=5000, cell_size=4,
+                 precision=6, date_format='epoch'):
+        """Construct a ViewportSource
+
+        :param df: Pandas dataframe with lat / lon columns
+        :param lat: name of the latitude column
+        :param lon: name of the longitude column
+        :param properties: list of columns to include as feature properties; all columns by default
+        :param max_features: maximum number of points sent for one viewport
+        :param cell_size: grid cell size in pixels used to thin dense viewports
+        :param precision: number of decimal places in output coordinates
+        :param date_format: 'epoch' or 'iso' serialization of date columns
+        """
+        self.df = df
+        self.lat = lat
+        self.lon = lon
+        self.properties = properties or [c for c in df.columns if c not in [lon, lat]]
+        self.max_features = max_features
+        self.cell_size = cell_size
+        self.precision = precision
+        self.date_format = date_format
+        self.index = SpatialIndex.from_points(df[lon].values, df[lat].values)
+        self.target_name = None
+
+    def query(self, bounds, zoom):
+        """Return a GeoJSON FeatureCollection of the points within bounds
+        (west, south, east, north), thinned for display at zoom
+        """
+        rows = self.index.query_bbox(*bounds)
+
+        if len(rows) > self.max_features:
+            # one point per grid cell at the requested zoom, then an even subset
+            x, y = lonlat_to_world(self.index.levels[0][self.index.rank[rows], 0],
+                                   self.index.levels[0][self.index.rank[rows], 1])
+            size = self.cell_size / float(WORLD_SIZE * 2 ** zoom)
+            keys = numpy.floor(x / size).astype(numpy.int64) * (2 ** 31) + numpy.floor(y / size).astype(numpy.int64)
+            _, first = numpy.unique(keys, return_index=True)
+            rows = rows[numpy.sort(first)]
+            if len(rows) > self.max_features:
+                rows = rows[numpy.linspace(0, len(rows) - 1, self.max_features).astype(numpy.int64)]
+
+        subset = self.df.iloc[rows]
+        records = json.loads(subset[self.properties].to_json(orient='records', date_format=self.date_format,
+                                                             date_unit='s'))
+        coordinates = numpy.round(subset[[self.lon, self.lat]].values.astype(float), self.precision).tolist()
+        return {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': c}, 'properties': p}
+            for c, p in zip(coordinates, records)]}
+
+    def handle_message(self, comm, msg):
+        """Answer a viewport request from the map"""
+        request = msg['content']['data']
+        data = self.query(request['bounds'], request['zoom'])
+        comm.send({'id': request.get('id'), 'data': data})
+
+    def register(self):
+        """Register the comm target the map connects to with the running IPython
+        kernel, once. Returns the target name, or None outside of a kernel.
+        """
+        if self.target_name is not None:
+            return self.target_name
+
+        try:
+            from IPython import get_ipython
+            kernel = get_ipython().kernel
+        except AttributeError:
+            return None
+
+        target_name = 'mapboxgl-viewport-{}'.format(uuid.uuid4().hex)
+
+        def open_comm(comm, open_msg):
+            comm.on_msg(lambda msg: self.handle_message(comm, msg))
+
+        kernel.comm_manager.register_target(target_name, open_comm)
+        self.target_name = target_name
+        return target_name
@@ -1,14 +1,23 @@
 import codecs
+import copy
 import json
+import math
 import os
+import uuid
 
-from IPython.core.display import HTML, display
+from IPython.core.display import HTML, Javascript, display
 
 import numpy
 import requests
 
-from mapboxgl.errors import TokenError, LegendError
-from mapboxgl.utils import color_map, numeric_map, img_encode, geojson_to_dict_list
+from mapboxgl.assets import asset_options
+from mapboxgl.cluster import supercluster, zoom_levels
+from mapboxgl.errors import TokenError, LegendError, SourceDataError
+from mapboxgl.registry import registry
+from mapboxgl.spatial import SpatialIndex, fit_bounds
+from mapboxgl.viewport import ViewportSource
+from mapboxgl.utils import (color_map, numeric_map, img_encode, df_to_geojson, geojson_to_dict_list,
+                            geojson_to_topojson, load_geojson, read_window)
 from mapboxgl import templates
 
 
@@ -17,16 +26,24 @@ GL_JS_VERSION = 'v1.5.0'
 
 class VectorMixin(object):
 
+    def join_rows(self):
+        """Join data as a list of dicts; a filename or URL is parsed once and
+        kept out of self.data so that rendering leaves the viz unchanged"""
+        if type(self.data) == str:
+            return self.memoize('join_rows', ('data',), lambda: geojson_to_dict_list(self.data))
+        return self.data
+
     def generate_vector_color_map(self):
         """Generate color stops array for use with match expression in mapbox template"""
-        vector_stops = []
+        return self.memoize('vector_color_map',
+                            ('data', 'color_property', 'color_stops', 'color_default', 'data_join_property'),
+                            self._generate_vector_color_map)
 
-        # if join data specified as filename or URL, parse JSON to list of Python dicts
-        if type(self.data) == str:
-            self.data = geojson_to_dict_list(self.data)
+    def _generate_vector_color_map(self):
+        vector_stops = []
 
-        # loop through features in self.data to create join-data map
-        for row in self.data:
+        # loop through features in the join data to create join-data map
+        for row in self.join_rows():
             
             # map color to JSON feature using color_property
             color = color_map(row[self.color_property], self.color_stops, self.color_default)
@@ -38,6 +55,12 @@ class VectorMixin(object):
 
     def generate_vector_numeric_map(self, numeric_property):
         """Generate stops array for use with match expression in mapbox template"""
+        dependencies = ['data', 'data_join_property'] + ['{}_{}'.format(numeric_property, name) for name in
+                                                         ('function_type', 'property', 'stops', 'default')]
+        return self.memoize('vector_{}_map'.format(numeric_property), dependencies,
+                            lambda: self._generate_vector_numeric_map(numeric_property))
+
+    def _generate_vector_numeric_map(self, numeric_property):
         vector_stops = []
         
         function_type = getattr(self, '{}_function_type'.format(numeric_property))
@@ -48,11 +71,7 @@ class VectorMixin(object):
         if function_type == 'match':
             match_width = numeric_stops
 
-        # if join data specified as filename or URL, parse JSON to list of Python dicts
-        if type(self.data) == str:
-            self.data = geojson_to_dict_list(self.data)
-
-        for row in self.data:
+        for row in self.join_rows():
 
             # map value to JSON feature using the numeric property
             value = numeric_map(row[lookup_property], numeric_stops, default)
@@ -122,10 +141,15 @@ class MapViz(object):
                  scale_background_color='white',
                  scale_text_color='#131516',
                  popup_open_action='hover',
-                 add_snapshot_links=False):
+                 add_snapshot_links=False,
+                 progressive_chunk_size=None,
+                 share_data=False,
+                 assets='cdn',
+                 render_cache=None,
+                 incremental=False):
         """Construct a MapViz object
 
-        :param data: GeoJSON Feature Collection
+        :param data: GeoJSON Feature Collection, or a ViewportSource to load the points in view from the kernel
         :param vector_url: optional property to define vector data source
         :param vector_layer_name: property to define target layer of vector source
         :param vector_join_property: property to aid in determining color for styling vector layer
@@ -171,6 +195,16 @@ class MapViz(object):
         :param scale_text_color: text color the scale annotation
         :param popup_open_action: controls behavior of opening and closing feature popups; one of 'hover' or 'click'
         :param add_snapshot_links: boolean switch for adding buttons to download screen captures of map or legend
+        :param progressive_chunk_size: number of features drawn first; the remaining features are added in
+                                       chunks of doubling size across animation frames
+        :param share_data: show() injects the data into the notebook page once per distinct dataset and maps
+                           refer to it by content hash instead of embedding a copy
+        :param assets: where maps load GL JS and html2canvas from: 'cdn', 'inline' to embed them from a local
+                       cache (once per notebook with show()), or a mapboxgl.server.TileServer serving the cache
+        :param render_cache: optional mapboxgl.cache.RenderCache returning the html of an unchanged viz from disk
+        :param incremental: reuse the data-derived parts of the last render (serialized data, clusters, stops)
+                            until data is assigned, grows or shrinks, or its file changes; call invalidate()
+                            after editing data in place
 
         """
         if access_token is None:
@@ -181,6 +215,13 @@ class MapViz(object):
                              'If you already have an account, you can retreive your token at https://www.mapbox.com/account/.')
         self.access_token = access_token
 
+        # viewport sources send data to the displayed map on demand
+        if isinstance(data, ViewportSource):
+            self.viewport_source = data
+            data = {'type': 'FeatureCollection', 'features': []}
+        else:
+            self.viewport_source = None
+
         self.data = data
         
         self.vector_url = vector_url
@@ -232,6 +273,11 @@ class MapViz(object):
         self.legend_key_borders_on = legend_key_borders_on
         self.popup_open_action = popup_open_action
         self.add_snapshot_links = add_snapshot_links
+        self.progressive_chunk_size = progressive_chunk_size
+        self.share_data = share_data
+        self.assets = assets
+        self.render_cache = render_cache
+        self.incremental = incremental
 
         # scale configuration
         self.scale = scale
@@ -241,31 +287,274 @@ class MapViz(object):
         self.scale_background_color = scale_background_color
         self.scale_text_color = scale_text_color
 
+    @property
+    def frame_id(self):
+        """Id of the iframes displaying this viz, unique to the viz so data
+        pushes reach only its own maps"""
+        if getattr(self, '_frame_id', None) is None:
+            self._frame_id = '{}-{}'.format(self.div_id, uuid.uuid4().hex)
+        return self._frame_id
+
     def as_iframe(self, html_data):
         """Build the HTML representation for the mapviz."""
 
         srcdoc = html_data.replace('"', "'")
-        return ('<iframe id="{div_id}", srcdoc="{srcdoc}" style="width: {width}; '
+        return ('<iframe id="{frame_id}", srcdoc="{srcdoc}" style="width: {width}; '
                 'height: {height};"></iframe>'.format(
-                    div_id=self.div_id,
+                    frame_id=self.frame_id,
                     srcdoc=srcdoc,
                     width=self.width,
                     height=self.height))
 
     def show(self, **kwargs):
         # Load the HTML iframe
-        html = self.create_html(**kwargs)
+        if kwargs or not (self.share_data or self.assets == 'inline'):
+            html = self.create_html(**kwargs)
+        else:
+            options = self.template_options()
+            # data and assets already displayed in the notebook are referenced instead of inlined
+            if self.share_data:
+                registry.share(options)
+            if self.assets == 'inline':
+                registry.share_assets(options)
+            html = templates.format(self.template, **options)
         map_html = self.as_iframe(html)
 
         # Display the iframe in the current jupyter notebook view
         display(HTML(map_html))
 
+    def push_data(self, mode, data, max_features=None):
+        """Post GeoJSON data to the maps displayed from this viz, which apply it
+        to their source with setData instead of re-rendering the iframe"""
+        message = json.dumps({'type': 'mapboxgl-update', 'mode': mode, 'data': data, 'maxFeatures': max_features},
+                             ensure_ascii=False)
+        script = Javascript(
+            '(function() {{'
+            '  var message = {message};'
+            '  document.querySelectorAll(\'iframe[id="{frame_id}"]\').forEach(function(frame) {{'
+            '    frame.contentWindow.postMessage(message, "*");'
+            '  }});'
+            '}})();'.format(message=message, frame_id=self.frame_id))
+
+        # reuse one output for all pushes so repeated updates do not pile up in the notebook
+        if getattr(self, '_push_display_id', None) is None:
+            self._push_display_id = uuid.uuid4().hex
+            display(script, display_id=self._push_display_id)
+        else:
+            display(script, display_id=self._push_display_id, update=True)
+
+    def update_data(self, data):
+        """Replace the data of the viz and of its displayed maps"""
+        self.data = data
+        self.push_data('replace', load_geojson(data))
+
+    def append(self, data, max_features=None, precision=6):
+        """Add features (a FeatureCollection, list of features or dataframe with
+        lat / lon columns) to the data of the viz and of its displayed maps,
+        sending only the new features; with max_features only the most recent
+        features are kept. Dataframe coordinates are rounded to <precision>
+        decimal places, or with 'auto' to those resolving the viz max_zoom"""
+        if isinstance(data, dict):
+            features = data['features']
+        elif isinstance(data, list):
+            features = data
+        else:
+            features = df_to_geojson(data, precision=precision, max_zoom=self.max_zoom)['features']
+
+        features = features[-max_features:] if max_features else features
+        current = load_geojson(self.data)['features']
+        if max_features:
+            current = current[max(0, len(current) + len(features) - max_features):]
+        self.data = {'type': 'FeatureCollection', 'features': current + features}
+        self.push_data('append', {'type': 'FeatureCollection', 'features': features}, max_features)
+
+    @property
+    def index(self):
+        """Spatial index over the viz's GeoJSON features, built on first use
+        and rebuilt when the data is replaced"""
+        if getattr(self, '_index_data', None) is not self.data:
+            if self.vector_source:
+                raise SourceDataError('spatial index is not available for vector data sources')
+            self._index = SpatialIndex.from_geojson(load_geojson(self.data))
+            self._index_data = self.data
+        return self._index
+
+    def fit_to_data(self, padding=20):
+        """Set center and zoom so the map frames the bounds of the data"""
+        if self.index.bounds is None:
+            return
+
+        def pixels(size, default):
+            size = str(size)
+            return float(size[:-2]) if size.endswith('px') else default
+
+        self.center, self.zoom = fit_bounds(self.index.bounds,
+                                            width=pixels(self.width, 800),
+                                            height=pixels(self.height, 500),
+                                            padding=padding)
+        self.zoom = min(max(self.zoom, self.min_zoom), self.max_zoom)
+
+    def pruned(self, indices):
+        """Return a copy of the viz holding only the features at <indices>"""
+        features = self.index.features
+        viz = copy.copy(self)
+        viz.data = {'type': 'FeatureCollection', 'features': [features[i] for i in indices]}
+        return viz
+
+    def within_bbox(self, west, south, east, north):
+        """Return a copy of the viz holding only the features intersecting a bounding box"""
+        return self.pruned(self.index.query_bbox(west, south, east, north))
+
+    def within_radius(self, lon, lat, radius):
+        """Return a copy of the viz holding only the features within <radius> meters of lon, lat"""
+        return self.pruned(self.index.query_radius(lon, lat, radius))
+
+    def to_dict(self):
+        """Return a JSON-serializable spec of the viz, restored by MapViz.from_dict;
+        nested vizzes (layers, grid cells) are included as specs"""
+        def spec_value(value):
+            if isinstance(value, MapViz):
+                return value.to_dict()
+            if isinstance(value, list) and any(isinstance(v, MapViz) for v in value):
+                return [spec_value(v) for v in value]
+            return value
+
+        # private state and the render cache are runtime settings, not part of the spec
+        attributes = dict((key, spec_value(value)) for key, value in vars(self).items()
+                          if not key.startswith('_') and key != 'render_cache')
+        return {'viz': type(self).__name__, 'attributes': attributes}
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Create a viz from a spec returned by to_dict"""
+        def is_spec(value):
+            return isinstance(value, dict) and set(value) == {'viz', 'attributes'}
+
+        def restore(value):
+            if is_spec(value):
+                return MapViz.from_dict(value)
+            if isinstance(value, list) and any(is_spec(v) for v in value):
+                return [restore(v) for v in value]
+            return value
+
+        viz_class = globals().get(spec['viz'])
+        if not (isinstance(viz_class, type) and issubclass(viz_class, MapViz)):
+            raise ValueError('unknown viz class {}'.format(spec['viz']))
+
+        viz = viz_class.__new__(viz_class)
+        viz.__dict__.update((key, restore(value)) for key, value in spec['attributes'].items())
+        return viz
+
+    def __setattr__(self, name, value):
+        # count assignments so memoized parts of the render are recomputed only when their inputs change
+        versions = self.__dict__.setdefault('_versions', {})
+        versions[name] = versions.get(name, 0) + 1
+        super(MapViz, self).__setattr__(name, value)
+
+    def __copy__(self):
+        viz = self.__class__.__new__(self.__class__)
+        viz.__dict__.update(self.__dict__)
+        viz.__dict__.update(_versions=dict(self.__dict__.get('_versions', {})), _memo={})
+        # a copy is a separate viz whose maps do not receive the data pushed by the original
+        viz.__dict__.update(_frame_id=None, _push_display_id=None)
+        return viz
+
+    def __getstate__(self):
+        # memoized render parts can be large; worker processes recompute them
+        state = dict(self.__dict__)
+        state.pop('_memo', None)
+        return state
+
+    def data_fingerprint(self):
+        """Cheap identity of the data: its object and length, or the size and
+        modification time of a data file. Edits of feature properties in place
+        are not seen."""
+        data = self.data
+        if isinstance(data, str):
+            if os.path.isfile(data):
+                stat = os.stat(data)
+                return (data, stat.st_size, stat.st_mtime)
+            return data
+        if isinstance(data, dict):
+            return (id(data), id(data.get('features')), len(data.get('features') or []))
+        if isinstance(data, list):
+            return (id(data), len(data))
+        return id(data)
+
+    def memoize(self, name, dependencies, compute, extra=None):
+        """Return compute(), reusing the result of the last call under <name>
+        while none of the attributes in <dependencies> has been assigned since
+        and <extra> is unchanged. Parts depending on data are only reused by
+        incremental vizzes, and only while the data fingerprint is unchanged."""
+        if 'data' in dependencies:
+            if not getattr(self, 'incremental', False):
+                return compute()
+            extra = (extra, self.data_fingerprint())
+        versions = self.__dict__.setdefault('_versions', {})
+        memo = self.__dict__.setdefault('_memo', {})
+        key = (tuple(versions.get(dependency, 0) for dependency in dependencies), extra)
+        if name not in memo or memo[name][0] != key:
+            memo[name] = (key, compute())
+        return memo[name][1]
+
+    def invalidate(self, *names):
+        """Recompute the parts of the next render depending on the named
+        attributes, or everything without names; needed after changing
+        data in place, e.g. editing feature properties"""
+        if names:
+            versions = self.__dict__.setdefault('_versions', {})
+            for name in names:
+                versions[name] = versions.get(name, 0) + 1
+        else:
+            self.__dict__['_memo'] = {}
+
+    def serialized_data(self):
+        """JSON text of the viz data, reused until data is assigned"""
+        return self.memoize('geojson_data', ('data',), lambda: json.dumps(self.data, ensure_ascii=False))
+
+    def level_of_detail_data(self):
+        """JSON text of the level of detail data, reused until data, max_zoom or lod_cell_size is assigned"""
+        return self.memoize('level_of_detail', ('data', 'max_zoom', 'lod_cell_size'),
+                            lambda: json.dumps(zoom_levels(load_geojson(self.data), max_zoom=self.max_zoom,
+                                                           cell_size=self.lod_cell_size), ensure_ascii=False))
+
     def add_unique_template_variables(self, options):
         pass
 
-    def create_html(self, filename=None):
-        """Create a circle visual from a geojson data source"""
-        
+    def add_progressive_chunks(self, options):
+        """Split inline GeoJSON into a small first chunk and chunks of doubling
+        size that the map parses and adds one per animation frame"""
+        options.update(progressiveChunks=None)
+        if not self.progressive_chunk_size or self.vector_source or options.get('topojson') or \
+                options.get('precomputeClusters'):
+            return
+
+        def split():
+            try:
+                data = json.loads(options['geojson_data'])
+            except (TypeError, ValueError):
+                return None
+            if not isinstance(data, dict) or len(data.get('features', [])) <= self.progressive_chunk_size:
+                return None
+
+            features = data['features']
+            chunks = []
+            start, size = 0, self.progressive_chunk_size
+            while start < len(features):
+                chunks.append(features[start:start + size])
+                start, size = start + size, size * 2
+
+            return dict(
+                geojson_data=json.dumps(dict(data, features=chunks[0]), ensure_ascii=False),
+                progressiveChunks=[json.dumps(chunk, ensure_ascii=False) for chunk in chunks[1:]])
+
+        chunks = self.memoize('progressive_chunks', ('progressive_chunk_size',), split, extra=options['geojson_data'])
+        if chunks:
+            options.update(chunks)
+
+    def template_options(self):
+        """Build the template variables of the viz"""
+
         if isinstance(self.style, str):
             style = "'{}'".format(self.style)
         else:
@@ -275,10 +564,11 @@ class MapViz(object):
             gl_js_version=GL_JS_VERSION,
             accessToken=self.access_token,
             div_id=self.div_id,
+            mapContainer='map',
             style=style,
             center=list(self.center),
             zoom=self.zoom,
-            geojson_data=json.dumps(self.data, ensure_ascii=False),
+            geojson_data=self.serialized_data(),
             belowLayer=self.below_layer,
             opacity=self.opacity,
             minzoom=self.min_zoom,
@@ -292,6 +582,7 @@ class MapViz(object):
             popupOpensOnHover=self.popup_open_action=='hover',
             includeSnapshotLinks=self.add_snapshot_links,
             preserveDrawingBuffer=json.dumps(self.add_snapshot_links),
+            viewportTarget=self.viewport_source.register() if self.viewport_source else None,
             showScale=self.scale,
             scaleUnits=self.scale_unit_system,
             scaleBorderColor=self.scale_border_color,
@@ -330,9 +621,13 @@ class MapViz(object):
                 dataJoinProperty=self.data_join_property,
                 enableDataJoin=not self.disable_data_join
             )
-            data = geojson_to_dict_list(self.data)
-            if bool(data):
-                options.update(joinData=json.dumps(data, ensure_ascii=False))
+            def join_data():
+                data = geojson_to_dict_list(self.data)
+                return json.dumps(data, ensure_ascii=False) if bool(data) else None
+
+            data = self.memoize('join_data', ('data',), join_data)
+            if data is not None:
+                options.update(joinData=data)
 
         if self.label_property is None:
             options.update(labelProperty=None)
@@ -346,15 +641,40 @@ class MapViz(object):
             labelHaloWidth=self.label_halo_width
         )
 
+        options.update(asset_options(self.assets, GL_JS_VERSION, self.add_snapshot_links))
+
         self.add_unique_template_variables(options)
+        self.add_progressive_chunks(options)
+        return options
+
+    def create_html(self, filename=None):
+        """Create a circle visual from a geojson data source"""
+        def render():
+            return templates.format(self.template, **self.template_options())
+
+        if getattr(self, 'render_cache', None) is not None:
+            html = self.render_cache.render(self, render)
+        else:
+            html = render()
 
         if filename:
-            html = templates.format(self.template, **options)
             with codecs.open(filename, "w", "utf-8-sig") as f:
                 f.write(html)
             return None
         else:
-            return templates.format(self.template, **options)
+            return html
+
+    def create_html_async(self, filename=None, renderer=None):
+        """Coroutine rendering the viz like create_html, with the CPU-heavy
+        stages run in an executor so the event loop keeps serving other tasks
+
+        :param filename: optional file the html is written to
+        :param renderer: mapboxgl.aio.AsyncRenderer configuring the executor and
+                         concurrency limit; defaults to the shared mapboxgl.aio.renderer
+        """
+        # imported on use so that interpreters without async syntax can still import this module
+        from mapboxgl import aio
+        return (renderer or aio.renderer).render(self, filename)
 
 
 class CircleViz(VectorMixin, MapViz):
@@ -371,6 +691,8 @@ class CircleViz(VectorMixin, MapViz):
                  stroke_width=0.1,
                  legend_key_shape='circle',
                  highlight_color='black',
+                 level_of_detail=False,
+                 lod_cell_size=8,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
@@ -383,6 +705,8 @@ class CircleViz(VectorMixin, MapViz):
         :param stroke_color: color of circle stroke outline
         :param stroke_width: with of circle stroke outline
         :param highlight_color: color for feature selection, hover, or highlight
+        :param level_of_detail: boolean to show a spatially even sample of points at low zooms and all points when zoomed in
+        :param lod_cell_size: grid cell size in pixels; each level of detail adds at most one point per cell
 
         """
         super(CircleViz, self).__init__(data, *args, **kwargs)
@@ -399,11 +723,14 @@ class CircleViz(VectorMixin, MapViz):
         self.color_default = color_default
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.level_of_detail = level_of_detail
+        self.lod_cell_size = lod_cell_size
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to circle visual"""
         options.update(dict(
-            geojson_data=json.dumps(self.data, ensure_ascii=False),
+            geojson_data=self.serialized_data(),
+            levelOfDetail=self.level_of_detail,
             colorProperty=self.color_property,
             colorType=self.color_function_type,
             colorStops=self.color_stops,
@@ -417,6 +744,9 @@ class CircleViz(VectorMixin, MapViz):
         if self.vector_source:
             options.update(vectorColorStops=self.generate_vector_color_map())
 
+        elif self.level_of_detail:
+            options.update(geojson_data=self.level_of_detail_data())
+
 
 class GraduatedCircleViz(VectorMixin, MapViz):
     """Create a graduated circle map"""
@@ -435,6 +765,8 @@ class GraduatedCircleViz(VectorMixin, MapViz):
                  radius_function_type='interpolate',
                  legend_key_shape='circle',
                  highlight_color='black',
+                 level_of_detail=False,
+                 lod_cell_size=8,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
@@ -450,6 +782,8 @@ class GraduatedCircleViz(VectorMixin, MapViz):
         :param stroke_color: color of circle stroke outline
         :param stroke_width: with of circle stroke outline
         :param highlight_color: color for feature selection, hover, or highlight
+        :param level_of_detail: boolean to show a spatially even sample of points at low zooms and all points when zoomed in
+        :param lod_cell_size: grid cell size in pixels; each level of detail adds at most one point per cell
 
         """
         super(GraduatedCircleViz, self).__init__(data, *args, **kwargs)
@@ -469,10 +803,13 @@ class GraduatedCircleViz(VectorMixin, MapViz):
         self.stroke_width = stroke_width
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.level_of_detail = level_of_detail
+        self.lod_cell_size = lod_cell_size
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to graduated circle visual"""
         options.update(dict(
+            levelOfDetail=self.level_of_detail,
             colorProperty=self.color_property,
             colorStops=self.color_stops,
             colorType=self.color_function_type,
@@ -490,6 +827,9 @@ class GraduatedCircleViz(VectorMixin, MapViz):
                 vectorColorStops=self.generate_vector_color_map(),
                 vectorRadiusStops=self.generate_vector_numeric_map('radius')))
 
+        elif self.level_of_detail:
+            options.update(geojson_data=self.level_of_detail_data())
+
 
 class HeatmapViz(VectorMixin, MapViz):
     """Create a heatmap viz"""
@@ -538,18 +878,14 @@ class HeatmapViz(VectorMixin, MapViz):
             options.update(dict(
                 vectorWeightStops=self.generate_vector_numeric_map('weight')))
 
-    def generate_vector_numeric_map(self, numeric_property):
+    def _generate_vector_numeric_map(self, numeric_property):
         """Generate stops array for use with match expression in mapbox template"""
         vector_stops = []
         
         lookup_property = getattr(self, '{}_property'.format(numeric_property))
         numeric_stops = getattr(self, '{}_stops'.format(numeric_property))
 
-        # if join data specified as filename or URL, parse JSON to list of Python dicts
-        if type(self.data) == str:
-            self.data = geojson_to_dict_list(self.data)
-
-        for row in self.data:
+        for row in self.join_rows():
 
             # map value to JSON feature using the numeric property
             value = numeric_map(row[lookup_property], numeric_stops, 0)
@@ -575,6 +911,7 @@ class ClusteredCircleViz(MapViz):
                  stroke_width=0.1,
                  legend_key_shape='circle',
                  highlight_color='black',
+                 precompute_clusters=False,
                  *args,
                  **kwargs):
         """Construct a Mapviz object 
@@ -588,6 +925,7 @@ class ClusteredCircleViz(MapViz):
         :param radius_default: radius of circles not contained in a cluster
         :param color_default: color of circles not contained in a cluster
         :param highlight_color: color for feature selection, hover, or highlight
+        :param precompute_clusters: boolean to compute clusters for every zoom in Python instead of in the browser
 
         """
         super(ClusteredCircleViz, self).__init__(data, *args, **kwargs)
@@ -604,9 +942,59 @@ class ClusteredCircleViz(MapViz):
         self.color_default = color_default
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.precompute_clusters = precompute_clusters
+
+    def cluster_options(self):
+        # points not visible just below the initial zoom are kept out of the map source until zoomed in
+        deferral_zoom = math.floor(self.zoom) + 1
+        clusters = self.memoize('supercluster', ('data', 'min_zoom', 'clusterMaxZoom', 'clusterRadius'),
+                                lambda: supercluster(load_geojson(self.data),
+                                                     min_zoom=self.min_zoom,
+                                                     max_zoom=self.clusterMaxZoom,
+                                                     radius=self.clusterRadius,
+                                                     ancestor_zoom=deferral_zoom),
+                                extra=deferral_zoom)
+
+        # deferred points are bucketed by the cluster holding them at the deferral zoom, so the map
+        # parses and adds only the buckets in view
+        features, buckets = [], {}
+        for feature in clusters['features']:
+            properties = feature['properties']
+            if '_ancestor' not in properties:
+                features.append(feature)
+                continue
+            properties = dict(properties)
+            ancestor = properties.pop('_ancestor')
+            lon, lat = feature['geometry']['coordinates'][:2]
+            buckets.setdefault(ancestor, []).append([lon, lat, properties])
+
+        deferred = []
+        for ancestor, leaves in buckets.items():
+            lons = [leaf[0] for leaf in leaves]
+            lats = [leaf[1] for leaf in leaves]
+            # leaves are returned by a function, like progressive chunks, so they are built only when the
+            # bucket is added; a JSON string would not survive the quote replacement of as_iframe
+            deferred.append('{}: [{}, {}, {}, {}, {}, function() {{ return {}; }}]'.format(
+                json.dumps(str(ancestor)), min(leaf[2]['_minzoom'] for leaf in leaves),
+                min(lons), min(lats), max(lons), max(lats),
+                json.dumps(leaves, ensure_ascii=False).replace('</', '<\\/')))
+
+        return dict(
+            geojson_data=json.dumps({'type': 'FeatureCollection', 'features': features}, ensure_ascii=False),
+            deferredLeaves='{' + ', '.join(deferred) + '}' if deferred else 'null'
+        )
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to a clustered circle visual"""
+        options.update(dict(
+            precomputeClusters=self.precompute_clusters,
+            deferredLeaves='null'
+        ))
+
+        if self.precompute_clusters:
+            options.update(self.memoize('clusters', ('data', 'min_zoom', 'clusterMaxZoom', 'clusterRadius', 'zoom'),
+                                        self.cluster_options))
+
         options.update(dict(
             colorStops=self.color_stops,
             colorDefault=self.color_default,
@@ -639,6 +1027,8 @@ class ChoroplethViz(VectorMixin, MapViz):
                  height_function_type='interpolate',
                  legend_key_shape='rounded-square',
                  highlight_color='black',
+                 topojson=False,
+                 topojson_quantization=1e5,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
@@ -661,6 +1051,8 @@ class ChoroplethViz(VectorMixin, MapViz):
         :param height_default: default height for 3D extruded polygons
         :param height_function_type: property to determine `type` used by Mapbox to assign height
         :param highlight_color: color for feature selection, hover, or highlight
+        :param topojson: boolean to embed GeoJSON polygons as TopoJSON with shared borders encoded once
+        :param topojson_quantization: number of distinct coordinate values per axis in TopoJSON encoding
         """
         super(ChoroplethViz, self).__init__(data, *args, **kwargs)
         
@@ -681,25 +1073,27 @@ class ChoroplethViz(VectorMixin, MapViz):
         self.height_function_type = height_function_type
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.topojson = topojson
+        self.topojson_quantization = topojson_quantization
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to heatmap visual"""
 
         # set line stroke dash interval based on line_stroke property
         if self.line_stroke in ["dashed", "--"]:
-            self.line_dash_array = [6, 4]
+            line_dash_array = [6, 4]
         elif self.line_stroke in ["dotted", ":"]:
-            self.line_dash_array = [0.5, 4]
+            line_dash_array = [0.5, 4]
         elif self.line_stroke in ["dash dot", "-."]:
-            self.line_dash_array = [6, 4, 0.5, 4]
+            line_dash_array = [6, 4, 0.5, 4]
         elif self.line_stroke in ["solid", "-"]:
-            self.line_dash_array = [1, 0]
+            line_dash_array = [1, 0]
         else:
             # default to solid line
-            self.line_dash_array = [1, 0]
+            line_dash_array = [1, 0]
 
         # check if choropleth map should include 3-D extrusion
-        self.extrude = all([bool(self.height_property), bool(self.height_stops)])
+        extrude = all([bool(self.height_property), bool(self.height_stops)])
 
         # common variables for vector and geojson-based choropleths
         options.update(dict(
@@ -708,14 +1102,15 @@ class ChoroplethViz(VectorMixin, MapViz):
             colorType=self.color_function_type,
             defaultColor=self.color_default,
             lineColor=self.line_color,
-            lineDashArray=self.line_dash_array,
+            lineDashArray=line_dash_array,
             lineStroke=self.line_stroke,
             lineWidth=self.line_width,
             lineOpacity=self.line_opacity,
-            extrudeChoropleth=self.extrude,
-            highlightColor=self.highlight_color
+            extrudeChoropleth=extrude,
+            highlightColor=self.highlight_color,
+            topojson=self.topojson and not self.vector_source
         ))
-        if self.extrude:
+        if extrude:
             options.update(dict(
                 heightType=self.height_function_type,
                 heightProperty=self.height_property,
@@ -727,12 +1122,17 @@ class ChoroplethViz(VectorMixin, MapViz):
         if self.vector_source:
             options.update(vectorColorStops=self.generate_vector_color_map())
             
-            if self.extrude:
+            if extrude:
                 options.update(vectorHeightStops=self.generate_vector_numeric_map('height'))
 
         # geojson-based choropleth map variables
+        elif self.topojson:
+            options.update(geojson_data=self.memoize(
+                'topojson', ('data', 'topojson_quantization'),
+                lambda: json.dumps(geojson_to_topojson(self.data, self.topojson_quantization), ensure_ascii=False)))
+
         else:
-            options.update(geojson_data=json.dumps(self.data, ensure_ascii=False))
+            options.update(geojson_data=self.serialized_data())
 
 
 class ImageViz(MapViz):
@@ -742,20 +1142,35 @@ class ImageViz(MapViz):
                  image,
                  coordinates,
                  legend=False,
+                 image_format='png',
+                 image_max_pixels=None,
+                 image_window=None,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
 
         :param coordinates: property to determine image coordinates (UL, UR, LR, LL).
             EX. [[-80.425, 46.437], [-71.516, 46.437], [-71.516, 37.936], [-80.425, 37.936]]
-        :param image: url, local path or a numpy ndarray
+        :param image: url, local path, path to a .npy file (memory-mapped) or a numpy ndarray / memmap
         :param legend: default setting is to hide heatmap legend
+        :param image_format: encoding of ndarray images; one of 'png', 'jpeg' or 'webp'
+        :param image_max_pixels: if set, downscale ndarray images to at most this many pixels; only the
+            sampled pixels of memory-mapped arrays are read
+        :param image_window: (row_start, row_stop, col_start, col_stop) of the ndarray to display;
+            coordinates then describe the corners of the window
 
         """
         super(ImageViz, self).__init__(None, *args, **kwargs)
 
-        if type(image) is numpy.ndarray:
-            image = img_encode(image)
+        # .npy files are memory-mapped so only the sampled pixels are read
+        if isinstance(image, str) and image.endswith('.npy'):
+            image = numpy.load(image, mmap_mode='r')
+
+        if isinstance(image, numpy.ndarray):
+            # downscale while reading, so memory-mapped arrays are not loaded in full
+            if image_window or image_max_pixels:
+                image = read_window(image, image_window, image_max_pixels)
+            image = img_encode(image, format=image_format)
 
         self.template = 'image'
         self.image = image
@@ -777,6 +1192,7 @@ class RasterTilesViz(MapViz):
                  tiles_bounds=None,
                  tiles_minzoom=0,
                  tiles_maxzoom=22,
+                 tiles_proxy=None,
                  legend=False,
                  *args,
                  **kwargs):
@@ -787,11 +1203,15 @@ class RasterTilesViz(MapViz):
         :param tiles_bounds: property to determine the tiles endpoint bounds
         :param tiles_minzoom: property to determine the tiles endpoint min zoom
         :param tiles_max: property to determine the tiles endpoint max zoom
+        :param tiles_proxy: optional mapboxgl.server.TileServer used to fetch tiles through a local disk cache
         :param legend: default setting is to hide heatmap legend
 
         """
         super(RasterTilesViz, self).__init__(None, *args, **kwargs)
 
+        if tiles_proxy is not None:
+            tiles_url = tiles_proxy.add_proxy(tiles_url)
+
         self.template = 'raster'
         self.tiles_url = tiles_url
         self.tiles_size = tiles_size
@@ -867,16 +1287,16 @@ class LinestringViz(VectorMixin, MapViz):
 
         # set line stroke dash interval based on line_stroke property
         if self.line_stroke in ["dashed", "--"]:
-            self.line_dash_array = [6, 4]
+            line_dash_array = [6, 4]
         elif self.line_stroke in ["dotted", ":"]:
-            self.line_dash_array = [0.5, 4]
+            line_dash_array = [0.5, 4]
         elif self.line_stroke in ["dash dot", "-."]:
-            self.line_dash_array = [6, 4, 0.5, 4]
+            line_dash_array = [6, 4, 0.5, 4]
         elif self.line_stroke in ["solid", "-"]:
-            self.line_dash_array = [1, 0]
+            line_dash_array = [1, 0]
         else:
             # default to solid line
-            self.line_dash_array = [1, 0]
+            line_dash_array = [1, 0]
 
         # common variables for vector and geojson-based linestring maps
         options.update(dict(
@@ -885,7 +1305,7 @@ class LinestringViz(VectorMixin, MapViz):
             colorType=self.color_function_type,
             defaultColor=self.color_default,
             lineColor=self.color_default,
-            lineDashArray=self.line_dash_array,
+            lineDashArray=line_dash_array,
             lineStroke=self.line_stroke,
             widthStops=self.line_width_stops,
             widthProperty=self.line_width_property,
@@ -909,5 +1329,128 @@ class LinestringViz(VectorMixin, MapViz):
 
         # geojson-based linestring map variables
         else:
-            options.update(geojson_data=json.dumps(self.data, ensure_ascii=False))
+            options.update(geojson_data=self.serialized_data())
+
+
+
+class CompositeViz(MapViz):
+    """Create a map drawing several layer definitions over one data source"""
+
+    def __init__(self, data, layers, *args, **kwargs):
+        """Construct a CompositeViz
+
+        :param data: GeoJSON Feature Collection shared by all layers
+        :param layers: list of viz objects (e.g. CircleViz, HeatmapViz, ClusteredCircleViz) whose layers
+                       are drawn in order over the shared data; their own data, map and scale options are ignored
+        """
+        super(CompositeViz, self).__init__(data, *args, **kwargs)
+
+        self.template = 'composite'
+        self.layers = layers
 
+    def add_unique_template_variables(self, options):
+        """Update map template variables with the rendered layers of each viz"""
+        layer_scripts, layer_css, layer_legend = [], [], ''
+
+        for layer in self.layers:
+            if layer.vector_source or getattr(layer, 'topojson', False) or \
+                    getattr(layer, 'precompute_clusters', False) or getattr(layer, 'level_of_detail', False):
+                raise SourceDataError('layers of a CompositeViz must draw the shared GeoJSON data; '
+                                      'vector sources, topojson, precomputed clusters and level of detail '
+                                      'are not supported')
+
+            # the data is serialized once by the composite; layers reference it by name
+            layer = copy.copy(layer)
+            layer.data = {'type': 'FeatureCollection', 'features': []}
+            layer.viewport_source = None
+            layer.progressive_chunk_size = None
+            layer_options = layer.template_options()
+            layer_options.update(geojson_data='compositeData')
+
+            layer_scripts.append(templates.format_block(layer.template, 'map', **layer_options))
+            layer_css.append(templates.format_block(layer.template, 'extra_css', **layer_options))
+            if self.legend and layer.legend and not layer_legend:
+                layer_legend = templates.format_block(layer.template, 'legend', **layer_options)
+
+        options.update(
+            layerScripts=layer_scripts,
+            layerCss=layer_css,
+            layerLegend=layer_legend
+        )
+
+
+class GridViz(MapViz):
+    """Create a grid of maps in one document, loading GL JS once"""
+
+    def __init__(self, vizzes, columns=3, cell_height=250, titles=None, sync_cameras=False, *args, **kwargs):
+        """Construct a GridViz
+
+        :param vizzes: list of viz objects drawn in the cells of the grid, in row order
+        :param columns: number of maps per row
+        :param cell_height: height of each map in pixels
+        :param titles: optional list of cell titles
+        :param sync_cameras: move every map when one of them is panned, zoomed or rotated
+
+        The style, access token, camera and legend options of the grid apply to all cells;
+        only the legend of the first viz is drawn.
+        """
+        rows = int(math.ceil(len(vizzes) / float(columns)))
+        kwargs.setdefault('height', '{}px'.format(rows * cell_height))
+        super(GridViz, self).__init__(None, *args, **kwargs)
+
+        self.template = 'grid'
+        self.vizzes = vizzes
+        self.columns = columns
+        self.cell_height = cell_height
+        self.titles = titles
+        self.sync_cameras = sync_cameras
+
+    @classmethod
+    def facet(cls, df, column, viz_class, viz_options=None, lat='lat', lon='lon', properties=None, **kwargs):
+        """Build a grid with one map per distinct value of a dataframe column
+
+        :param df: Pandas dataframe with lat / lon columns
+        :param column: name of the column to facet on
+        :param viz_class: viz class drawing each facet, e.g. CircleViz or HeatmapViz
+        :param viz_options: keyword arguments passed to every viz_class, e.g. shared color stops
+        :param lat: name of the latitude column
+        :param lon: name of the longitude column
+        :param properties: list of columns to include as feature properties
+        """
+        vizzes, titles = [], []
+        for value, group in df.groupby(column, sort=True):
+            data = df_to_geojson(group, lat=lat, lon=lon, properties=properties)
+            vizzes.append(viz_class(data, **(viz_options or {})))
+            titles.append('{} = {}'.format(column, value))
+
+        kwargs.setdefault('titles', titles)
+        return cls(vizzes, **kwargs)
+
+    def add_unique_template_variables(self, options):
+        """Update map template variables with the map script of each cell"""
+        shared = dict((key, options[key]) for key in ('accessToken', 'style', 'center', 'zoom', 'pitch', 'bearing'))
+        cells = []
+
+        for i, viz in enumerate(self.vizzes):
+            cell_options = viz.template_options()
+            cell_options.update(shared)
+            cell_options.update(
+                mapContainer='{}-cell-{}'.format(self.div_id, i),
+                showLegend=bool(self.legend and viz.legend and i == 0),
+                includeSnapshotLinks=False,
+                preserveDrawingBuffer=json.dumps(False)
+            )
+            cells.append(dict(
+                container=cell_options['mapContainer'],
+                title=self.titles[i] if self.titles else None,
+                css=templates.format_block(viz.template, 'extra_css', **cell_options),
+                script=templates.format_block(viz.template, 'javascript', **cell_options)
+            ))
+
+        options.update(
+            cells=cells,
+            columns=self.columns,
+            cellHeight=self.cell_height,
+            syncCameras=self.sync_cameras,
+            includeSnapshotLinks=False
+        )
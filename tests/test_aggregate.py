@@ -0,0 +1,137 @@
+import numpy
+import pandas as pd
+import pytest
+
+from mapboxgl.aggregate import bin_points, bin_breaks, kernel_density, kernel_density_image
+from mapboxgl.errors import SourceDataError
+from mapboxgl.utils import create_color_stops
+
+
+@pytest.fixture()
+def df():
+    return pd.read_csv('tests/points.csv')
+
+
+def point_in_polygon(point, ring):
+    x, y = point
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring[:-1], ring[1:]):
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+
+@pytest.mark.parametrize('shape', ['hex', 'grid', 'quadkey'])
+def test_bin_points_counts(df, shape):
+    """Every point falls in exactly one bin"""
+    bins = bin_points(df, 4, shape=shape, properties=['Avg Medicare Payments'])
+    assert sum(f['properties']['count'] for f in bins['features']) == len(df)
+
+    # spot check that a point lies inside the bin outline
+    lon, lat = df['lon'][0], df['lat'][0]
+    containing = [f for f in bins['features'] if point_in_polygon((lon, lat), f['geometry']['coordinates'][0])]
+    assert len(containing) == 1
+
+
+def test_bin_points_stats():
+    """Bins carry the sum and mean of selected properties"""
+    df = pd.DataFrame({'lon': [10.0, 10.001, -50.0], 'lat': [5.0, 5.001, -20.0], 'v': [1.0, 3.0, 7.0]})
+    bins = bin_points(df, 6, shape='grid', properties=['v'], geometry='point')
+    props = sorted((f['properties'] for f in bins['features']), key=lambda p: p['count'])
+    assert props == [{'count': 1, 'v_sum': 7.0, 'v_mean': 7.0}, {'count': 2, 'v_sum': 4.0, 'v_mean': 2.0}]
+    assert bins['features'][0]['geometry']['type'] == 'Point'
+
+
+def test_bin_points_quadkey():
+    """Quadkey bins are the tiles at the given zoom"""
+    df = pd.DataFrame({'lon': [-122.4], 'lat': [37.8]})
+    bins = bin_points(df, 3, shape='quadkey')
+    assert bins['features'][0]['properties']['quadkey'] == '023'
+
+
+def test_bin_points_resolutions(df):
+    """Multiple zoom levels give one collection per zoom"""
+    bins = bin_points(df, [1, 6])
+    assert sorted(bins.keys()) == [1, 6]
+    assert len(bins[1]['features']) < len(bins[6]['features'])
+
+
+def test_bin_points_size(df):
+    """Cells are sized in GL JS pixels, 512 across the world at zoom 0"""
+    df = pd.DataFrame({'lon': [0.1], 'lat': [0.1]})
+    ring = bin_points(df, 0, shape='grid', cell_size=16)['features'][0]['geometry']['coordinates'][0]
+    lons = [point[0] for point in ring]
+    assert max(lons) - min(lons) == 360.0 * 16 / 512
+
+
+def test_bin_points_empty():
+    """No points give an empty collection"""
+    df = pd.DataFrame({'lon': [], 'lat': [], 'v': []})
+    assert bin_points(df, 4, properties=['v']) == {'type': 'FeatureCollection', 'features': []}
+
+
+def test_bin_points_invalid(df):
+    with pytest.raises(SourceDataError):
+        bin_points(df, 4, shape='triangle')
+
+
+def test_bin_breaks():
+    """Breaks are ascending and usable as color stops"""
+    rng = numpy.random.RandomState(0)
+    df = pd.DataFrame({'lon': rng.normal(-100, 10, 5000), 'lat': rng.normal(40, 5, 5000)})
+    bins = bin_points(df, 5)
+    breaks = bin_breaks(bins, 'count', num_breaks=5)
+    assert breaks == sorted(breaks)
+    assert breaks[0] == 1.0
+    assert len(create_color_stops(breaks, colors='YlOrRd')) == len(breaks)
+    assert bin_breaks(bins, 'count', num_breaks=3, method='linear')[-1] == max(
+        f['properties']['count'] for f in bins['features'])
+
+
+def test_kernel_density():
+    """Density peaks at a point and falls off with the bandwidth"""
+    df = pd.DataFrame({'lon': [0.0, 0.0, 20.0], 'lat': [0.0, 0.0, 10.0]})
+    density, bounds = kernel_density(df, bounds=(-30, -30, 30, 30), zoom=2, bandwidth=4)
+    west, south, east, north = bounds
+    assert density.max() == pytest.approx(1.0)
+    assert west == pytest.approx(-30, abs=0.5) and north == pytest.approx(30, abs=1)
+
+    row, col = numpy.unravel_index(density.argmax(), density.shape)
+    assert col / float(density.shape[1]) == pytest.approx(0.5, abs=0.02)
+    assert row / float(density.shape[0]) == pytest.approx(0.5, abs=0.02)
+
+    # the single point has half the density of the doubled point
+    assert density.max() / 2 == pytest.approx(density[:row - 5].max(), rel=0.05)
+
+    # pixels match GL JS at the zoom: 60 degrees are 512 * 4 * 60 / 360 pixels wide at zoom 2
+    assert density.shape[1] == pytest.approx(512 * 4 * 60 / 360.0, abs=1)
+
+
+def test_kernel_density_image():
+    """Density is colored through heatmap color stops"""
+    rng = numpy.random.RandomState(0)
+    df = pd.DataFrame({'lon': rng.normal(0, 1, 1000), 'lat': rng.normal(0, 1, 1000)})
+    image, coordinates = kernel_density_image(df, [[0.1, 'rgb(0,0,255)'], [1, 'rgba(255,0,0,0.5)']], max_size=256)
+    assert image.dtype == numpy.uint8 and image.shape[2] == 4
+    assert max(image.shape[:2]) <= 256
+    assert image[0, 0, 3] == 0
+    assert image.max(axis=(0, 1)).tolist() == [255, 0, 255, 255]
+    assert coordinates[0][0] < 0 < coordinates[1][0]
+
+
+def test_kernel_density_empty():
+    """No points give a transparent image within bounds and an error without them"""
+    df = pd.DataFrame({'lon': [], 'lat': []})
+    image, _ = kernel_density_image(df, [[0.1, 'rgb(0,0,255)'], [1, 'rgb(255,0,0)']], bounds=(-30, -30, 30, 30))
+    assert image.size and not image.any()
+    with pytest.raises(SourceDataError):
+        kernel_density(df)
+
+
+def test_kernel_density_missing_weights():
+    """Points with a missing weight are dropped instead of spreading NaN"""
+    df = pd.DataFrame({'lon': [0.0, 20.0, numpy.nan], 'lat': [0.0, 10.0, 0.0], 'w': [1.0, numpy.nan, 1.0]})
+    density, _ = kernel_density(df, bounds=(-30, -30, 30, 30), zoom=2, bandwidth=4, weight='w')
+    expected, _ = kernel_density(df[:1], bounds=(-30, -30, 30, 30), zoom=2, bandwidth=4)
+    assert numpy.isfinite(density).all()
+    assert density == pytest.approx(expected)
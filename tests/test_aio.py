@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from mock import patch
+
+from mapboxgl import templates
+from mapboxgl.aio import AsyncRenderer
+from mapboxgl.viz import CircleViz
+
+
+TOKEN = 'pk.abc123'
+
+
+def run(coroutine):
+    # a private loop, leaving the current event loop of other tests in place
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+def test_create_html_async(data, tmpdir):
+    """The async render matches create_html and can write a file"""
+    viz = CircleViz(data, access_token=TOKEN, div_id='async')
+    assert run(viz.create_html_async()) == viz.create_html()
+
+    filename = str(tmpdir.join('map.html'))
+    assert run(viz.create_html_async(filename)) is None
+    with open(filename, encoding='utf-8-sig') as f:
+        assert f.read() == viz.create_html()
+
+
+def test_event_loop_not_blocked(data):
+    """Other tasks run while a map renders"""
+    format = templates.format
+    ticks = []
+
+    def slow_format(*args, **kwargs):
+        time.sleep(0.2)
+        return format(*args, **kwargs)
+
+    async def tick():
+        for _ in range(5):
+            ticks.append(time.time())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        viz = CircleViz(data, access_token=TOKEN)
+        await asyncio.gather(viz.create_html_async(renderer=AsyncRenderer()), tick())
+
+    with patch('mapboxgl.aio.templates.format', side_effect=slow_format):
+        start = time.time()
+        run(main())
+    assert len(ticks) == 5
+    assert ticks[-1] - start < 0.2
+
+
+def test_max_concurrent(data):
+    """At most max_concurrent maps render at once"""
+    format = templates.format
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def counting_format(*args, **kwargs):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return format(*args, **kwargs)
+
+    async def main():
+        renderer = AsyncRenderer(max_concurrent=2)
+        vizzes = [CircleViz(data, access_token=TOKEN) for _ in range(6)]
+        return await asyncio.gather(*[viz.create_html_async(renderer=renderer) for viz in vizzes])
+
+    with patch('mapboxgl.aio.templates.format', side_effect=counting_format):
+        assert len(run(main())) == 6
+    assert max(peak) == 2
+
+
+def test_cancel(data, tmpdir):
+    """A cancelled render writes no file"""
+    filename = str(tmpdir.join('map.html'))
+    format = templates.format
+
+    def slow_format(*args, **kwargs):
+        time.sleep(0.2)
+        return format(*args, **kwargs)
+
+    async def main():
+        viz = CircleViz(data, access_token=TOKEN)
+        task = asyncio.ensure_future(viz.create_html_async(filename, renderer=AsyncRenderer()))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.3)
+
+    with patch('mapboxgl.aio.templates.format', side_effect=slow_format):
+        run(main())
+    assert not os.path.exists(filename)
+
+
+def test_process_executor(data):
+    """Maps render in worker processes"""
+    viz = CircleViz(data, access_token=TOKEN, div_id='async')
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        html = run(viz.create_html_async(renderer=AsyncRenderer(executor)))
+    assert html == viz.create_html()
@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+from mock import patch, MagicMock
+
+from mapboxgl.assets import AssetCache, asset_options
+from mapboxgl.registry import DataRegistry
+from mapboxgl.viz import CircleViz
+
+
+TOKEN = 'pk.abc123'
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+@pytest.fixture()
+def cache(tmpdir):
+    cache = AssetCache(str(tmpdir))
+    for name, text in [('mapbox-gl.js', 'var mapboxgl = {"source": "</script>"};'),
+                       ('mapbox-gl.css', '.mapboxgl-map { overflow: hidden; }')]:
+        os.makedirs(os.path.dirname(cache.path(name, 'v1.5.0')), exist_ok=True)
+        with open(cache.path(name, 'v1.5.0'), 'w') as f:
+            f.write(text)
+    return cache
+
+
+def test_download_once(tmpdir):
+    """Assets are downloaded on first use and read from disk afterwards"""
+    cache = AssetCache(str(tmpdir))
+    response = MagicMock(content=b'html2canvas();')
+    with patch('mapboxgl.assets.requests.get', return_value=response) as get:
+        assert cache.text('html2canvas.min.js', 'v1.0.0-alpha.12') == 'html2canvas();'
+        assert cache.text('html2canvas.min.js', 'v1.0.0-alpha.12') == 'html2canvas();'
+    get.assert_called_once()
+    assert 'v1.0.0-alpha.12/html2canvas.min.js' in get.call_args[0][0]
+    assert os.path.exists(cache.path('html2canvas.min.js', 'v1.0.0-alpha.12'))
+
+
+def test_asset_options():
+    options = asset_options('cdn', 'v1.5.0')
+    assert options['glJs']['url'] == 'https://api.tiles.mapbox.com/mapbox-gl-js/v1.5.0/mapbox-gl.js'
+    assert options['html2canvasJs'] is None
+    with pytest.raises(ValueError):
+        asset_options('local', 'v1.5.0')
+
+
+def test_inline_html(cache, data):
+    """Standalone html embeds the cached files"""
+    with patch('mapboxgl.assets.cache', cache):
+        html = CircleViz(data, access_token=TOKEN, assets='inline').create_html()
+    assert 'api.tiles.mapbox.com' not in html
+    assert '<script>var mapboxgl = {"source": "<\\/script>"};</script>' in html
+    assert '<style>.mapboxgl-map { overflow: hidden; }</style>' in html
+
+
+@patch('mapboxgl.viz.registry', DataRegistry())
+@patch('mapboxgl.registry.display')
+@patch('mapboxgl.viz.display')
+def test_inline_show(viz_display, registry_display, cache, data):
+    """Maps shown in a notebook read the files injected into the page once"""
+    with patch('mapboxgl.assets.cache', cache):
+        CircleViz(data, access_token=TOKEN, assets='inline').show()
+        CircleViz(data, access_token=TOKEN, assets='inline').show()
+
+    assert registry_display.call_count == 2
+    html = viz_display.call_args[0][0].data
+    assert 'mapboxgl-map' not in html
+    assert html.count("element.textContent = window.parent.mapboxglData[") == 2
@@ -0,0 +1,86 @@
+import os
+
+import pandas as pd
+import pytest
+
+from mapboxgl.assets import AssetCache, AssetDirectory
+from mapboxgl.batch import render_batch, render_groups, GroupViz
+from mapboxgl.viz import CircleViz
+
+
+TOKEN = 'pk.abc123'
+
+
+@pytest.fixture()
+def df():
+    return pd.DataFrame({'lon': [0, 1, 2, 3, 4, 5], 'lat': [0, 1, 2, 3, 4, 5], 'value': range(6),
+                         'region': ['a', 'a', 'b', 'b', 'c', 'c'], 'day': [1, 2, 1, 1, 2, 2]})
+
+
+def test_render_groups(df, tmpdir):
+    """One file per group, written by worker processes"""
+    report = render_groups(df, ['region', 'day'], CircleViz, filename='{}-{}.html', directory=str(tmpdir),
+                           viz_options=dict(access_token=TOKEN), properties=['value'], processes=2)
+    assert len(report.rendered) == 4
+    assert not report.failed
+    assert sorted(os.listdir(str(tmpdir))) == ['a-1.html', 'a-2.html', 'b-1.html', 'c-2.html']
+    assert report.bytes_written == sum(os.path.getsize(str(tmpdir.join(f))) for f in os.listdir(str(tmpdir)))
+    assert report.maps_per_second > 0
+
+
+def test_render_failures(df, tmpdir):
+    """Failing items are reported without stopping the batch"""
+    items = [(str(tmpdir.join('good.html')), GroupViz(CircleViz, df, dict(access_token=TOKEN))),
+             (str(tmpdir.join('bad.html')), GroupViz(CircleViz, df, dict(access_token=TOKEN, colour='red')))]
+    report = render_batch(items, processes=0)
+    assert [r.filename for r in report.rendered] == [str(tmpdir.join('good.html'))]
+    assert report.failed[0].error.startswith('TypeError')
+    assert '1 rendered, 1 failed' in repr(report)
+
+
+def test_render_unpicklable(df, tmpdir):
+    """Items that cannot be sent to a worker are reported as failed"""
+    unpicklable = CircleViz(None, access_token=TOKEN)
+    unpicklable.popup = lambda feature: feature
+    items = [(str(tmpdir.join('good.html')), GroupViz(CircleViz, df, dict(access_token=TOKEN))),
+             (str(tmpdir.join('bad.html')), unpicklable)]
+    report = render_batch(items, processes=1)
+    assert [r.filename for r in report.rendered] == [str(tmpdir.join('good.html'))]
+    assert [r.filename for r in report.failed] == [str(tmpdir.join('bad.html'))]
+    assert 'pickle' in report.failed[0].error
+
+
+def test_render_bounded(df, tmpdir):
+    """Items are pulled from the iterator only as workers free up"""
+    consumed = []
+
+    def items():
+        for i in range(12):
+            consumed.append(i)
+            yield str(tmpdir.join('{}.html'.format(i))), GroupViz(CircleViz, df, dict(access_token=TOKEN))
+
+    completed = []
+
+    def progress(result):
+        completed.append(result)
+        assert len(consumed) - len(completed) < 3
+
+    report = render_batch(items(), processes=1, max_pending=3, progress=progress)
+    assert len(report.rendered) == 12
+
+
+def test_render_shared_assets(df, tmpdir):
+    """Maps load one copy of GL JS from a directory next to them"""
+    cache = AssetCache(str(tmpdir.join('cache')))
+    for name in ('mapbox-gl.js', 'mapbox-gl.css'):
+        os.makedirs(os.path.dirname(cache.path(name, 'v1.5.0')), exist_ok=True)
+        with open(cache.path(name, 'v1.5.0'), 'w') as f:
+            f.write('/* {} */'.format(name))
+
+    out = tmpdir.join('out')
+    assets = AssetDirectory(str(out.join('assets')), asset_cache=cache)
+    report = render_groups(df, 'region', CircleViz, directory=str(out), viz_options=dict(access_token=TOKEN),
+                           assets=assets, processes=0)
+    assert len(report.rendered) == 3
+    assert out.join('assets', 'v1.5.0', 'mapbox-gl.js').read() == '/* mapbox-gl.js */'
+    assert "src='assets/v1.5.0/mapbox-gl.js'" in out.join('a.html').read_text('utf-8-sig')
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from mock import patch
+
+from mapboxgl.aio import AsyncRenderer
+from mapboxgl.batch import render_batch
+from mapboxgl.cache import RenderCache
+from mapboxgl.viz import MapViz, CircleViz, ChoroplethViz, HeatmapViz, CompositeViz
+from mapboxgl.utils import create_color_stops
+
+
+TOKEN = 'pk.abc123'
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+def test_spec_round_trip(data):
+    """Specs survive JSON and render the same html"""
+    viz = CircleViz(data, color_property='Avg Medicare Payments', color_stops=create_color_stops([0, 50, 100]),
+                    access_token=TOKEN)
+    spec = json.loads(json.dumps(viz.to_dict()))
+    assert spec['viz'] == 'CircleViz'
+    restored = MapViz.from_dict(spec)
+    assert isinstance(restored, CircleViz)
+    assert restored.create_html() == viz.create_html()
+
+
+def test_nested_spec(data):
+    viz = CompositeViz(data, [HeatmapViz(None, color_stops=create_color_stops([0, 5, 10])), CircleViz(None)],
+                       access_token=TOKEN)
+    restored = MapViz.from_dict(json.loads(json.dumps(viz.to_dict())))
+    assert [type(layer) for layer in restored.layers] == [HeatmapViz, CircleViz]
+    assert restored.create_html() == viz.create_html()
+
+    with pytest.raises(ValueError):
+        MapViz.from_dict({'viz': 'RenderCache', 'attributes': {}})
+
+
+def test_cache_hit(data, tmpdir):
+    """An unchanged viz is served from disk without rendering"""
+    cache = RenderCache(str(tmpdir))
+    html = CircleViz(data, access_token=TOKEN, render_cache=cache).create_html()
+
+    with patch('mapboxgl.viz.templates.format') as format:
+        assert CircleViz(data, access_token=TOKEN, render_cache=RenderCache(str(tmpdir))).create_html() == html
+        format.assert_not_called()
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_cache_key(data, tmpdir):
+    """Keys follow the spec and the data content"""
+    cache = RenderCache(str(tmpdir))
+    viz = CircleViz(data, access_token=TOKEN)
+    key = cache.key(viz)
+    assert cache.key(CircleViz(json.loads(json.dumps(data)), access_token=TOKEN)) == key
+    assert cache.key(CircleViz(data, radius=2, access_token=TOKEN)) != key
+    data['features'][0]['properties']['Provider Id'] = 0
+    assert cache.key(viz) != key
+
+
+def test_cache_eviction(data, tmpdir):
+    """The least recently used entries are removed past max_size"""
+    size = len(CircleViz(data, access_token=TOKEN).create_html().encode('utf-8'))
+    cache = RenderCache(str(tmpdir), max_size=int(size * 2.5))
+    for radius in (1, 2, 3):
+        CircleViz(data, radius=radius, access_token=TOKEN, render_cache=cache).create_html()
+
+    assert len(cache.files.lru) == 2
+    assert cache.files.size <= cache.files.max_size
+    assert cache.get(cache.key(CircleViz(data, radius=1, access_token=TOKEN))) is None
+    assert sum(len(files) for _, _, files in os.walk(str(tmpdir))) == 2
+
+
+def test_cache_rerender(tmpdir):
+    """Rendering does not change the spec, so rendering again is a hit"""
+    stops = create_color_stops([0, 50, 100])
+    for viz in (ChoroplethViz('tests/polygons.geojson', color_property='density', color_stops=stops,
+                              height_property='density', height_stops=stops, access_token=TOKEN),
+                ChoroplethViz('tests/polygons.geojson', vector_url='mapbox://mapbox.us_census_states_2015',
+                              vector_layer_name='states', vector_join_property='STATE_ID',
+                              data_join_property='name', color_property='density', color_stops=stops,
+                              access_token=TOKEN)):
+        viz.render_cache = cache = RenderCache(str(tmpdir.mkdir(str(id(viz)))))
+        html = viz.create_html()
+        assert viz.create_html() == html
+        assert viz.create_html() == html
+        assert (cache.hits, cache.misses) == (2, 1)
+        assert viz.data == 'tests/polygons.geojson'
+
+
+def test_cache_in_worker_processes(data, tmpdir):
+    """Cached vizzes render in process pools, sharing the cache directory"""
+    cache = RenderCache(str(tmpdir.mkdir('cache')))
+    viz = CircleViz(data, access_token=TOKEN, render_cache=cache)
+    report = render_batch([(str(tmpdir.join('map.html')), viz)], processes=1)
+    assert not report.failed
+
+    loop = asyncio.new_event_loop()
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            html = loop.run_until_complete(viz.create_html_async(renderer=AsyncRenderer(executor)))
+    finally:
+        loop.close()
+    assert html == CircleViz(data, access_token=TOKEN).create_html()
+    assert RenderCache(cache.cache_dir).get(cache.key(viz)) == html
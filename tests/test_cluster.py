@@ -0,0 +1,103 @@
+import json
+
+import numpy
+import pytest
+
+from mapboxgl.cluster import supercluster, zoom_levels, GridIndex
+from mapboxgl.tiles import WORLD_SIZE, lonlat_to_world
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+def random_points(n, seed=0):
+    rng = numpy.random.RandomState(seed)
+    lon = rng.uniform(-10, 10, n)
+    lat = rng.uniform(-10, 10, n)
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [x, y]}, 'properties': {'i': i}}
+        for i, (x, y) in enumerate(zip(lon, lat))]}
+
+
+def visible(features, zoom):
+    return [f for f in features if f['properties']['_minzoom'] <= zoom < f['properties']['_maxzoom']]
+
+
+def test_grid_index_within():
+    """Radius queries match a brute force search"""
+    rng = numpy.random.RandomState(1)
+    x, y = rng.uniform(0, 1, 500), rng.uniform(0, 1, 500)
+    index = GridIndex(x, y, 0.05)
+    for i in range(0, 500, 50):
+        expected = numpy.flatnonzero((x - x[i]) ** 2 + (y - y[i]) ** 2 <= 0.05 ** 2)
+        assert sorted(index.within(i, 0.05)) == list(expected)
+
+
+def test_supercluster_counts_every_zoom():
+    """Each zoom shows every point exactly once, as a leaf or within a cluster"""
+    clusters = supercluster(random_points(2000), max_zoom=8)['features']
+    for zoom in range(0, 11):
+        shown = visible(clusters, zoom)
+        assert sum(f['properties'].get('point_count', 1) for f in shown) == 2000
+    assert len(visible(clusters, 0)) < len(visible(clusters, 6)) < 2000
+    assert len(visible(clusters, 9)) == 2000
+
+
+def test_supercluster_leaves(data):
+    """Leaves keep their properties and are each emitted once"""
+    clusters = supercluster(data, max_zoom=10)['features']
+    leaves = [f for f in clusters if not f['properties'].get('cluster')]
+    assert len(leaves) == len(data['features'])
+    assert leaves[0]['properties']['Avg Medicare Payments'] == data['features'][0]['properties']['Avg Medicare Payments']
+    assert all(f['properties']['_maxzoom'] <= 11 for f in clusters if f['properties'].get('cluster'))
+
+
+def test_supercluster_abbreviated():
+    """Cluster labels match GL JS abbreviations"""
+    point = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0, 0]}, 'properties': {}}
+    clusters = supercluster({'type': 'FeatureCollection', 'features': [point] * 1500}, max_zoom=2)['features']
+    assert [f['properties']['point_count_abbreviated'] for f in clusters if f['properties'].get('cluster')] == ['1.5k']
+
+
+def test_zoom_levels():
+    """Low zooms hold a spatially even sample and every point appears by max_zoom"""
+    leveled = zoom_levels(random_points(3000), max_zoom=12, cell_size=8)['features']
+    levels = numpy.array([f['properties']['_minzoom'] for f in leveled])
+    assert levels.min() == 0 and levels.max() <= 12
+    assert (levels <= 2).sum() < (levels <= 6).sum() < 3000
+    assert leveled[5]['properties']['i'] == 5
+
+    # one point per 8 pixel cell at most is added for each tier
+    for z in range(0, 6):
+        tier = [f['geometry']['coordinates'] for f, level in zip(leveled, levels) if level == z]
+        cells = set(tuple(c) for c in (numpy.array(lonlat_to_world(*numpy.array(tier).T)).T // (8 / float(WORLD_SIZE * 2 ** z))))
+        assert len(cells) == len(tier)
+
+
+def test_zoom_levels_duplicates():
+    """Coincident points are all shown at max_zoom"""
+    point = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [1, 1]}, 'properties': {}}
+    leveled = zoom_levels({'type': 'FeatureCollection', 'features': [point] * 3}, max_zoom=10)['features']
+    assert sorted(f['properties']['_minzoom'] for f in leveled) == [0, 10, 10]
+
+
+def test_supercluster_ancestors():
+    """Points hidden at ancestor_zoom reference the cluster holding them there"""
+    clusters = supercluster(random_points(2000), max_zoom=8, ancestor_zoom=3)['features']
+    by_id = dict((f['properties']['cluster_id'], f) for f in clusters if f['properties'].get('cluster'))
+    leaves = [f for f in clusters if not f['properties'].get('cluster')]
+    assert [f for f in leaves if '_ancestor' in f['properties']] == [f for f in leaves if f['properties']['_minzoom'] > 3]
+
+    shown = visible(clusters, 3)
+    for leaf in leaves:
+        if '_ancestor' in leaf['properties']:
+            assert by_id[leaf['properties']['_ancestor']] in shown
+
+    counts = {}
+    for leaf in leaves:
+        ancestor = leaf['properties'].get('_ancestor')
+        counts[ancestor] = counts.get(ancestor, 0) + 1
+    assert all(by_id[a]['properties']['point_count'] >= n for a, n in counts.items() if a is not None)
@@ -0,0 +1,38 @@
+import os
+import time
+
+from mapboxgl.diskcache import DiskLRU, write_atomic
+
+
+def test_write_atomic(tmpdir):
+    path = str(tmpdir.join('a', 'b', 'file.bin'))
+    write_atomic(path, b'first')
+    write_atomic(path, b'second')
+    with open(path, 'rb') as f:
+        assert f.read() == b'second'
+    assert os.listdir(str(tmpdir.join('a', 'b'))) == ['file.bin']
+
+
+def test_lru_eviction(tmpdir):
+    """Least recently used files are removed past max_size"""
+    files = DiskLRU(str(tmpdir), max_size=25)
+    paths = [str(tmpdir.join(name)) for name in ('a', 'b', 'c')]
+    files.write(paths[0], b'0' * 10)
+    files.write(paths[1], b'1' * 10)
+    assert files.read(paths[0]) == b'0' * 10
+    files.write(paths[2], b'2' * 10)
+    assert files.size == 20
+    assert not os.path.exists(paths[1]) and files.read(paths[1]) is None
+
+
+def test_lru_rebuild(tmpdir):
+    """The order of files cached earlier follows their modification times"""
+    for i, name in enumerate(('old.html', 'new.html', 'other.txt')):
+        path = str(tmpdir.join(name))
+        write_atomic(path, b'x' * 10)
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+    files = DiskLRU(str(tmpdir), max_size=15, suffix='.html')
+    assert list(files.lru) == [str(tmpdir.join('new.html'))]
+    assert not os.path.exists(str(tmpdir.join('old.html')))
+    assert os.path.exists(str(tmpdir.join('other.txt')))
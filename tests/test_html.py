@@ -1,14 +1,20 @@
 import os
+import copy
 import json
 import base64
 import random
+import re
+import shutil
+import subprocess
+
+import numpy
 
 from mock import patch
 
 import pytest
 
 from mapboxgl.viz import *
-from mapboxgl.errors import TokenError, LegendError
+from mapboxgl.errors import TokenError, LegendError, SourceDataError
 from mapboxgl.utils import create_color_stops, create_numeric_stops
 from matplotlib.pyplot import imread
 
@@ -137,6 +143,199 @@ def test_html_ChoroplethViz(polygon_data):
     assert "<html>" in viz.create_html()
 
 
+def test_html_topojson_ChoroplethViz(polygon_data):
+    viz = ChoroplethViz(polygon_data,
+                        color_property="density",
+                        color_stops=[[0.0, "red"], [50.0, "gold"], [1000.0, "blue"]],
+                        topojson=True,
+                        access_token=TOKEN)
+    html = viz.create_html()
+    assert 'decodeTopojson({"type": "Topology"' in html
+
+
+def test_html_precomputed_ClusteredCircleViz(data):
+    viz = ClusteredCircleViz(data,
+                             radius_stops=[[10, 0], [100, 1]],
+                             color_stops=[[0, "red"], [10, "blue"], [1, "green"]],
+                             precompute_clusters=True,
+                             access_token=TOKEN)
+    html = viz.create_html()
+    assert '"clusterRadius"' not in html
+    assert '"_minzoom"' in html
+    assert 'var deferredLeaves = ' in html
+
+
+def test_precomputed_deferred_buckets(data):
+    """Points hidden just below the initial zoom are embedded in per-cluster buckets"""
+    viz = ClusteredCircleViz(data, radius_stops=[[10, 0], [100, 1]], color_stops=[[0, "red"], [10, "blue"]],
+                             precompute_clusters=True, min_zoom=2, access_token=TOKEN)
+    options = viz.cluster_options()
+    shown = json.loads(options['geojson_data'])['features']
+    leaves = [leaf for bucket in re.findall(r'function\(\) \{ return (.*?); \}\]', options['deferredLeaves'])
+              for leaf in json.loads(bucket)]
+    assert len(leaves) + len([f for f in shown if 'point_count' not in f['properties']]) == len(data['features'])
+    assert all(leaf[2]['_minzoom'] > 1 and '_ancestor' not in leaf[2] for leaf in leaves)
+    assert min(f['properties']['_minzoom'] for f in shown) == 0
+
+    with patch('mapboxgl.viz.supercluster', return_value={'type': 'FeatureCollection', 'features': []}) as clusters:
+        viz.invalidate()
+        viz.cluster_options()
+        assert clusters.call_args[1]['min_zoom'] == 2
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='requires node')
+def test_deferred_leaves_iframe(data):
+    """Deferred leaves load from the single-quoted srcdoc that show displays"""
+    viz = ClusteredCircleViz(data, radius_stops=[[10, 0], [100, 1]], color_stops=[[0, "red"], [10, "blue"]],
+                             precompute_clusters=True, access_token=TOKEN)
+    expected = sum(len(json.loads(bucket)) for bucket in
+                   re.findall(r'function\(\) \{ return (.*?); \}\]', viz.cluster_options()['deferredLeaves']))
+    assert expected
+
+    iframe = viz.as_iframe(viz.create_html())
+    leaves = re.search(r'var deferredLeaves = (.*?) \|\| \{\};', iframe).group(1)
+    script = ('var deferredLeaves = {};'
+              'console.log(Object.keys(deferredLeaves).reduce(function(count, key) {{'
+              '    return count + deferredLeaves[key][5]().length; }}, 0));').format(leaves)
+    assert int(subprocess.check_output(['node', '-e', script])) == expected
+
+
+def test_html_level_of_detail_CircleViz(data):
+    viz = CircleViz(data,
+                    color_property="Avg Medicare Payments",
+                    color_stops=[[0.0, "red"], [50.0, "gold"], [1000.0, "blue"]],
+                    level_of_detail=True,
+                    access_token=TOKEN)
+    html = viz.create_html()
+    assert '"filter": ["<=", ["get", "_minzoom"], ["zoom"]]' in html
+    assert '"_minzoom": 0' in html
+
+
+def test_html_level_of_detail_GraduatedCircleViz(data):
+    viz = GraduatedCircleViz(data,
+                             color_property="Avg Medicare Payments",
+                             color_stops=[[0.0, "red"], [50.0, "gold"], [1000.0, "blue"]],
+                             radius_property="Avg Covered Charges",
+                             radius_stops=[[0.0, 1], [50.0, 10]],
+                             level_of_detail=True,
+                             access_token=TOKEN)
+    assert '"_minzoom": 0' in viz.create_html()
+
+
+@patch('mapboxgl.viz.display')
+def test_update_data_CircleViz(display, data):
+    """Updates post only the new data to displayed maps"""
+    viz = CircleViz(data, access_token=TOKEN, div_id='live')
+    assert 'addEventListener("message"' in viz.create_html()
+
+    viz.update_data({'type': 'FeatureCollection', 'features': data['features'][:1]})
+    script = display.call_args[0][0].data
+    assert 'iframe[id="{}"]'.format(viz.frame_id) in script
+    assert viz.frame_id.startswith('live-')
+    assert '"mode": "replace"' in script
+    assert len(viz.data['features']) == 1
+
+    viz.append(data['features'][1:])
+    script = display.call_args[0][0].data
+    assert '"mode": "append"' in script
+    assert script.count('"Provider Id"') == 2
+    assert len(viz.data['features']) == 3
+
+
+@patch('mapboxgl.viz.display')
+def test_update_data_two_maps(display, data):
+    """Updates reach only the maps of their own viz, whatever the div_id"""
+    first = CircleViz(data, access_token=TOKEN)
+    second = CircleViz(data, access_token=TOKEN)
+    first.show()
+    second.show()
+    frames = [call[0][0].data for call in display.call_args_list]
+    assert first.frame_id != second.frame_id
+    assert 'id="{}"'.format(first.frame_id) in frames[0]
+    assert 'id="{}"'.format(second.frame_id) in frames[1]
+
+    first.update_data({'type': 'FeatureCollection', 'features': data['features'][:1]})
+    script = display.call_args[0][0].data
+    assert 'iframe[id="{}"]'.format(first.frame_id) in script
+    assert second.frame_id not in script
+    assert copy.copy(first).frame_id != first.frame_id
+
+
+@patch('mapboxgl.viz.display')
+def test_append_dataframe_CircleViz(display, data):
+    import pandas as pd
+    viz = CircleViz(data, access_token=TOKEN)
+    viz.append(pd.read_csv('tests/points.csv'))
+    assert len(viz.data['features']) == 6
+    assert len(data['features']) == 3
+
+    # automatic precision follows the viz max_zoom
+    viz = CircleViz(data, access_token=TOKEN, max_zoom=8)
+    df = pd.read_csv('tests/points.csv')
+    viz.append(df, precision='auto')
+    assert viz.data['features'][-1]['geometry']['coordinates'] == [round(df['lon'][2], 3), round(df['lat'][2], 3)]
+
+
+def test_html_progressive_CircleViz(data):
+    """The first chunk is inlined in the source and the rest is added in doubling chunks"""
+    data['features'] = data['features'] * 3
+    viz = CircleViz(data, access_token=TOKEN, progressive_chunk_size=2)
+    html = viz.create_html()
+    source = html[html.index('"data": {"type": "FeatureCollection"'):]
+    assert source[:source.index('"buffer"')].count('"Provider Id"') == 2
+    chunks = html[html.index('var progressiveChunks'):html.index('map.on("load", function loadChunk()')]
+    assert chunks.count('function() { return [') == 2
+    assert chunks.count('"Provider Id"') == 7
+
+
+
+def test_html_CompositeViz(data):
+    """The shared data is embedded once and each layer gets namespaced ids"""
+    viz = CompositeViz(data, [HeatmapViz(None, color_stops=create_color_stops([0, 5, 10])),
+                              CircleViz(None, label_property='Provider Id'),
+                              ClusteredCircleViz(None, color_stops=create_color_stops([1, 5, 10]),
+                                                 radius_stops=[[1, 5], [10, 20]])],
+                       access_token=TOKEN)
+    html = viz.create_html()
+    assert html.count('"Provider Id": ') == len(data['features'])
+    assert '"data": compositeData' in html
+    assert '"id": "heatmap"' in html
+    assert html.count('layerMap(map, "layer') == 3
+    assert 'layerMap(map, "layer2-")' in html
+
+
+def test_CompositeViz_unsupported_layer(data):
+    viz = CompositeViz(data, [CircleViz(None, level_of_detail=True)], access_token=TOKEN)
+    with pytest.raises(SourceDataError):
+        viz.create_html()
+
+
+
+def test_html_GridViz(data, polygon_data):
+    """Cells share one document, one GL JS load and the grid camera"""
+    viz = GridViz([CircleViz(data), ChoroplethViz(polygon_data, color_property='density',
+                                                  color_stops=create_color_stops([0, 50, 100]))],
+                  columns=1, titles=['points', 'polygons'], sync_cameras=True, zoom=5, access_token=TOKEN)
+    html = viz.create_html()
+    assert viz.height == '500px'
+    assert html.count('mapbox-gl.js') == 1
+    assert html.count('new mapboxgl.Map') == 2
+    assert "container: 'map-cell-1'" in html
+    assert html.count('zoom: 5,') == 2
+    assert "<div class='grid-title'>polygons</div>" in html
+    assert 'target.jumpTo' in html
+
+
+def test_GridViz_facet():
+    import pandas as pd
+    df = pd.DataFrame({'lon': [0, 1, 2, 3], 'lat': [0, 1, 2, 3], 'year': [2020, 2019, 2020, 2019]})
+    viz = GridViz.facet(df, 'year', HeatmapViz, viz_options=dict(color_stops=create_color_stops([0, 5, 10])),
+                        access_token=TOKEN)
+    assert viz.titles == ['year = 2019', 'year = 2020']
+    assert [len(v.data['features']) for v in viz.vizzes] == [2, 2]
+    assert viz.create_html().count('"id": "heatmap"') == 2
+
+
 def test_html_LinestringViz(linestring_data):
     viz = LinestringViz(linestring_data,
                         color_property="sample",
@@ -418,9 +617,89 @@ def test_display_ImageVizArray(display, data):
     display.assert_called_once()
 
 
+def test_ImageViz_memmap(tmpdir):
+    """Memory-mapped arrays and .npy files are read decimated"""
+    from PIL import Image
+    from io import BytesIO
+
+    path = str(tmpdir.join('mosaic.npy'))
+    image = numpy.lib.format.open_memmap(path, mode='w+', dtype=numpy.uint8, shape=(4000, 3000, 3))
+    image.flush()
+    coordinates = [[-123.4, 38.5], [-115.9, 38.5], [-115.9, 32.1], [-123.4, 32.1]]
+
+    for source in (image, path):
+        viz = ImageViz(source, coordinates, image_max_pixels=30000, access_token=TOKEN)
+        png = base64.b64decode(viz.image.split(',')[1])
+        assert Image.open(BytesIO(png)).size == (150, 200)
+
+
 @patch('mapboxgl.viz.display')
 def test_display_RasterTileViz(display, data):
     """Assert that show calls the mocked display function
     """
     tiles_url = 'https://a.tile.openstreetmap.org/{z}/{x}/{y}.png'
-    viz = RasterTilesViz(tiles_url, access_token=TOKEN)
\ No newline at end of file
+    viz = RasterTilesViz(tiles_url, access_token=TOKEN)
+
+
+def test_memoized_data_reused(data):
+    """Incremental vizzes reuse serialized data until data is assigned"""
+    viz = CircleViz(data, access_token=TOKEN, incremental=True)
+    html = viz.create_html()
+    with patch('mapboxgl.viz.json.dumps', side_effect=json.dumps) as dumps:
+        viz.opacity = 0.5
+        assert viz.create_html() != html
+        assert not any(args[0] is viz.data for args, _ in dumps.call_args_list)
+
+        viz.data = dict(data, features=data['features'][:2])
+        assert 'Provider Id' in viz.create_html()
+        assert any(args[0] is viz.data for args, _ in dumps.call_args_list)
+
+
+def test_memoized_clusters(data):
+    """Precomputed clusters are rebuilt only when their inputs change"""
+    viz = ClusteredCircleViz(data, access_token=TOKEN, precompute_clusters=True, incremental=True,
+                             color_stops=create_color_stops([1, 10, 20]), radius_stops=[[1, 5], [10, 10], [20, 20]])
+    viz.create_html()
+    with patch('mapboxgl.viz.supercluster', return_value={'type': 'FeatureCollection', 'features': []}) as supercluster:
+        viz.stroke_width = 2
+        viz.zoom = 0.5
+        assert 'Provider Id' in viz.create_html()
+        supercluster.assert_not_called()
+
+        # deferred points are bucketed by their cluster one zoom below the initial zoom
+        viz.zoom = 5
+        viz.clusterRadius = 50
+        assert 'Provider Id' not in viz.create_html()
+        supercluster.assert_called_once()
+
+
+def test_data_edited_in_place(data):
+    """Renders reflect data edited in place, for incremental vizzes once invalidated"""
+    viz = CircleViz(data, access_token=TOKEN)
+    viz.create_html()
+    data['features'][0]['properties']['Provider Id'] = 'edited'
+    assert 'edited' in viz.create_html()
+
+    viz = CircleViz(data, access_token=TOKEN, incremental=True)
+    viz.create_html()
+    data['features'][0]['properties']['Provider Id'] = 'edited again'
+    viz.invalidate('data')
+    assert 'edited again' in viz.create_html()
+
+    data['features'][0]['properties']['Provider Id'] = 'edited once more'
+    viz.invalidate()
+    assert 'edited once more' in viz.create_html()
+
+    # appended features change the fingerprint without invalidate
+    data['features'].append(dict(data['features'][0], properties={'Provider Id': 'appended'}))
+    assert 'appended' in viz.create_html()
+
+
+def test_memo_not_shared_by_copies(data):
+    """Copies of a viz keep their own memo"""
+    viz = CircleViz(data, access_token=TOKEN, incremental=True)
+    viz.create_html()
+    other = copy.copy(viz)
+    other.data = dict(data, features=[])
+    assert 'Provider Id' not in other.create_html()
+    assert 'Provider Id' in viz.create_html()
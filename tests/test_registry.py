@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from mock import patch
+
+from mapboxgl.registry import DataRegistry
+from mapboxgl.viz import CircleViz
+from mapboxgl.utils import create_color_stops
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+@patch('mapboxgl.registry.display')
+def test_register_once(display):
+    """A payload is injected into the page once and referenced by its hash"""
+    registry = DataRegistry()
+    payload = json.dumps({'type': 'FeatureCollection', 'features': []})
+    reference = registry.register(payload)
+    assert registry.register(payload) == reference
+    display.assert_called_once()
+    assert payload in display.call_args[0][0].data
+    assert registry.key(payload) in reference
+    assert reference != registry.register(json.dumps([1, 2]))
+
+
+@patch('mapboxgl.registry.display')
+def test_share_options(display):
+    """Only JSON objects and arrays are shared"""
+    registry = DataRegistry()
+    options = {'geojson_data': '{"type": "FeatureCollection", "features": []}', 'deferredLeaves': 'null',
+               'progressiveChunks': ['[{"type": "Feature"}]', '[]'], 'joinData': 'false'}
+    registry.share(options)
+    assert options['geojson_data'].endswith('"])')
+    assert options['deferredLeaves'] == 'null'
+    assert options['joinData'] == 'false'
+    assert all('mapboxglData' in chunk for chunk in options['progressiveChunks'])
+
+
+@patch('mapboxgl.viz.registry', DataRegistry())
+@patch('mapboxgl.registry.display')
+@patch('mapboxgl.viz.display')
+def test_shared_data_maps(viz_display, registry_display, data):
+    """Maps of the same data inline it once"""
+    for color_property in ('Avg Medicare Payments', 'Avg Covered Charges'):
+        viz = CircleViz(data, color_property=color_property, color_stops=create_color_stops([0, 50, 100]),
+                        access_token='pk.abc123', share_data=True)
+        viz.show()
+
+    assert registry_display.call_count == 1
+    assert viz_display.call_count == 2
+    html = viz_display.call_args[0][0].data
+    assert 'Provider Id' not in html
+    assert 'window.parent.mapboxglData' in html
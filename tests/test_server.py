@@ -0,0 +1,267 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pandas as pd
+import pytest
+import requests
+from mock import Mock, patch
+
+from mapboxgl.assets import AssetCache
+from mapboxgl.server import TileServer, DirectoryTileSource, MBTilesSource, CachingProxySource, ArrayTileSource
+from mapboxgl.tiles import generate_vector_tiles
+from mapboxgl.viz import CircleViz, RasterTilesViz
+
+
+TOKEN = 'pk.abc123'
+
+
+@pytest.fixture()
+def server():
+    server = TileServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture()
+def tiles(tmpdir):
+    directory = str(tmpdir.join('tiles'))
+    generate_vector_tiles(pd.read_csv('tests/points.csv'), directory, layer_name='points', max_zoom=4)
+    return directory
+
+
+@pytest.fixture()
+def origin():
+    """Stand-in upstream tile server that counts requests per tile"""
+    source = SlowTileSource()
+    server = TileServer()
+    server.add_source('origin', source)
+    server.source = source
+    yield server
+    server.stop()
+
+
+class SlowTileSource(object):
+    format = 'png'
+
+    def __init__(self):
+        self.hits = {}
+        self.lock = threading.Lock()
+
+    def get_tile(self, z, x, y):
+        with self.lock:
+            self.hits[(z, x, y)] = self.hits.get((z, x, y), 0) + 1
+        time.sleep(0.2)
+        if z > 3:
+            return None
+        return 'tile {} {} {}'.format(z, x, y).encode() * 10, {'Content-Type': 'image/png'}
+
+    def tilejson(self):
+        return {}
+
+
+def make_mbtiles(path, tile_format, tiles):
+    """Write a minimal MBTiles archive with tiles keyed by XYZ (z, x, y)"""
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE metadata (name text, value text)')
+    connection.execute('CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)')
+    metadata = {'name': 'test', 'format': tile_format, 'minzoom': '0', 'maxzoom': '2',
+                'bounds': '-180,-85,180,85', 'json': json.dumps({'vector_layers': [{'id': 'points'}]})}
+    connection.executemany('INSERT INTO metadata VALUES (?, ?)', metadata.items())
+    for (z, x, y), data in tiles.items():
+        connection.execute('INSERT INTO tiles VALUES (?, ?, ?, ?)', (z, x, 2 ** z - 1 - y, data))
+    connection.commit()
+    connection.close()
+    return path
+
+
+def test_tilejson(server, tiles):
+    """TileJSON points at the server's tile endpoint"""
+    url = server.add_source('points', DirectoryTileSource(tiles))
+    tilejson = requests.get(url).json()
+    assert tilejson['tiles'] == [server.url + '/points/{z}/{x}/{y}.pbf']
+    assert tilejson['vector_layers'][0]['id'] == 'points'
+    assert tilejson['maxzoom'] == 4
+
+
+def test_serve_tile(server, tiles):
+    """Existing tiles are served, missing tiles are empty"""
+    server.add_source('points', DirectoryTileSource(tiles))
+    response = requests.get(server.url + '/points/0/0/0.pbf')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/x-protobuf'
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+    assert b'points' in response.content
+    assert requests.get(server.url + '/points/4/0/0.pbf').status_code == 204
+    assert requests.get(server.url + '/missing/0/0/0.pbf').status_code == 404
+
+
+def test_vector_viz(server, tiles):
+    """Local tiles plug into the vector templates"""
+    url = server.add_source('points', DirectoryTileSource(tiles))
+    viz = CircleViz([],
+                    vector_url=url,
+                    vector_layer_name='points',
+                    disable_data_join=True,
+                    access_token=TOKEN)
+    html = viz.create_html()
+    assert url in html
+
+
+def test_mbtiles_vector(server, tmpdir):
+    """Gzipped vector tiles pass through with their encoding and TileJSON metadata"""
+    path = make_mbtiles(str(tmpdir.join('vector.mbtiles')), 'pbf', {(1, 0, 1): gzip.compress(b'tile-data')})
+    url = server.add_source('vector', MBTilesSource(path))
+    tilejson = requests.get(url).json()
+    assert tilejson['vector_layers'] == [{'id': 'points'}]
+    assert tilejson['bounds'] == [-180, -85, 180, 85]
+
+    response = requests.get(server.url + '/vector/1/0/1.pbf')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.content == b'tile-data'
+    assert requests.get(server.url + '/vector/1/0/0.pbf').status_code == 204
+
+
+def test_mbtiles_etag(server, tmpdir):
+    """Unchanged tiles are revalidated with an ETag"""
+    path = make_mbtiles(str(tmpdir.join('raster.mbtiles')), 'png', {(0, 0, 0): b'png-data'})
+    server.add_source('raster', MBTilesSource(path))
+    response = requests.get(server.url + '/raster/0/0/0.png')
+    assert response.headers['Content-Type'] == 'image/png'
+    etag = response.headers['ETag']
+    response = requests.get(server.url + '/raster/0/0/0.png', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_mbtiles_path_characters(tmpdir):
+    """Paths with URI characters open the named archive"""
+    make_mbtiles(str(tmpdir.join('tiles')), 'png', {(0, 0, 0): b'other'})
+    path = make_mbtiles(str(tmpdir.join('tiles?mode=rw#100%.mbtiles')), 'png', {(0, 0, 0): b'png-data'})
+    assert MBTilesSource(path).get_tile(0, 0, 0)[0] == b'png-data'
+
+
+def test_mbtiles_pooled_reads(server, tmpdir):
+    """Concurrent requests share the pooled connections"""
+    tiles = {(2, x, y): 'tile {} {}'.format(x, y).encode() for x in range(4) for y in range(4)}
+    path = make_mbtiles(str(tmpdir.join('raster.mbtiles')), 'png', tiles)
+    server.add_source('raster', MBTilesSource(path, pool_size=2))
+
+    def fetch(key):
+        return requests.get(server.url + '/raster/2/{}/{}.png'.format(*key[1:])).content
+
+    with ThreadPoolExecutor(8) as executor:
+        assert list(executor.map(fetch, tiles)) == list(tiles.values())
+
+
+def test_mbtiles_raster_viz(server, tmpdir):
+    """Tile url template plugs into RasterTilesViz"""
+    path = make_mbtiles(str(tmpdir.join('raster.mbtiles')), 'png', {(0, 0, 0): b'png-data'})
+    server.add_source('raster', MBTilesSource(path))
+    viz = RasterTilesViz(server.tiles_url('raster'), access_token=TOKEN)
+    assert server.url + '/raster/{z}/{x}/{y}.png' in viz.create_html()
+
+
+def test_proxy_caches_tiles(origin, tmpdir):
+    """Tiles are fetched from upstream once and then served from disk"""
+    proxy = CachingProxySource(origin.tiles_url('origin'), cache_dir=str(tmpdir))
+    assert proxy.get_tile(1, 0, 1)[0] == b'tile 1 0 1' * 10
+    assert proxy.get_tile(1, 0, 1)[0] == b'tile 1 0 1' * 10
+    assert origin.source.hits[(1, 0, 1)] == 1
+    assert os.path.exists(str(tmpdir.join('1', '0', '1.tile')))
+    assert proxy.get_tile(4, 0, 0) is None
+
+    # a new proxy reuses the tiles cached on disk
+    proxy = CachingProxySource(origin.tiles_url('origin'), cache_dir=str(tmpdir))
+    proxy.get_tile(1, 0, 1)
+    assert origin.source.hits[(1, 0, 1)] == 1
+
+
+def test_proxy_content_type(tmpdir):
+    """Tiles keep the upstream Content-Type, also for urls without an extension"""
+    response = Mock(status_code=200, content=b'webp-data', headers={'Content-Type': 'image/webp'})
+    for _ in range(2):
+        proxy = CachingProxySource('https://tiles.example.com/{z}/{x}/{y}?style=satellite', cache_dir=str(tmpdir))
+        with patch.object(proxy.session, 'get', return_value=response) as get:
+            assert proxy.get_tile(1, 0, 1) == (b'webp-data', {'Content-Type': 'image/webp'})
+    get.assert_not_called()
+
+
+def test_proxy_coalesces_requests(origin, tmpdir):
+    """Concurrent requests for one uncached tile share one upstream fetch"""
+    proxy = CachingProxySource(origin.tiles_url('origin'), cache_dir=str(tmpdir))
+    with ThreadPoolExecutor(8) as executor:
+        tiles = list(executor.map(lambda _: proxy.get_tile(2, 1, 1), range(8)))
+    assert all(tile[0] == b'tile 2 1 1' * 10 for tile in tiles)
+    assert origin.source.hits[(2, 1, 1)] == 1
+    assert proxy.upstream_requests == 1
+
+
+def test_proxy_lru_eviction(origin, tmpdir):
+    """Least recently used tiles are evicted past the cache size limit"""
+    proxy = CachingProxySource(origin.tiles_url('origin'), cache_dir=str(tmpdir), max_cache_size=250)
+    for x in range(3):
+        proxy.get_tile(2, x, 0)
+    proxy.get_tile(2, 0, 0)
+    proxy.get_tile(2, 3, 0)
+    assert proxy.files.size <= 250
+    assert os.path.exists(str(tmpdir.join('2', '0', '0.tile')))
+    assert not os.path.exists(str(tmpdir.join('2', '1', '0.tile')))
+
+
+def test_proxy_raster_viz(server, origin, tmpdir):
+    """RasterTilesViz rewrites tiles_url to go through the proxy"""
+    local_url = server.add_proxy(origin.tiles_url('origin'), cache_dir=str(tmpdir))
+    viz = RasterTilesViz(origin.tiles_url('origin'), tiles_proxy=server, access_token=TOKEN)
+    assert viz.tiles_url == local_url
+    response = requests.get(viz.tiles_url.format(z=0, x=0, y=0))
+    assert response.content == b'tile 0 0 0' * 10
+    requests.get(viz.tiles_url.format(z=0, x=0, y=0))
+    assert origin.source.hits[(0, 0, 0)] == 1
+
+
+def test_array_tiles(server, tmpdir):
+    """Tiles are cut lazily from a memory-mapped array and cached"""
+    path = str(tmpdir.join('raster.dat'))
+    array = numpy.memmap(path, dtype=numpy.float32, mode='w+', shape=(512, 1024))
+    array[:] = numpy.linspace(0, 1, 1024)
+    source = ArrayTileSource(array, (-20, 30, 20, 50))
+    assert (source.vmin, source.vmax) == (0, 1)
+    assert source.max_zoom == 6
+
+    server.add_source('array', source)
+    viz = RasterTilesViz(server.tiles_url('array'), tiles_bounds=source.bounds,
+                         tiles_maxzoom=source.max_zoom, access_token=TOKEN)
+    assert server.url + '/array/{z}/{x}/{y}.png' in viz.create_html()
+
+    response = requests.get(server.url + '/array/3/3/2.png')
+    assert response.content.startswith(b'\x89PNG')
+    assert list(source.cache) == [(3, 3, 2)]
+    assert requests.get(server.url + '/array/3/0/0.png').status_code == 204
+    assert requests.get(server.url + '/array/7/0/0.png').status_code == 204
+
+
+def test_serve_assets(tmpdir):
+    """GL JS files are served from the asset cache under versioned urls"""
+    cache = AssetCache(str(tmpdir))
+    os.makedirs(os.path.dirname(cache.path('mapbox-gl.js', 'v1.5.0')))
+    with open(cache.path('mapbox-gl.js', 'v1.5.0'), 'w') as f:
+        f.write('var mapboxgl = {};')
+
+    server = TileServer(asset_cache=cache)
+    try:
+        url = server.asset_url('mapbox-gl.js', 'v1.5.0')
+        response = requests.get(url)
+        assert response.status_code == 200
+        assert response.text == 'var mapboxgl = {};'
+        assert response.headers['Content-Type'].startswith('application/javascript')
+        assert requests.get(url.replace('mapbox-gl.js', 'other.js')).status_code == 404
+
+        viz = CircleViz({'type': 'FeatureCollection', 'features': []}, access_token=TOKEN, assets=server)
+        assert "src='{}'".format(url) in viz.create_html()
+    finally:
+        server.stop()
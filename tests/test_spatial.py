@@ -0,0 +1,94 @@
+import json
+
+import numpy
+import pytest
+
+from mapboxgl.errors import SourceDataError
+from mapboxgl.spatial import SpatialIndex, feature_bounds, fit_bounds
+from mapboxgl.viz import CircleViz, ChoroplethViz
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+@pytest.fixture()
+def polygon_data():
+    with open('tests/polygons.geojson') as fh:
+        return json.loads(fh.read())
+
+
+def random_features(n, seed=0):
+    rng = numpy.random.RandomState(seed)
+    lon, lat = rng.uniform(-180, 180, n), rng.uniform(-80, 80, n)
+    features = [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [x, y]}, 'properties': {}}
+                for x, y in zip(lon, lat)]
+    return features, lon, lat
+
+
+def test_query_bbox():
+    """Box queries match a brute force scan"""
+    features, lon, lat = random_features(20000)
+    index = SpatialIndex(features)
+    for west, south, east, north in [(-10, -10, 10, 10), (100, 40, 100.5, 41), (-180, -90, 180, 90), (0, 85, 1, 89)]:
+        expected = numpy.flatnonzero((lon >= west) & (lon <= east) & (lat >= south) & (lat <= north))
+        assert numpy.array_equal(index.query_bbox(west, south, east, north), expected)
+
+
+def test_query_radius():
+    """Radius queries keep points within the great-circle distance"""
+    features, lon, lat = random_features(20000)
+    index = SpatialIndex(features)
+    hits = index.query_radius(10, 45, 500000)
+    assert len(hits) > 0
+    for i in hits:
+        assert abs(lat[i] - 45) < 4.6
+    # a point 4 degrees of latitude north (~445 km) is inside, 5 degrees (~556 km) is not
+    index = SpatialIndex([{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': c}}
+                          for c in ([10, 49], [10, 50])])
+    assert index.query_radius(10, 45, 500000).tolist() == [0]
+
+
+def test_feature_bounds(polygon_data):
+    west, south, east, north = feature_bounds(polygon_data['features'])
+    assert (west < east).all() and (south < north).all()
+    index = SpatialIndex.from_geojson(polygon_data)
+    assert index.bounds == (west.min(), south.min(), east.max(), north.max())
+
+    with pytest.raises(SourceDataError):
+        SpatialIndex.from_geojson(polygon_data['features'])
+
+
+def test_fit_bounds():
+    center, zoom = fit_bounds((-123, 37, -122, 38), width=800, height=500, padding=0)
+    assert center[0] == pytest.approx(-122.5)
+    assert 37 < center[1] < 38
+    assert zoom == pytest.approx(8.12, abs=0.01)
+
+
+def test_viz_fit_to_data(data):
+    viz = CircleViz(data, access_token='pk.abc123', height='400px')
+    viz.fit_to_data()
+    west, south, east, north = viz.index.bounds
+    assert west < viz.center[0] < east and south < viz.center[1] < north
+    assert viz.zoom > 0
+
+
+def test_viz_within_bbox(data):
+    viz = CircleViz(data, access_token='pk.abc123')
+    pruned = viz.within_bbox(-90, 31, -86, 32)
+    assert pruned is not viz and viz.data is data
+    assert 0 < len(pruned.data['features']) < len(data['features'])
+    for feature in pruned.data['features']:
+        lon, lat = feature['geometry']['coordinates']
+        assert -90 <= lon <= -86 and 31 <= lat <= 32
+    assert len(pruned.index) == len(pruned.data['features'])
+    assert '<html>' in pruned.create_html()
+
+
+def test_viz_within_radius(polygon_data):
+    viz = ChoroplethViz(polygon_data, access_token='pk.abc123')
+    center = viz.index.bounds[0] / 2 + viz.index.bounds[2] / 2, viz.index.bounds[1] / 2 + viz.index.bounds[3] / 2
+    assert len(viz.within_radius(center[0], center[1], 1e7).data['features']) == len(polygon_data['features'])
@@ -0,0 +1,58 @@
+import asyncio
+
+from mock import patch
+
+from mapboxgl.stream import PointStream, stream
+from mapboxgl.viz import CircleViz
+
+
+def point(i):
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [i % 180, 0]}, 'properties': {'i': i}}
+
+
+async def feed(batches, delay=0):
+    for batch in batches:
+        yield batch
+        await asyncio.sleep(delay)
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+@patch('mapboxgl.viz.display')
+def test_stream_coalesces(display):
+    """A burst of batches is sent in few updates"""
+    viz = CircleViz({'type': 'FeatureCollection', 'features': []}, access_token='pk.abc123')
+    result = run(stream(viz, feed([[point(i)] for i in range(200)]), max_fps=5))
+    assert result.received == 200
+    assert result.frames <= 3
+    assert display.call_count == result.frames
+    assert len(viz.data['features']) == 200
+
+
+@patch('mapboxgl.viz.display')
+def test_stream_frame_rate(display):
+    """Updates are paced to the maximum frame rate"""
+    viz = CircleViz({'type': 'FeatureCollection', 'features': []}, access_token='pk.abc123')
+    result = run(stream(viz, feed([[point(i)] for i in range(30)], delay=0.01), max_fps=10))
+    assert 2 <= result.frames <= 6
+    assert len(viz.data['features']) == 30
+
+
+@patch('mapboxgl.viz.display')
+def test_stream_ring_buffer(display):
+    """Only the most recent points are kept"""
+    viz = CircleViz({'type': 'FeatureCollection', 'features': []}, access_token='pk.abc123')
+    run(stream(viz, feed([[point(i) for i in range(j, j + 10)] for j in range(0, 100, 10)], delay=0.01),
+               max_fps=50, max_features=25))
+    assert [f['properties']['i'] for f in viz.data['features']] == list(range(75, 100))
+    assert '"maxFeatures": 25' in display.call_args[0][0].data
+
+
+@patch('mapboxgl.viz.display')
+def test_point_stream_flush(display):
+    viz = CircleViz({'type': 'FeatureCollection', 'features': []}, access_token='pk.abc123')
+    point_stream = PointStream(viz)
+    point_stream.flush()
+    assert display.call_count == 0
@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy
+import pandas as pd
+import pytest
+
+from mapboxgl.errors import SourceDataError
+from mapboxgl.tiles import (generate_vector_tiles, encode_vector_tile, lonlat_to_tile, tile_bounds,
+                            array_tile, native_zoom, lonlat_to_world, _point_tiles, POINT)
+
+
+@pytest.fixture()
+def df():
+    return pd.read_csv('tests/points.csv')
+
+
+@pytest.fixture()
+def polygon_data():
+    with open('tests/polygons.geojson') as fh:
+        return json.loads(fh.read())
+
+
+def test_lonlat_to_tile():
+    """Tile index for a point"""
+    assert lonlat_to_tile(0, 0, 0) == (0, 0)
+    assert lonlat_to_tile(-122.4, 37.8, 10) == (163, 395)
+
+
+def test_tile_bounds():
+    """Bounds of the world tile and a quadrant"""
+    west, south, east, north = tile_bounds(0, 0, 0)
+    assert (west, east) == (-180, 180)
+    assert round(north, 4) == 85.0511
+    assert tile_bounds(1, 1, 0)[:2] == (0, 0)
+
+
+def test_encode_vector_tile():
+    """Tile contains layer name, keys and string values"""
+    tile = encode_vector_tile({'points': [(POINT, [(10, 20)], {'name': 'a', 'value': 1.5}, 0)]})
+    assert b'points' in tile
+    assert b'name' in tile
+    assert tile.startswith(b'\x1a')
+
+
+def test_generate_vector_tiles_df(tmpdir, df):
+    """Point tiles are written in z/x/y layout"""
+    directory = str(tmpdir.join('tiles'))
+    metadata = generate_vector_tiles(df, directory, layer_name='points', max_zoom=4)
+    assert metadata['tile_count'] >= 5
+    assert metadata['vector_layers'][0]['id'] == 'points'
+    assert os.path.exists(os.path.join(directory, '0', '0', '0.pbf'))
+    x, y = lonlat_to_tile(df['lon'][0], df['lat'][0], 4)
+    assert os.path.exists(os.path.join(directory, '4', str(x), '{}.pbf'.format(y)))
+
+
+def test_generate_vector_tiles_cached(tmpdir, df):
+    """Tiles are reused when the inputs have not changed"""
+    directory = str(tmpdir.join('tiles'))
+    generate_vector_tiles(df, directory, max_zoom=2)
+    path = os.path.join(directory, '0', '0', '0.pbf')
+    os.remove(path)
+    generate_vector_tiles(df, directory, max_zoom=2)
+    assert not os.path.exists(path)
+    generate_vector_tiles(df, directory, max_zoom=2, overwrite=True)
+    assert os.path.exists(path)
+
+
+def test_generate_vector_tiles_polygons(tmpdir, polygon_data):
+    """Polygons are clipped into every tile they overlap"""
+    metadata = generate_vector_tiles(polygon_data, str(tmpdir), max_zoom=3)
+    assert metadata['tile_count'] > 4
+    assert round(metadata['bounds'][0], 3) == -124.411
+
+
+def test_point_tiles():
+    """Points go to their tile and to neighbors whose buffer they lie in, and
+    low zoom tiles keep the first point of each cell"""
+    x, y = lonlat_to_world([0.001, 0.001, 90], [10, 10, 10])
+    points = dict(x=x, y=y, ids=numpy.arange(3))
+    tiles = _point_tiles(points, 1, 4096, 64)
+    assert sorted(tiles) == [(0, 0), (1, 0)]
+    assert tiles[(0, 0)][0].tolist() == [0, 1]
+    assert tiles[(1, 0)][0].tolist() == [0, 1, 2]
+    assert tiles[(1, 0)][1].tolist()[:2] == [0, 0]
+
+    thinned = _point_tiles(points, 1, 4096, 64, cell=16)
+    assert thinned[(0, 0)][0].tolist() == [0]
+    assert thinned[(1, 0)][0].tolist() == [0, 2]
+
+
+def test_generate_vector_tiles_invalid(tmpdir):
+    """Raise SourceDataError for unsupported geometry types"""
+    data = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'GeometryCollection', 'coordinates': []}}]}
+    with pytest.raises(SourceDataError):
+        generate_vector_tiles(data, str(tmpdir))
+
+
+def test_array_tile():
+    """Tile pixels sample the array cell under each pixel center"""
+    array = numpy.arange(4, dtype=numpy.uint8).reshape(2, 2)
+    tile, mask = array_tile(array, (-180, -85.0511, 180, 85.0511), 0, 0, 0, tile_size=4)
+    assert mask.all()
+    assert tile[0].tolist() == [0, 0, 1, 1]
+    assert tile[-1].tolist() == [2, 2, 3, 3]
+
+
+def test_array_tile_outside_bounds():
+    """Tiles outside the array bounds are skipped; partial tiles are masked"""
+    array = numpy.ones((10, 10))
+    assert array_tile(array, (0, 0, 10, 10), 1, 0, 0) is None
+    tile, mask = array_tile(array, (0, 0, 10, 10), 1, 1, 0)
+    assert 0 < mask.sum() < mask.size
+
+
+def test_native_zoom():
+    """Pyramid depth follows array resolution"""
+    assert native_zoom(numpy.zeros((256, 512)), (-180, -85.0511, 180, 85.0511)) == 1
+    assert native_zoom(numpy.zeros((1000, 1000)), (-1, -1, 1, 1)) == 10
@@ -10,8 +10,8 @@ from matplotlib.pyplot import imread
 from mapboxgl.errors import SourceDataError, DateConversionError
 from mapboxgl.utils import (df_to_geojson, geojson_to_dict_list, scale_between, create_radius_stops,
                             create_weight_stops, create_numeric_stops, create_color_stops, 
-                            img_encode, rgb_tuple_from_str, color_map, height_map, numeric_map,
-                            convert_date_columns)
+                            img_encode, img_bytes, read_window, rgb_tuple_from_str, color_map, height_map, numeric_map,
+                            convert_date_columns, geojson_to_topojson, precision_for_zoom)
 
 
 @pytest.fixture()
@@ -57,6 +57,33 @@ def test_df_geojson_file_nonsequential_index(df):
     assert len(testdata['features']) == 3
 
 
+def test_precision_for_zoom():
+    assert precision_for_zoom(0) == 1
+    assert precision_for_zoom(14) == 5
+    assert precision_for_zoom(22) == 8
+
+
+def test_df_geojson_auto_precision(df):
+    features = df_to_geojson(df, precision='auto', max_zoom=8)['features']
+    assert features[0]['geometry']['coordinates'] == [round(df['lon'][0], 3), round(df['lat'][0], 3)]
+
+    with pytest.raises(ValueError):
+        df_to_geojson(df, precision='auto')
+
+
+def test_df_geojson_collapse_duplicates():
+    df = pd.DataFrame({'lon': [-122.41941, -122.41942, -122.41942, -122.5],
+                       'lat': [37.77492, 37.77491, 37.77491, 37.7],
+                       'kind': ['a', 'a', 'b', 'a']})
+    features = df_to_geojson(df, precision='auto', max_zoom=10, collapse_duplicates=True)['features']
+    assert [f['properties'] for f in features] == [
+        {'kind': 'a', 'weight': 2}, {'kind': 'b', 'weight': 1}, {'kind': 'a', 'weight': 1}]
+    assert features[0]['geometry']['coordinates'] == [-122.4194, 37.7749]
+
+    with pytest.raises(ValueError):
+        df_to_geojson(df, collapse_duplicates=True, weight_property='kind')
+
+
 def test_scale_between():
     scale = scale_between(0, 1, 4)
     assert scale == [0.0, 0.25, 0.5, 0.75]
@@ -115,6 +142,44 @@ def test_img_encode():
     assert img_encode(image).startswith('data:image/png;base64')
 
 
+def test_img_bytes_uint8():
+    """uint8 RGB arrays are written directly in the requested format"""
+    image = numpy.zeros((20, 30, 3), dtype=numpy.uint8)
+    assert img_bytes(image).startswith(b'\x89PNG')
+    assert img_bytes(image, format='jpeg').startswith(b'\xff\xd8')
+    assert img_bytes(image, format='webp')[8:12] == b'WEBP'
+    assert img_encode(image, format='jpg').startswith('data:image/jpeg;base64')
+
+
+def test_img_bytes_compress_level():
+    """Higher PNG compression levels produce smaller images"""
+    image = numpy.tile(numpy.arange(256, dtype=numpy.uint8), (256, 1))
+    image = numpy.stack([image, image.T, image], axis=-1)
+    assert len(img_bytes(image, compress_level=9)) < len(img_bytes(image, compress_level=0))
+
+
+def test_img_bytes_max_pixels():
+    """Images are downscaled to the pixel budget"""
+    from PIL import Image
+    from io import BytesIO
+    image = numpy.zeros((1000, 800, 4), dtype=numpy.uint8)
+    width, height = Image.open(BytesIO(img_bytes(image, max_pixels=10000))).size
+    assert (width, height) == (89, 112)
+    assert width * height <= 10000
+
+
+def test_read_window(tmpdir):
+    """Windowed, decimated reads from a memory-mapped array"""
+    path = str(tmpdir.join('image.dat'))
+    image = numpy.memmap(path, dtype=numpy.uint8, mode='w+', shape=(1000, 2000, 3))
+    image[:, :, 0] = numpy.arange(2000) % 256
+    window = read_window(image, max_pixels=5000)
+    assert type(window) is numpy.ndarray
+    assert window.shape == (50, 100, 3)
+    assert window[0, 1, 0] == 20
+    assert read_window(image, (100, 200, 0, 400), max_pixels=625).shape == (13, 50, 3)
+
+
 def test_rgb_tuple_from_str():
     """Extract RGB values as tuple from string RGB color representation"""
     assert rgb_tuple_from_str('rgb(122,43,17)') == (122, 43, 17)
@@ -282,3 +347,69 @@ def test_convert_date_columns_error(df):
     with pytest.raises(DateConversionError):
         convert_date_columns(df, date_format='')
 
+
+
+def _decode_topojson(topology, name='data'):
+    """Decode TopoJSON rings back to absolute coordinates (mirrors the template decoder)"""
+    (kx, ky), (x0, y0) = topology['transform']['scale'], topology['transform']['translate']
+    arcs = []
+    for arc in topology['arcs']:
+        x = y = 0
+        positions = []
+        for dx, dy in arc:
+            x += dx
+            y += dy
+            positions.append((x * kx + x0, y * ky + y0))
+        arcs.append(positions)
+
+    def ring(indices):
+        coordinates = []
+        for i in indices:
+            arc = arcs[~i][::-1] if i < 0 else arcs[i]
+            coordinates.extend(arc[1:] if coordinates else arc)
+        return coordinates
+
+    return [[ring(r) for r in g['arcs']] for g in topology['objects'][name]['geometries']]
+
+
+def test_geojson_to_topojson_shared_border():
+    """Border shared by adjacent polygons is encoded once"""
+    left = [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]
+    right = [[[1, 0], [2, 0], [2, 1], [1, 1], [1, 0]]]
+    data = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': 1, 'properties': {'a': 1}, 'geometry': {'type': 'Polygon', 'coordinates': left}},
+        {'type': 'Feature', 'id': 2, 'properties': {'a': 2}, 'geometry': {'type': 'Polygon', 'coordinates': right}}]}
+    topology = geojson_to_topojson(data)
+    assert topology['type'] == 'Topology'
+    assert len(topology['arcs']) == 3
+
+    geometries = topology['objects']['data']['geometries']
+    assert [g['id'] for g in geometries] == [1, 2]
+    assert geometries[1]['properties'] == {'a': 2}
+
+    # shared arc is referenced forwards by one polygon and reversed by the other
+    shared = set(abs(~i if i < 0 else i) for i in geometries[0]['arcs'][0]) & \
+        set(abs(~i if i < 0 else i) for i in geometries[1]['arcs'][0])
+    assert len(shared) == 1
+
+
+def test_geojson_to_topojson_roundtrip():
+    """Decoded TopoJSON rings match the source polygons within quantization error"""
+    with open('tests/polygons.geojson') as f:
+        data = json.load(f)
+    topology = geojson_to_topojson(data, quantization=1e6)
+    decoded = _decode_topojson(topology)
+    for feature, rings in zip(data['features'], decoded):
+        source = feature['geometry']['coordinates']
+        if feature['geometry']['type'] == 'MultiPolygon':
+            source = source[0]
+            rings = rings[0]
+        assert len(rings[0]) == len(source[0])
+        for x, y in rings[0]:
+            assert min(abs(x - sx) + abs(y - sy) for sx, sy in source[0]) < 1e-4
+
+
+def test_geojson_to_topojson_invalid_geometry(df):
+    """Raise SourceDataError for non-polygon features"""
+    with pytest.raises(SourceDataError):
+        geojson_to_topojson(df_to_geojson(df))
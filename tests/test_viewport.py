@@ -0,0 +1,81 @@
+import numpy
+import pandas as pd
+import pytest
+
+from mock import patch, MagicMock
+
+from mapboxgl.viewport import ViewportSource
+from mapboxgl.viz import CircleViz
+
+
+@pytest.fixture()
+def df():
+    rng = numpy.random.RandomState(0)
+    return pd.DataFrame({'lon': rng.uniform(-10, 10, 50000),
+                         'lat': rng.uniform(-10, 10, 50000),
+                         'value': rng.rand(50000),
+                         'time': pd.date_range('2020-01-01', periods=50000, freq='min')})
+
+
+class RecordingComm(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+def test_query_viewport(df):
+    """Only points in view are returned, with their properties"""
+    source = ViewportSource(df, properties=['value', 'time'])
+    data = source.query((0, 0, 1, 1), 12)
+    expected = df[(df.lon >= 0) & (df.lon <= 1) & (df.lat >= 0) & (df.lat <= 1)]
+    assert len(data['features']) == len(expected)
+    feature = data['features'][0]
+    assert 0 <= feature['geometry']['coordinates'][0] <= 1
+    assert sorted(feature['properties'].keys()) == ['time', 'value']
+    assert feature['properties']['time'] == 1577836800 + 60 * expected.index[0]
+
+
+def test_query_viewport_thinned(df):
+    """Dense viewports are thinned to at most max_features"""
+    source = ViewportSource(df, max_features=1000, cell_size=16)
+    data = source.query((-10, -10, 10, 10), 2)
+    assert len(data['features']) <= 1000
+    coordinates = set(tuple(f['geometry']['coordinates']) for f in data['features'])
+    assert len(coordinates) == len(data['features'])
+
+
+def test_viewport_message(df):
+    """Requests are answered with their id and the features in view"""
+    source = ViewportSource(df)
+    comm = RecordingComm()
+    source.handle_message(comm, {'content': {'data': {'id': 3, 'bounds': [0, 0, 0.5, 0.5], 'zoom': 10}}})
+    assert comm.sent[0]['id'] == 3
+    assert len(comm.sent[0]['data']['features']) > 0
+
+
+def test_viewport_register(df):
+    """The comm target is registered once with the kernel"""
+    source = ViewportSource(df)
+    assert source.register() is None
+
+    shell = MagicMock()
+    with patch('IPython.get_ipython', return_value=shell):
+        target = source.register()
+        assert source.register() == target
+    shell.kernel.comm_manager.register_target.assert_called_once()
+    assert target.startswith('mapboxgl-viewport-')
+
+
+def test_viewport_viz(df):
+    source = ViewportSource(df)
+    source.target_name = 'mapboxgl-viewport-test'
+    viz = CircleViz(source, access_token='pk.abc123')
+    assert viz.viewport_source is source
+    html = viz.create_html()
+    assert 'new_comm("mapboxgl-viewport-test"' in html
+    assert '{"type": "FeatureCollection", "features": []}' in html
+    assert 'new_comm' not in CircleViz({'type': 'FeatureCollection', 'features': []},
+                                       access_token='pk.abc123').create_html()